@@ -0,0 +1,288 @@
+from array import array
+from collections import deque
+from DOMNode import DOMNodeBase
+from DOMTree import DOMTree
+from html_parsers import DEFAULT_HTML_PARSER
+from NodeIndex import FULL_MODE, NodeIndex
+
+# The index used for a missing parent, child or sibling.
+NO_NODE = -1
+
+class CompactDOMNode(DOMNodeBase):
+    '''
+    A lightweight view of a node of a CompactDOMTree. It has the same API
+    as DOMNode.
+
+    The attributes dict is shared by all the nodes with the same attributes,
+    so it must not be modified.
+    '''
+    __slots__ = [ '_tree', '_index' ]
+
+    def __init__(self, tree, index):
+        self._tree = tree
+        self._index = index
+
+    @property
+    def id(self):
+        return self._tree._node_ids[self._index]
+
+    @property
+    def type(self):
+        return self._tree._types[self._tree._type_ids[self._index]]
+
+    @property
+    def value(self):
+        return self._tree._values[self._tree._value_ids[self._index]]
+
+    @property
+    def attributes(self):
+        return self._tree._attribute_sets[self._tree._attribute_set_ids[self._index]]
+
+    @property
+    def parent_id(self):
+        return self._tree._parent_ids[self._index]
+
+    @property
+    def signature_id(self):
+        return self._tree._signature_ids[self._index]
+
+    @property
+    def key(self):
+        return self._tree._keys[self._index]
+
+    @property
+    def structure_key(self):
+        return self._tree._structure_keys[self._index]
+
+    @property
+    def attributes_key(self):
+        return self._tree._attributes_keys[self._index]
+
+
+class CompactDOMTree(object):
+    '''
+    Represents a DOM tree in a struct-of-arrays form. The nodes are stored in
+    the breadth-first order in arrays of ints, and the types, values and
+    attribute sets are interned per tree. The nodes are handed out as
+    CompactDOMNode views, so the tree can be used in place of a DOMTree.
+    '''
+    def __init__(self, dom, for_hdp=False, html_parser=DEFAULT_HTML_PARSER):
+        '''
+        Initializes the DOM tree.
+        Params:
+            dom: a DOMTree, or anything that DOMTree accepts.
+        '''
+        if not isinstance(dom, DOMTree):
+            dom = DOMTree(dom, for_hdp, html_parser)
+
+        # Per node arrays, indexed by the position in the breadth-first order.
+        self._node_ids = array('l')
+        self._parent_ids = array('l')
+        self._parents = array('l')
+        self._first_children = array('l')
+        self._next_siblings = array('l')
+        self._type_ids = array('l')
+        self._value_ids = array('l')
+        self._attribute_set_ids = array('l')
+        self._signature_ids = array('l')
+        self._keys = array('l')
+        self._structure_keys = array('l')
+        self._attributes_keys = array('l')
+
+        # Interned tables.
+        self._types = []
+        self._values = []
+        self._attribute_sets = []
+        self._interned_ids = {}
+
+        self._index_of_id = {}
+        self._node_indexes = {}
+        self.size = dom.size
+        self.root_node = None
+        if dom.root_node is not None:
+            self.BuildArrays(dom)
+            self.root_node = self.GetNode(0)
+
+        self.children = deque([ self.root_node ])
+        self.ComputeSubtreeHashes()
+
+
+    def BuildArrays(self, dom):
+        '''
+        Populates the arrays from the nodes of the DOMTree.
+        '''
+        # The parent index of each node in the breadth-first order. Each node
+        # is appended when it is visited, so the index of a node is its
+        # position in the breadth-first order.
+        queue = deque([ (dom.root_node, NO_NODE) ])
+        last_child = {}
+        while len(queue) > 0:
+            node, parent_index = queue.popleft()
+            index = len(self._node_ids)
+            self._node_ids.append(node.id)
+            self._parent_ids.append(node.parent_id)
+            self._parents.append(parent_index)
+            self._first_children.append(NO_NODE)
+            self._next_siblings.append(NO_NODE)
+            self._type_ids.append(self.Intern(self._types, ('type', node.type), node.type))
+            self._value_ids.append(self.Intern(self._values, ('value', node.value), node.value))
+            attribute_set = frozenset(node.attributes.iteritems())
+            self._attribute_set_ids.append(self.Intern(self._attribute_sets, ('attributes', attribute_set), node.attributes))
+            self._signature_ids.append(node.signature_id)
+            self._keys.append(node.key)
+            self._structure_keys.append(node.structure_key)
+            self._attributes_keys.append(node.attributes_key)
+            self._index_of_id[node.id] = index
+
+            # Link the node to its parent.
+            if parent_index != NO_NODE:
+                if parent_index in last_child:
+                    self._next_siblings[last_child[parent_index]] = index
+                else:
+                    self._first_children[parent_index] = index
+                last_child[parent_index] = index
+
+            for child in dom.GetChildren(node.id):
+                queue.append((child, index))
+
+
+    def Intern(self, table, key, value):
+        '''
+        Returns the id of value in table, adding it when it is not there.
+        '''
+        interned_id = self._interned_ids.get(key)
+        if interned_id is None:
+            interned_id = len(table)
+            table.append(value)
+            self._interned_ids[key] = interned_id
+        return interned_id
+
+
+    def GetNode(self, index):
+        '''
+        Returns the view of the node at the given index.
+        '''
+        return CompactDOMNode(self, index)
+
+
+    def Contains(self, node):
+        '''
+        Returns whether the given node exists in this tree.
+        '''
+        return self.GetNodeIndex().Contains(node)
+
+
+    def GetNodeIndex(self, mode=FULL_MODE):
+        '''
+        Returns the NodeIndex of the nodes of this tree in the given mode.
+        '''
+        if mode not in self._node_indexes:
+            nodes = self.IterSubtree(self.root_node) if self.root_node is not None else []
+            self._node_indexes[mode] = NodeIndex(nodes, mode)
+        return self._node_indexes[mode]
+
+
+    def GetChildren(self, node_id):
+        '''
+        Returns the children of the given node_id.
+        '''
+        if node_id not in self._index_of_id:
+            return []
+        return [ self.GetNode(i) for i in self.IterChildIndices(self._index_of_id[node_id]) ]
+
+
+    def IterChildIndices(self, index):
+        '''
+        Yields the indices of the children of the node at index.
+        '''
+        child = self._first_children[index]
+        while child != NO_NODE:
+            yield child
+            child = self._next_siblings[child]
+
+
+    def IterSubtree(self, node):
+        '''
+        Yields the nodes in the subtree rooted at node in the breadth-first order.
+        '''
+        indices = deque([ self._index_of_id[node.id] ])
+        while len(indices) > 0:
+            index = indices.popleft()
+            yield self.GetNode(index)
+            indices.extend(self.IterChildIndices(index))
+
+
+    def ComputeSubtreeHashes(self):
+        '''
+        Computes the hash and the size of every subtree in one post-order pass.
+        See DOMTree.ComputeSubtreeHashes.
+        '''
+        count = len(self._node_ids)
+        self._subtree_hashes = array('l', [ 0 ]) * count
+        self._structure_subtree_hashes = array('l', [ 0 ]) * count
+        self._subtree_sizes = array('l', [ 0 ]) * count
+
+        # The nodes are stored in the breadth-first order, so the reversed
+        # order visits the children first.
+        for index in xrange(count - 1, -1, -1):
+            children = list(self.IterChildIndices(index))
+            self._subtree_hashes[index] = hash((self._keys[index],) + tuple([ self._subtree_hashes[c] for c in children ]))
+            self._structure_subtree_hashes[index] = hash((self._structure_keys[index],) + tuple([ self._structure_subtree_hashes[c] for c in children ]))
+            self._subtree_sizes[index] = 1 + sum([ self._subtree_sizes[c] for c in children ])
+
+
+    def SubtreeHash(self, node, only_structure=False):
+        '''
+        Returns the hash of the subtree rooted at node.
+        '''
+        index = self._index_of_id[node.id]
+        if only_structure:
+            return self._structure_subtree_hashes[index]
+        return self._subtree_hashes[index]
+
+
+    def SubtreeSize(self, node):
+        '''
+        Returns the number of nodes in the subtree rooted at node.
+        '''
+        return self._subtree_sizes[self._index_of_id[node.id]]
+
+
+    def SubtreeEqual(self, node, other_tree, other_node, only_structure=False):
+        '''
+        Returns whether the subtree rooted at node is equal to the subtree
+        rooted at other_node in other_tree.
+        '''
+        return self.SubtreeSize(node) == other_tree.SubtreeSize(other_node) and \
+                self.SubtreeHash(node, only_structure) == other_tree.SubtreeHash(other_node, only_structure)
+
+
+    def Serialize(self):
+        '''
+        Serializes the tree into dictionary so that it can be serialized into JSON.
+        '''
+        if self.root_node is None:
+            return {}
+        serialized_nodes = [ self.GetNode(i).Serialize() for i in xrange(len(self._node_ids)) ]
+        for index in xrange(1, len(serialized_nodes)):
+            serialized_nodes[self._parents[index]]['children'].append(serialized_nodes[index])
+        return serialized_nodes[0]
+
+
+    ############################################
+    # Iterator implementation
+    ############################################
+    def __iter__(self):
+        return self
+
+    def next(self):
+        '''
+        Returns the next node in the breadth-first order.
+        '''
+        if len(self.children) == 0:
+            # Nothing left to iterate over.
+            raise StopIteration
+        node = self.children.popleft()
+        # Add more children
+        self.children.extend(self.GetChildren(node.id))
+        return node
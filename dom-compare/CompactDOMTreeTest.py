@@ -0,0 +1,59 @@
+from CompactDOMTree import CompactDOMTree
+from DOMTree import DOMTree
+
+import find_tree_diff
+import json
+import unittest
+
+HTML_A = '<html><head><title>A</title></head><body><div class="a b" style="display:none">x</div><ul><li>1</li><li>2</li><li>3</li></ul><p id="p">text</p></body></html>'
+HTML_B = '<html><head><title>A</title></head><body><div class="b a" style="display:none">x</div><ul><li>1</li><li>3</li></ul><p id="p">other</p><span></span></body></html>'
+
+class TestCompactDOMTree(unittest.TestCase):
+
+    def test_same_nodes(self):
+        '''
+        Tests that the compact tree hands out the same nodes as the DOMTree.
+        '''
+        for for_hdp in [ False, True ]:
+            tree = DOMTree(HTML_A, for_hdp)
+            compact_tree = CompactDOMTree(tree)
+            self.assertEqual(tree.size, compact_tree.size)
+            nodes = list(iter(DOMTree(HTML_A, for_hdp)))
+            compact_nodes = list(iter(compact_tree))
+            self.assertEqual(len(nodes), len(compact_nodes))
+            for node, compact_node in zip(nodes, compact_nodes):
+                self.assertEqual(node, compact_node)
+                self.assertEqual(hash(node), hash(compact_node))
+                self.assertEqual(node.id, compact_node.id)
+                self.assertEqual(node.type, compact_node.type)
+                self.assertEqual(node.value, compact_node.value)
+                self.assertEqual(node.attributes, compact_node.attributes)
+                self.assertEqual(node.parent_id, compact_node.parent_id)
+                self.assertEqual(node.signature, compact_node.signature)
+                self.assertEqual(node.IsVisible(), compact_node.IsVisible())
+                self.assertTrue(node.CompareStructure(compact_node))
+                self.assertEqual(node.Serialize(), compact_node.Serialize())
+                self.assertTrue(compact_tree.Contains(node))
+                self.assertEqual(tree.SubtreeHash(node), compact_tree.SubtreeHash(compact_node))
+            self.assertEqual(json.dumps(tree.Serialize()), json.dumps(compact_tree.Serialize()))
+
+
+    def test_no_instance_dict(self):
+        compact_tree = CompactDOMTree(HTML_A)
+        self.assertFalse(hasattr(compact_tree.root_node, '__dict__'))
+
+
+    def test_diff(self):
+        '''
+        Tests that the diff is the same on compact trees.
+        '''
+        for only_structure in [ False, True ]:
+            expected_tree, expected_missing = find_tree_diff.CompareDOMTrees(DOMTree(HTML_B), DOMTree(HTML_A), only_structure)
+            got_tree, got_missing = find_tree_diff.CompareDOMTrees(CompactDOMTree(HTML_B), CompactDOMTree(HTML_A), only_structure)
+            self.assertEqual(expected_tree.size, got_tree.size)
+            self.assertEqual(json.dumps(expected_tree.Serialize()), json.dumps(got_tree.Serialize()))
+            self.assertEqual([ n.id for n in expected_missing ], [ n.id for n in got_missing ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
-import bs4
+from interning import InternKey, RegisterTable
+from signature_trie import BuildSignature, InternSignature, ROOT_SIGNATURE_ID
 
 # JSON Key Constants
 NODE_ID = 'nodeId'
@@ -8,32 +9,31 @@ NODE_CHILDREN = 'children'
 NODE_ATTRIBUTES = 'attributes'
 NODE_PARENT_ID = 'parentId'
 
-BEAUTIFULSOUP_TYPE_TO_STR = {
-    bs4.element.Doctype: 'Doctype',
-    bs4.element.Comment: '#comment'
-}
+# The bs4 class of the text and the bs4 classes that are named differently,
+# set by GetBeautifulSoupTypes.
+_beautifulsoup_types = None
 
-class DOMNode(object):
+# Interned equality keys. Two nodes are equal iff their interned keys are
+# equal, so comparisons in the diff only compare small ints. The tables are
+# emptied by interning.ResetInternTables.
+_node_key_ids = RegisterTable('node_keys', {})
+_structure_key_ids = RegisterTable('structure_keys', {})
+_attributes_key_ids = RegisterTable('attributes_keys', {})
+
+class DOMNodeBase(object):
     '''
-    Represents a DOM Node. It holds the node's ID, type, value, and attributes.
+    The behavior shared by the DOM node representations. Subclasses provide
+    the id, type, value, attributes, parent_id, signature_id, key,
+    structure_key and attributes_key of the node.
     '''
-    def __init__(self, node_id, node_type, value, attributes, parent_id, signature):
+    __slots__ = ()
+
+    @property
+    def signature(self):
         '''
-        Initializes the DOM node.
-        Params:
-            node_id: (int) The node ID of this DOM node.
-            node_type: (string) The string representation of the node.
-            value: (string) The value of the node. If this node contains a #text node, it will be populated in the value property.
-            attributes: (map<string,string>) Attributes of this node.
-            parent_id: (int) The ID of the parent of this node.
-            signature: (string) the signature of this node.
+        Returns the full string of the signature of this node.
         '''
-        self.id = node_id
-        self.type = node_type.lower()
-        self.value = value
-        self.attributes = attributes
-        self.parent_id = parent_id
-        self.signature = signature
+        return BuildSignature(self.signature_id)
 
 
     def IsVisible(self):
@@ -59,7 +59,7 @@ class DOMNode(object):
         '''
         Returns whether the tag matches. This is to just compare the structure of the page.
         '''
-        return self.type == other.type and self.CompareAttrs(other, structure_only=True)
+        return self.structure_key == other.structure_key
 
 
     def ComputeStructureHash(self):
@@ -136,9 +136,9 @@ class DOMNode(object):
         '''
         Returns the hash value for this node object.
 
-        The hash is computed from the type and the value of the object.
+        The hash is the interned equality key of the node.
         '''
-        return self.ComputeStructureHash() + hash(self.value)
+        return self.key
 
 
     def __eq__(self, other):
@@ -147,14 +147,7 @@ class DOMNode(object):
         
         Two nodes are considered equal when they have the same type, value, and attributes.
         '''
-        # print 'SELF:'
-        # print self
-        # print 'OTHER:'
-        # print other
-        # print '==================================================='
-        return (self is None and other is None) or \
-                (self is not None and other is not None and self.type == other.type \
-                and self.value == other.value and self.CompareAttrs(other))
+        return other is not None and self.key == other.key
 
 
     def __ne__(self, other):
@@ -175,6 +168,63 @@ class DOMNode(object):
         '''.format(self.type, self.id, self.parent_id, self.value.encode('utf-8'), self.attributes, self.signature).strip() + '\n'
 
 
+class DOMNode(DOMNodeBase):
+    '''
+    Represents a DOM Node. It holds the node's ID, type, value, and attributes.
+    '''
+    def __init__(self, node_id, node_type, value, attributes, parent_id, signature):
+        '''
+        Initializes the DOM node.
+        Params:
+            node_id: (int) The node ID of this DOM node.
+            node_type: (string) The string representation of the node.
+            value: (string) The value of the node. If this node contains a #text node, it will be populated in the value property.
+            attributes: (map<string,string>) Attributes of this node.
+            parent_id: (int) The ID of the parent of this node.
+            signature: (int or string) the id of the interned signature of this node, or the signature itself.
+        '''
+        self.id = node_id
+        self.type = node_type.lower()
+        self.value = value
+        self.attributes = attributes
+        self.parent_id = parent_id
+        if isinstance(signature, basestring):
+            signature = InternSignature(ROOT_SIGNATURE_ID, signature)
+        self.signature_id = signature
+
+        # The equality keys are computed once here, so the node must not
+        # be modified after it has been constructed.
+        self.key, self.structure_key, self.attributes_key = ComputeEqualityKeys(self.type, self.value, self.attributes)
+
+
+def ComputeEqualityKeys(node_type, value, attributes):
+    '''
+    Returns the interned (full, structure-only, attributes-only) equality
+    keys of a node.
+
+    The keys follow the semantics of DOMNode.CompareAttrs: the class attribute
+    is compared by its number of classes and the set of classes, and the
+    structure-only key only looks at the id and class attributes and the
+    number of attributes. The attributes-only key is the full key without
+    the value.
+    '''
+    class_key = None
+    other_attrs = []
+    for k, v in attributes.iteritems():
+        if k == 'class':
+            splitted_class = v.split()
+            class_key = (len(splitted_class), frozenset(splitted_class))
+        else:
+            other_attrs.append((k, v))
+    id_key = (attributes['id'],) if 'id' in attributes else ()
+
+    other_attrs = frozenset(other_attrs)
+    node_key = (node_type, value, other_attrs, class_key)
+    structure_key = (node_type, len(attributes), id_key, class_key)
+    attributes_key = (node_type, other_attrs, class_key)
+    return InternKey(node_key, _node_key_ids), InternKey(structure_key, _structure_key_ids), InternKey(attributes_key, _attributes_key_ids)
+
+
 def ConstructDOMNodeFromHtml(html, node_id, parent_id, node_signature, for_hdp=False):
     '''
     Constructs a DOM Node object from the given HTML from beautiful soup.
@@ -185,21 +235,44 @@ def ConstructDOMNodeFromHtml(html, node_id, parent_id, node_signature, for_hdp=F
             attrs[k] = ' '.join(v) if type(v) is list else v
     value = ''
     contents = html.contents if hasattr(html, 'contents') else []
-    print str(type(html)) + ' ' + str(html.name)
-    print len(contents)
     for c in contents:
-        if type(c) is bs4.element.NavigableString:
+        if IsHtmlText(c):
             value += unicode(c.string).strip()
-    print 'value: ' + value
 
     # node_type = html.name if type(html) in bs4.element.Doctype else 'Doctype'
-    node_type = html.name if type(html) not in BEAUTIFULSOUP_TYPE_TO_STR else BEAUTIFULSOUP_TYPE_TO_STR[type(html)]
+    _, type_to_str = GetBeautifulSoupTypes()
+    node_type = html.name if type(html) not in type_to_str else type_to_str[type(html)]
 
     if node_type == '[document]':
         node_type = '#document'
     return DOMNode(node_id, node_type, value, attrs, parent_id, node_signature)
 
 
+def IsHtmlText(html):
+    '''
+    Returns whether the element from beautiful soup is text content.
+
+    Some backends use subclasses of NavigableString for the text of script
+    and style elements, so those are text as well.
+    '''
+    navigable_string, type_to_str = GetBeautifulSoupTypes()
+    return isinstance(html, navigable_string) and type(html) not in type_to_str
+
+
+def GetBeautifulSoupTypes():
+    '''
+    Returns the bs4 class of the text and the map of the bs4 classes of the
+    doctype and the comments to their node types.
+
+    bs4 is imported on the first call, so the JSON inputs do not load it.
+    '''
+    global _beautifulsoup_types
+    if _beautifulsoup_types is None:
+        import bs4
+        _beautifulsoup_types = (bs4.element.NavigableString, { bs4.element.Doctype: 'Doctype', bs4.element.Comment: '#comment' })
+    return _beautifulsoup_types
+
+
 def ConstructDOMNodeObj(dom_json, node_signature, for_hdp=False):
     attrs = SerializeAttributes(dom_json[NODE_ATTRIBUTES], for_hdp) if NODE_ATTRIBUTES in dom_json else {}
     value = ''
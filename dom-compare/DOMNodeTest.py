@@ -55,5 +55,36 @@ class TestDOMNode(unittest.TestCase):
         self.assertEquals(signature, expected)
 
 
+    def test_equality_keys(self):
+        '''
+        Tests that the interned equality keys agree with CompareAttrs.
+        '''
+        nodes = [
+            DOMNode(1, 'div', 'value', {}, 1, ''),
+            DOMNode(2, 'div', 'other', {}, 1, ''),
+            DOMNode(3, 'span', 'value', {}, 1, ''),
+            DOMNode(4, 'div', 'value', { 'class': 'a b' }, 1, ''),
+            DOMNode(5, 'div', 'value', { 'class': 'b  a' }, 1, ''),
+            DOMNode(6, 'div', 'value', { 'class': 'a b b' }, 1, ''),
+            DOMNode(7, 'div', 'value', { 'class': 'a a b' }, 1, ''),
+            DOMNode(8, 'div', 'value', { 'class': 'a b', 'id': 'x' }, 1, ''),
+            DOMNode(9, 'div', 'value', { 'class': 'a b', 'id': 'y' }, 1, ''),
+            DOMNode(10, 'div', 'value', { 'class': 'a b', 'href': 'x' }, 1, ''),
+            DOMNode(11, 'div', 'value', { 'class': 'a b', 'src': 'x' }, 1, ''),
+            DOMNode(12, 'div', 'other', { 'class': 'b a', 'src': 'y' }, 1, ''),
+            DOMNode(13, 'div', 'value', { 'id': '' }, 1, ''),
+            DOMNode(14, 'div', 'value', { 'src': '' }, 1, ''),
+        ]
+        for a in nodes:
+            for b in nodes:
+                expected_equal = a.type == b.type and a.value == b.value and a.CompareAttrs(b)
+                expected_structure = a.type == b.type and a.CompareAttrs(b, structure_only=True)
+                self.assertEqual(expected_equal, a == b)
+                self.assertEqual(expected_equal, a.key == b.key)
+                self.assertEqual(expected_structure, a.CompareStructure(b))
+                if a == b:
+                    self.assertEqual(hash(a), hash(b))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,45 +1,74 @@
 from collections import deque, defaultdict
-from DOMNode import DOMNode, ConstructDOMNodeObj, ConstructDOMNodeFromHtml, ConstructSignature
+from DOMNode import DOMNode, ConstructDOMNodeObj, ConstructDOMNodeFromHtml, ConstructSignature, IsHtmlText
+from dom_json_stream import DOMNodeRecord
+from dom_snapshot import DOMSnapshot, IsDOMSnapshot
+from html_parsers import DEFAULT_HTML_PARSER, IsParsedHtml, ParseHtml
+from NodeIndex import FULL_MODE, NodeIndex
+from signature_trie import InternNodeSignature, ROOT_SIGNATURE_ID, SIGNATURE_DELIM
 
-import bs4
 import DOMNode
 import json
 
 # Skip these tags.
 TAGS_TO_SKIP = { '#comment', '#text' }
 
-SIGNATURE_DELIM = '|$de|'
+# In HDP, scripts are skipped as well.
+HDP_TAGS_TO_SKIP = TAGS_TO_SKIP | { 'script' }
 
 class DOMTree(object):
     '''
     Represents a DOM tree. Each DOM Node is represented by the DOMNode object. 
     '''
-    def __init__(self, dom, for_hdp=False):
+    def __init__(self, dom, for_hdp=False, html_parser=DEFAULT_HTML_PARSER):
         '''
         Initializes the DOM tree.
         Params:
             dom_rep: (string) array of objects representing the DOMNode object.
+            html_parser: (string) the backend from html_parsers used when dom is HTML.
+                dom may also be a document that was already parsed with ParseHtml.
         '''
-        if for_hdp:
-            TAGS_TO_SKIP.add('script')
-
         # self.tree holds the tree structure in the adjacency list form
         # the key is the id of the parent and the list are ids the children nodes
         #
         # The root_node_id
-        if type(dom) == dict:
-            self.tree, self.root_node, self.size, self._nodes_set = ConstructDOMTree(dom, for_hdp)
+        #
+        # skipped_count is the number of nodes dropped by ShouldSkipNode.
+        if type(dom) == dict and IsDOMSnapshot(dom):
+            self.tree, self.root_node, self.size, self.skipped_count = ConstructDOMTreeFromSnapshot(DOMSnapshot(dom), for_hdp)
+        elif type(dom) == dict:
+            self.tree, self.root_node, self.size, self.skipped_count = ConstructDOMTree(dom, for_hdp)
+        elif type(dom) == DOMNodeRecord:
+            self.tree, self.root_node, self.size, self.skipped_count = ConstructDOMTreeFromRecords(dom)
         else:
-            self.tree, self.root_node, self.size, self._nodes_set = ConstructDOMTreeFromHtml(dom, for_hdp)
+            self.tree, self.root_node, self.size, self.skipped_count = ConstructDOMTreeFromHtml(dom, for_hdp, html_parser)
 
         self.children = deque([ self.root_node ])
 
+        # The node indexes by the mode. They are built when first used and
+        # dropped when the tree changes.
+        self._node_indexes = {}
+
+        # Subtree hashes are computed once the tree is built. AddNode clears
+        # them, and they are computed again when needed.
+        self._subtree_hashes = None
+        self.ComputeSubtreeHashes()
+
 
     def Contains(self, node):
         '''
         Returns whether the given node exists in this tree.
         '''
-        return node in self._nodes_set
+        return self.GetNodeIndex().Contains(node)
+
+
+    def GetNodeIndex(self, mode=FULL_MODE):
+        '''
+        Returns the NodeIndex of the nodes of this tree in the given mode.
+        '''
+        if mode not in self._node_indexes:
+            nodes = self.IterSubtree(self.root_node) if self.root_node is not None else []
+            self._node_indexes[mode] = NodeIndex(nodes, mode)
+        return self._node_indexes[mode]
 
 
     def GetChildren(self, node_id):
@@ -59,6 +88,8 @@ class DOMTree(object):
             parent_id: the id of the parent.
             node: the node object to be added.
         '''
+        self._subtree_hashes = None
+        self._node_indexes = {}
         if self.size == 0:
             # The tree is empty assume that this is the root node.
             self.root_node = node
@@ -70,23 +101,118 @@ class DOMTree(object):
         self.size += 1
 
 
-    def Serialize(self):
+    def AddDescendants(self, source_tree, node):
         '''
-        Serializes the tree into dictionary so that it can be serialized into JSON.
+        Adds all the descendants of node in source_tree to this tree. The node
+        itself must already be in this tree.
         '''
-        return self.serialize_helper(self.root_node)
+        self._subtree_hashes = None
+        self._node_indexes = {}
+        parents = deque([ node ])
+        while len(parents) > 0:
+            parent = parents.popleft()
+            children = source_tree.GetChildren(parent.id)
+            if len(children) == 0:
+                continue
+            # Same as AddNode for each of the children.
+            self.tree[parent.id].extend(children)
+            self.size += len(children)
+            parents.extend(children)
+
+
+    def AddChildLists(self, child_lists):
+        '''
+        Adds the children in each of the (parent id, children) pairs to this
+        tree. Each parent must already be in this tree.
+        '''
+        self._subtree_hashes = None
+        self._node_indexes = {}
+        for parent_id, children in child_lists:
+            self.tree[parent_id].extend(children)
+            self.size += len(children)
 
 
-    def serialize_helper(self, cur_node):
+    def IterSubtree(self, node):
+        '''
+        Yields the nodes in the subtree rooted at node in the breadth-first order.
         '''
-        Recursive helper method for serializing the tree.
+        nodes = deque([ node ])
+        while len(nodes) > 0:
+            cur_node = nodes.popleft()
+            yield cur_node
+            if cur_node.id in self.tree:
+                nodes.extend(self.tree[cur_node.id])
+
+
+    def ComputeSubtreeHashes(self):
+        '''
+        Computes the hash and the size of every subtree in one post-order pass.
+
+        The hash of a subtree combines the equality key of its root with the
+        hashes of its children in order, in both the full and the
+        structure-only variants.
+        '''
+        self._subtree_hashes = {}
+        self._structure_subtree_hashes = {}
+        self._subtree_sizes = {}
+        if self.root_node is None:
+            return
+
+        # Parents come before their children in the breadth-first order, so
+        # the reversed order visits the children first.
+        for node in reversed(list(self.IterSubtree(self.root_node))):
+            children = self.tree[node.id] if node.id in self.tree else []
+            self._subtree_hashes[node.id] = hash((node.key,) + tuple([ self._subtree_hashes[c.id] for c in children ]))
+            self._structure_subtree_hashes[node.id] = hash((node.structure_key,) + tuple([ self._structure_subtree_hashes[c.id] for c in children ]))
+            self._subtree_sizes[node.id] = 1 + sum([ self._subtree_sizes[c.id] for c in children ])
+
+
+    def SubtreeHash(self, node, only_structure=False):
+        '''
+        Returns the hash of the subtree rooted at node.
+        '''
+        if self._subtree_hashes is None:
+            self.ComputeSubtreeHashes()
+        if only_structure:
+            return self._structure_subtree_hashes[node.id]
+        return self._subtree_hashes[node.id]
+
+
+    def SubtreeSize(self, node):
+        '''
+        Returns the number of nodes in the subtree rooted at node.
+        '''
+        if self._subtree_hashes is None:
+            self.ComputeSubtreeHashes()
+        return self._subtree_sizes[node.id]
+
+
+    def SubtreeEqual(self, node, other_tree, other_node, only_structure=False):
+        '''
+        Returns whether the subtree rooted at node is equal to the subtree
+        rooted at other_node in other_tree.
+        '''
+        return self.SubtreeSize(node) == other_tree.SubtreeSize(other_node) and \
+                self.SubtreeHash(node, only_structure) == other_tree.SubtreeHash(other_node, only_structure)
+
+
+    def Serialize(self):
+        '''
+        Serializes the tree into dictionary so that it can be serialized into JSON.
         '''
-        serialized_cur_node = cur_node.Serialize()
-        if cur_node.id in self.tree:
-            children = self.tree[cur_node.id]
-            for child in children:
-                serialized_cur_node['children'].append(self.serialize_helper(child))
-        return serialized_cur_node
+        if self.root_node is None:
+            return {}
+        serialized_root = self.root_node.Serialize()
+        # The nodes are visited with an explicit stack so that deep trees do
+        # not hit the recursion limit.
+        stack = [ (self.root_node, serialized_root) ]
+        while len(stack) > 0:
+            node, serialized_node = stack.pop()
+            for child in self.GetChildren(node.id):
+                serialized_child = child.Serialize()
+                serialized_node['children'].append(serialized_child)
+                stack.append((child, serialized_child))
+        return serialized_root
 
 
     ############################################
@@ -109,36 +235,36 @@ class DOMTree(object):
         return node
 
 
-def ConstructDOMTreeFromHtml(html, for_hdp):
+def ConstructDOMTreeFromHtml(html, for_hdp, html_parser=DEFAULT_HTML_PARSER):
     '''
     Returns the DOM tree and the ID of the root node.
     '''
     next_node_id = 1
     tree = defaultdict(list)
     root_node = None
-    node_set = set()
-    soup = bs4.BeautifulSoup(html, 'html5lib')
+    skipped_count = 0
+    soup = html if IsParsedHtml(html) else ParseHtml(html, html_parser)
     nodes_to_process = deque([ (0, soup) ])
     child_to_parent = {}
-    node_signature_map = defaultdict(lambda: '')
+    node_signature_map = defaultdict(lambda: ROOT_SIGNATURE_ID)
     dom_node_count = 0
 
     while len(nodes_to_process) > 0:
         cur_node_id, cur_node_html = nodes_to_process.popleft()
         parent_id = child_to_parent[cur_node_id] if cur_node_id in child_to_parent else -1
-        parent_signature = ''
+        parent_signature = ROOT_SIGNATURE_ID
         if parent_id != -1:
             parent_signature = node_signature_map[parent_id]
 
         attrs = cur_node_html.attrs if hasattr(cur_node_html, 'attrs') else {}
-        node_signature = parent_signature + ConstructSignature(cur_node_html.name, attrs, for_hdp) + SIGNATURE_DELIM
+        node_signature = InternNodeSignature(parent_signature, ConstructSignature(cur_node_html.name, attrs, for_hdp))
 
-        # TODO(vaspol): implement signature.
         cur_node = ConstructDOMNodeFromHtml(cur_node_html, cur_node_id, parent_id, node_signature)
         node_signature_map[cur_node.id] = node_signature
 
         # In HDP, we want to ignore all nodes that are not visible.
         if ShouldSkipNode(cur_node, for_hdp):
+            skipped_count += 1
             continue
 
         # Update the count
@@ -150,14 +276,12 @@ def ConstructDOMTreeFromHtml(html, for_hdp):
 
         if hasattr(cur_node_html, 'contents'):
             for child in cur_node_html.contents:
-                if type(child) is bs4.element.NavigableString:
+                if IsHtmlText(child):
                     continue
                 nodes_to_process.append((next_node_id, child))
                 child_to_parent[next_node_id] = cur_node_id
                 next_node_id += 1
 
-        node_set.add(cur_node)
-
         # Populate the tree structure.
         if parent_id == -1:
             # This is the root node. Don't put it in.
@@ -165,7 +289,7 @@ def ConstructDOMTreeFromHtml(html, for_hdp):
 
         tree[parent_id].append(cur_node)
 
-    return tree, root_node, dom_node_count, node_set
+    return tree, root_node, dom_node_count, skipped_count
 
 
 def ConstructDOMTree(root_node_dom_json, for_hdp):
@@ -175,25 +299,26 @@ def ConstructDOMTree(root_node_dom_json, for_hdp):
     tree = defaultdict(list)
     node_count = 0
     root_node = None
-    node_set = set()
+    skipped_count = 0
     needs_processing = len(root_node_dom_json) > 0
     children = deque([ root_node_dom_json ])
-    node_signature_map = defaultdict(lambda: '')
+    node_signature_map = defaultdict(lambda: ROOT_SIGNATURE_ID)
 
     while needs_processing and len(children) > 0:
         # Perform BFS on the DOM tree.
         cur_node_json = children.popleft()
-        parent_signature = ''
+        parent_signature = ROOT_SIGNATURE_ID
         if 'parentId' in cur_node_json:
             parent_signature = node_signature_map[cur_node_json['parentId']]
         # Node signatures are delimited by SIGNATURE_DELIM
         attrs = cur_node_json[DOMNode.NODE_ATTRIBUTES] if DOMNode.NODE_ATTRIBUTES in cur_node_json else []
-        node_signature = parent_signature + ConstructSignature(cur_node_json[DOMNode.NODE_NAME], attrs, for_hdp) + SIGNATURE_DELIM
+        node_signature = InternNodeSignature(parent_signature, ConstructSignature(cur_node_json[DOMNode.NODE_NAME], attrs, for_hdp))
         cur_node = ConstructDOMNodeObj(cur_node_json, node_signature, for_hdp)
-        node_signature_map[cur_node.id] = cur_node.signature
+        node_signature_map[cur_node.id] = cur_node.signature_id
 
         # In HDP, we want to ignore all nodes that are not visible.
         if ShouldSkipNode(cur_node, for_hdp):
+            skipped_count += 1
             continue
 
         # Start processing this node.
@@ -206,8 +331,6 @@ def ConstructDOMTree(root_node_dom_json, for_hdp):
             # Add all the children.
             children.extend(cur_node_json['children'])
 
-        node_set.add(cur_node)
-
         # Populate the tree structure.
         if 'parentId' not in cur_node_json:
             # This is the root node. Don't put it in.
@@ -215,7 +338,112 @@ def ConstructDOMTree(root_node_dom_json, for_hdp):
 
         tree[cur_node_json['parentId']].append(cur_node)
 
-    return tree, root_node, node_count, node_set
+    return tree, root_node, node_count, skipped_count
+
+
+def ConstructDOMTreeFromRecords(root_record):
+    '''
+    Returns the DOM tree and the ID of the root node from the records that
+    were parsed by dom_json_stream.ParseDOMJSON.
+
+    The records were already filtered with ShouldSkipNode while parsing, so
+    the number of skipped nodes is 0.
+    '''
+    tree = defaultdict(list)
+    node_count = 0
+    root_node = None
+    records = deque([ root_record ])
+    node_signature_map = defaultdict(lambda: ROOT_SIGNATURE_ID)
+
+    while len(records) > 0:
+        # Perform BFS on the records.
+        cur_record = records.popleft()
+        cur_node = cur_record.node
+        parent_signature = ROOT_SIGNATURE_ID
+        if cur_record.has_parent_id:
+            parent_signature = node_signature_map[cur_node.parent_id]
+        cur_node.signature_id = InternNodeSignature(parent_signature, cur_record.local_signature)
+        node_signature_map[cur_node.id] = cur_node.signature_id
+
+        node_count += 1
+
+        if root_node is None:
+            root_node = cur_node
+
+        records.extend(cur_record.children)
+        # Populate the tree structure.
+        if not cur_record.has_parent_id:
+            # This is the root node. Don't put it in.
+            continue
+
+        tree[cur_node.parent_id].append(cur_node)
+
+    return tree, root_node, node_count, 0
+
+
+def ConstructDOMTreeFromSnapshot(snapshot, for_hdp):
+    '''
+    Returns the DOM tree and the ID of the root node from a DOMSnapshot.
+
+    The nodes of the snapshot are in the document order, so each parent is
+    built before its children. As in ConstructDOMTree, the only #text child
+    of a node becomes its value. In HDP, the visibility of the nodes is
+    decided by their layout instead of their inline style.
+    '''
+    tree = defaultdict(list)
+    node_count = 0
+    root_node = None
+    skipped_count = 0
+    parent_indices = snapshot.parent_indices
+    tags_to_skip = HDP_TAGS_TO_SKIP if for_hdp else TAGS_TO_SKIP
+
+    # Find the nodes whose only child is a #text node.
+    child_counts = [ 0 ] * snapshot.size
+    first_children = {}
+    for i in xrange(1, snapshot.size):
+        parent_index = parent_indices[i]
+        child_counts[parent_index] += 1
+        if child_counts[parent_index] == 1:
+            first_children[parent_index] = i
+    text_values = {}
+    for parent_index, child_index in first_children.iteritems():
+        if child_counts[parent_index] == 1 and snapshot.GetNodeName(child_index).lower() == '#text':
+            text_values[parent_index] = child_index
+
+    # The nodes that are kept, their signatures and whether they are in the head.
+    nodes = [ None ] * snapshot.size
+    in_head = [ False ] * snapshot.size
+    for i in xrange(snapshot.size):
+        parent_index = parent_indices[i]
+        parent_node = None
+        parent_signature = ROOT_SIGNATURE_ID
+        if parent_index >= 0:
+            parent_node = nodes[parent_index]
+            if parent_node is None or text_values.get(parent_index) == i:
+                # The parent was skipped, or this is the value of the parent.
+                continue
+            parent_signature = parent_node.signature_id
+
+        node_name = snapshot.GetNodeName(i)
+        attrs = snapshot.GetAttributes(i, for_hdp)
+        node_signature = InternNodeSignature(parent_signature, ConstructSignature(node_name, attrs, for_hdp))
+        value = snapshot.GetNodeValue(text_values[i]) if i in text_values else ''
+        parent_id = parent_node.id if parent_node is not None else -1
+        cur_node = DOMNode.DOMNode(snapshot.GetNodeId(i), node_name, value, attrs, parent_id, node_signature)
+        in_head[i] = cur_node.type == 'head' or (parent_index >= 0 and in_head[parent_index])
+
+        if cur_node.type in tags_to_skip or (for_hdp and not snapshot.IsVisible(i, cur_node.type, in_head[i])):
+            skipped_count += 1
+            continue
+
+        nodes[i] = cur_node
+        node_count += 1
+        if root_node is None:
+            root_node = cur_node
+            continue
+        tree[parent_id].append(cur_node)
+
+    return tree, root_node, node_count, skipped_count
 
 
 def ShouldSkipNode(node, for_hdp):
@@ -223,4 +451,6 @@ def ShouldSkipNode(node, for_hdp):
     Returns whether the given node should be skipped based on the tag name or 
     the visibility of the node.
     '''
-    return node.type in TAGS_TO_SKIP or (for_hdp and not node.IsVisible())
+    if for_hdp:
+        return node.type in HDP_TAGS_TO_SKIP or not node.IsVisible()
+    return node.type in TAGS_TO_SKIP
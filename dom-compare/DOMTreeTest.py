@@ -60,5 +60,46 @@ class TestDOMTree(unittest.TestCase):
             self.assertEquals(expected[i].signature, n.signature)
 
 
+    def test_signature_ids(self):
+        '''
+        Test that nodes with the same signature share the interned signature.
+        '''
+        html = '<html><body><div><p>a</p><p>b</p></div><div><p>c</p></div></body></html>'
+        tree = DOMTree(html)
+        paragraphs = [ n for n in iter(tree) if n.type == 'p' ]
+        self.assertEqual(3, len(paragraphs))
+        self.assertEqual(1, len({ n.signature_id for n in paragraphs }))
+        self.assertEqual('<#document>[]|$de|<html>[]|$de|<body>[]|$de|<div>[]|$de|<p>[]|$de|', paragraphs[0].signature)
+
+
+    def test_subtree_hashes(self):
+        '''
+        Test that equal subtrees have equal hashes.
+        '''
+        html_a = '<html><body><div class="a b"><p>Hello</p><p>world</p></div><div><span>x</span></div></body></html>'
+        html_b = '<html><body><div class="b a"><p>Hello</p><p>world</p></div><div><span>y</span></div></body></html>'
+        tree_a = DOMTree(html_a)
+        tree_b = DOMTree(html_b)
+        nodes_a = list(iter(tree_a))
+        nodes_b = list(iter(tree_b))
+
+        # The first div and its paragraphs are equal.
+        self.assertTrue(tree_a.SubtreeEqual(nodes_a[4], tree_b, nodes_b[4]))
+        self.assertEqual(3, tree_a.SubtreeSize(nodes_a[4]))
+
+        # The second div differs by the value of the span.
+        self.assertFalse(tree_a.SubtreeEqual(nodes_a[5], tree_b, nodes_b[5]))
+        self.assertTrue(tree_a.SubtreeEqual(nodes_a[5], tree_b, nodes_b[5], only_structure=True))
+        self.assertFalse(tree_a.SubtreeEqual(tree_a.root_node, tree_b, tree_b.root_node))
+        self.assertEqual(tree_a.size, tree_a.SubtreeSize(tree_a.root_node))
+
+        # Hashes are computed again after the tree changes.
+        common_tree = DOMTree({})
+        common_tree.AddNode(-1, tree_a.root_node)
+        common_tree.AddDescendants(tree_a, tree_a.root_node)
+        self.assertEqual(tree_a.size, common_tree.size)
+        self.assertTrue(common_tree.SubtreeEqual(common_tree.root_node, tree_a, tree_a.root_node))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+# The equality modes of the index.
+#   full: the type, the value and the attributes, as in DOMNode.__eq__.
+#   structure: the structure-only key, as in DOMNode.CompareStructure.
+#   attributes: the type and the attributes without the value, as in
+#               DOMNode.CompareAttrs.
+FULL_MODE = 'full'
+STRUCTURE_MODE = 'structure'
+ATTRIBUTES_MODE = 'attributes'
+INDEX_MODES = [ FULL_MODE, STRUCTURE_MODE, ATTRIBUTES_MODE ]
+
+class NodeIndex(object):
+    '''
+    A multiset of DOM nodes keyed by their interned equality keys.
+
+    Unlike a set of nodes, repeated identical nodes are counted, so the
+    overlap of two trees counts each node at most as many times as it
+    appears in the other tree.
+    '''
+    def __init__(self, nodes, mode=FULL_MODE):
+        '''
+        Initializes the index.
+        Params:
+            nodes: the nodes to index.
+            mode: one of INDEX_MODES.
+        '''
+        if mode not in INDEX_MODES:
+            raise ValueError('Unknown index mode: {0}'.format(mode))
+        self.mode = mode
+        self.size = 0
+
+        # Maps the key to the number of nodes with the key, and the key to
+        # the type of the nodes with the key.
+        self.counts = {}
+        self.types = {}
+        for node in nodes:
+            key = self.GetKey(node)
+            count = self.counts.get(key)
+            if count is None:
+                self.counts[key] = 1
+                self.types[key] = node.type
+            else:
+                self.counts[key] = count + 1
+            self.size += 1
+
+
+    def GetKey(self, node):
+        '''
+        Returns the key of the node in the mode of this index.
+        '''
+        if self.mode == FULL_MODE:
+            return node.key
+        if self.mode == STRUCTURE_MODE:
+            return node.structure_key
+        return node.attributes_key
+
+
+    def Contains(self, node):
+        '''
+        Returns whether a node equal to the given node is in the index.
+        '''
+        return self.GetKey(node) in self.counts
+
+
+    def Count(self, node):
+        '''
+        Returns the number of nodes equal to the given node in the index.
+        '''
+        return self.counts.get(self.GetKey(node), 0)
+
+
+    def IntersectionCount(self, other):
+        '''
+        Returns the size of the multiset intersection with the other index.
+        '''
+        self.CheckMode(other)
+        if len(other.counts) < len(self.counts):
+            return other.IntersectionCount(self)
+        other_counts = other.counts
+        intersection = 0
+        for key, count in self.counts.iteritems():
+            other_count = other_counts.get(key)
+            if other_count is not None:
+                intersection += count if count < other_count else other_count
+        return intersection
+
+
+    def DifferenceCount(self, other):
+        '''
+        Returns the number of nodes of this index that are not matched by a
+        node of the other index.
+        '''
+        return self.size - self.IntersectionCount(other)
+
+
+    def Overlap(self, other):
+        '''
+        Returns the overlap with the other index, in total and by the type of
+        the nodes, in a single pass over both indexes.
+
+        Each count is a map with the keys intersection, only_self and
+        only_other.
+        '''
+        self.CheckMode(other)
+        total = NewOverlapCounts()
+        by_type = {}
+        other_counts = other.counts
+        for key, count in self.counts.iteritems():
+            other_count = other_counts.get(key, 0)
+            intersection = min(count, other_count)
+            AddOverlapCounts(total, intersection, count - intersection, other_count - intersection)
+            AddOverlapCounts(by_type.setdefault(self.types[key], NewOverlapCounts()), intersection, count - intersection, other_count - intersection)
+        for key, other_count in other_counts.iteritems():
+            if key in self.counts:
+                continue
+            AddOverlapCounts(total, 0, 0, other_count)
+            AddOverlapCounts(by_type.setdefault(other.types[key], NewOverlapCounts()), 0, 0, other_count)
+        total['by_type'] = by_type
+        return total
+
+
+    def CheckMode(self, other):
+        if self.mode != other.mode:
+            raise ValueError('Cannot compare a {0} index with a {1} index'.format(self.mode, other.mode))
+
+
+def NewOverlapCounts():
+    return { 'intersection': 0, 'only_self': 0, 'only_other': 0 }
+
+
+def AddOverlapCounts(counts, intersection, only_self, only_other):
+    counts['intersection'] += intersection
+    counts['only_self'] += only_self
+    counts['only_other'] += only_other
@@ -0,0 +1,66 @@
+from DOMNode import DOMNode
+from DOMTree import DOMTree
+from NodeIndex import NodeIndex, ATTRIBUTES_MODE, FULL_MODE, STRUCTURE_MODE
+
+import unittest
+
+class TestNodeIndex(unittest.TestCase):
+
+    def test_multiset(self):
+        '''
+        Tests that repeated identical nodes are counted.
+        '''
+        nodes_a = [ DOMNode(i, 'li', 'x', {}, -1, '') for i in range(3) ] + [ DOMNode(10, 'div', '', { 'class': 'a b' }, -1, '') ]
+        nodes_b = [ DOMNode(i, 'li', 'x', {}, -1, '') for i in range(2) ] + [ DOMNode(10, 'div', '', { 'class': 'b a' }, -1, ''), DOMNode(11, 'p', '', {}, -1, '') ]
+        index_a = NodeIndex(nodes_a)
+        index_b = NodeIndex(nodes_b)
+        self.assertEqual(4, index_a.size)
+        self.assertEqual(3, index_a.Count(nodes_b[0]))
+        self.assertTrue(index_a.Contains(nodes_b[2]))
+        self.assertFalse(index_a.Contains(nodes_b[3]))
+        self.assertEqual(3, index_a.IntersectionCount(index_b))
+        self.assertEqual(3, index_b.IntersectionCount(index_a))
+        self.assertEqual(1, index_a.DifferenceCount(index_b))
+        self.assertEqual(1, index_b.DifferenceCount(index_a))
+
+        overlap = index_a.Overlap(index_b)
+        self.assertEqual(3, overlap['intersection'])
+        self.assertEqual(1, overlap['only_self'])
+        self.assertEqual(1, overlap['only_other'])
+        self.assertEqual({ 'intersection': 2, 'only_self': 1, 'only_other': 0 }, overlap['by_type']['li'])
+        self.assertEqual({ 'intersection': 0, 'only_self': 0, 'only_other': 1 }, overlap['by_type']['p'])
+
+
+    def test_modes(self):
+        node = DOMNode(1, 'a', 'x', { 'href': '/a', 'id': 'i' }, -1, '')
+        other_value = DOMNode(2, 'a', 'y', { 'href': '/a', 'id': 'i' }, -1, '')
+        other_href = DOMNode(3, 'a', 'x', { 'href': '/b', 'id': 'i' }, -1, '')
+        for mode, expected in [ (FULL_MODE, [ False, False ]), (STRUCTURE_MODE, [ True, True ]), (ATTRIBUTES_MODE, [ True, False ]) ]:
+            index = NodeIndex([ node ], mode)
+            self.assertEqual(expected, [ index.Contains(other_value), index.Contains(other_href) ])
+        # The classes are compared as a set in every mode.
+        reordered_class = DOMNode(4, 'a', 'y', { 'class': 'b a' }, -1, '')
+        self.assertTrue(NodeIndex([ DOMNode(5, 'a', 'x', { 'class': 'a b' }, -1, '') ], ATTRIBUTES_MODE).Contains(reordered_class))
+        self.assertRaises(ValueError, NodeIndex, [ node ], 'unknown')
+        self.assertRaises(ValueError, NodeIndex([ node ]).IntersectionCount, NodeIndex([ node ], STRUCTURE_MODE))
+
+
+    def test_tree_index(self):
+        '''
+        Tests that the index of a tree follows the changes of the tree.
+        '''
+        dom = DOMTree('<html><body><ul><li>1</li><li>1</li></ul></body></html>')
+        li = [ n for n in dom.IterSubtree(dom.root_node) if n.type == 'li' ][0]
+        self.assertTrue(dom.Contains(li))
+        self.assertEqual(2, dom.GetNodeIndex().Count(li))
+
+        common = DOMTree({})
+        common.AddNode(-1, dom.root_node)
+        self.assertFalse(common.Contains(li))
+        common.AddDescendants(dom, dom.root_node)
+        self.assertTrue(common.Contains(li))
+        self.assertEqual(dom.size, common.GetNodeIndex().IntersectionCount(dom.GetNodeIndex()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+from argparse import ArgumentParser
+from diff_stats import DiffStats, DUMP_PHASE, Phase
+from html_parsers import DEFAULT_HTML_PARSER, HTML_PARSERS
+from multiprocessing import Pool, cpu_count
+from sibling_alignment import ALIGNMENT_ENGINES, DEFAULT_LINEAR_SPACE_WIDTH, LCS_ENGINE
+from tree_cache import DEFAULT_MAX_BYTES, TreeCache
+
+import find_tree_diff
+import fingerprint
+import interning
+import json
+import sys
+import utils
+
+# Per-pair options that can be set in the manifest. When an entry does not
+# set one of these, the value given on the command line is used.
+PAIR_OPTIONS = [ 'hdp', 'only_structure', 'raw_html', 'html_parser', 'streaming_json', 'compact_tree', 'alignment_engine', 'linear_space_width', 'cache_dir', 'cache_max_bytes', 'stats', 'skip_above_similarity' ]
+
+def Main():
+    defaults = { option: getattr(args, option) for option in PAIR_OPTIONS }
+    with open(args.manifest, 'r') as manifest_file:
+        pairs = [ ReadManifestEntry(line, defaults) for line in manifest_file if line.strip() != '' ]
+
+    pool = Pool(args.workers)
+    try:
+        with open(args.output, 'w') as output_file:
+            # Results are written in the order the pairs finish.
+            for result in pool.imap_unordered(ComparePair, pairs, args.chunksize):
+                output_file.write(json.dumps(result) + '\n')
+                output_file.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if args.cache_dir is not None:
+        sys.stderr.write('cache stats: {0}\n'.format(json.dumps(TreeCache(args.cache_dir, args.cache_max_bytes).Stats(), sort_keys=True)))
+
+
+def ReadManifestEntry(line, defaults):
+    '''
+    Returns the pair described by a line of the manifest with the
+    missing options populated from defaults.
+
+    Each line is a JSON object with the dom_tree_a and dom_tree_b keys.
+    The optional keys are hdp, only_structure, raw_html, html_parser,
+    streaming_json, compact_tree, alignment_engine, linear_space_width,
+    cache_dir, cache_max_bytes, stats, skip_above_similarity,
+    dump_common_tree, dump_missing_nodes and id.
+    '''
+    pair = json.loads(line)
+    for option, value in defaults.iteritems():
+        if option not in pair:
+            pair[option] = value
+    return pair
+
+
+def ComparePair(pair):
+    '''
+    Runs the find_tree_diff comparison for a single pair from the manifest.
+    When stats is set for the pair, the record has the timing and the
+    counters of the comparison under stats. When skip_above_similarity is
+    set, the record has the estimated similarity, and the diff is skipped
+    when the similarity is at least skip_above_similarity.
+
+    Returns the result record of the comparison. Errors are reported in the
+    record instead of being raised so that one bad pair does not stop the batch.
+    The trees of the pair are dropped and the intern tables are reset at the
+    end, so a worker does not keep the keys of all the pairs it compared.
+    '''
+    result = {
+        'dom_tree_a': pair.get('dom_tree_a'),
+        'dom_tree_b': pair.get('dom_tree_b'),
+        'common_size': None,
+        'testing_size': None,
+        'missing_count': None,
+        'error': None,
+    }
+    if 'id' in pair:
+        result['id'] = pair['id']
+
+    stats = DiffStats() if pair['stats'] else None
+    cache = None
+    try:
+        # The baseline is usually shared by many pairs, so the workers share
+        # the tree cache when there is one.
+        cache = TreeCache(pair['cache_dir'], pair['cache_max_bytes']) if pair['cache_dir'] is not None else None
+        dom_a = None
+        dom_b = None
+        if pair['skip_above_similarity'] is not None:
+            dom_a, dom_b = ScreenPair(pair, result, cache, stats)
+        if not result.get('skipped', False):
+            DiffPair(pair, result, dom_a, dom_b, cache, stats)
+    except Exception as e:
+        result['error'] = '{0}: {1}'.format(type(e).__name__, e)
+    finally:
+        # The workers of the pool do not run the exit handlers.
+        if cache is not None:
+            cache.Close()
+        interning.ResetInternTables()
+    if stats is not None:
+        result['stats'] = stats.ToRecord()
+    return result
+
+
+def ScreenPair(pair, result, cache, stats):
+    '''
+    Adds the estimated similarity of the pages to the result and whether the
+    diff is skipped because they are similar enough. Returns the trees that
+    were built to compute the fingerprints, or None for the fingerprints that
+    were found in the cache.
+    '''
+    fingerprint_a, dom_a = fingerprint.GetFileFingerprint(pair['dom_tree_a'], pair['hdp'], pair['raw_html'], pair['streaming_json'], pair['html_parser'], pair['compact_tree'], cache, stats=stats)
+    fingerprint_b, dom_b = fingerprint.GetFileFingerprint(pair['dom_tree_b'], pair['hdp'], pair['raw_html'], pair['streaming_json'], pair['html_parser'], pair['compact_tree'], cache, stats=stats)
+    result['similarity'] = fingerprint_a.Similarity(fingerprint_b, pair['only_structure'])
+    result['skipped'] = result['similarity'] >= pair['skip_above_similarity']
+    result['testing_size'] = fingerprint_a.size
+    return dom_a, dom_b
+
+
+def DiffPair(pair, result, dom_a, dom_b, cache, stats):
+    '''
+    Diffs the pair and adds the sizes to the result. The trees that are None
+    are built first.
+    '''
+    if dom_a is None:
+        dom_a = utils.GetDOMTree(pair['dom_tree_a'], pair['hdp'], pair['raw_html'], pair['streaming_json'], pair['html_parser'], pair['compact_tree'], cache, stats)
+    if dom_b is None:
+        dom_b = utils.GetDOMTree(pair['dom_tree_b'], pair['hdp'], pair['raw_html'], pair['streaming_json'], pair['html_parser'], pair['compact_tree'], cache, stats)
+
+    # Assume that DOM B is the correct DOM Tree.
+    common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(dom_b, dom_a, pair['only_structure'], engine=pair['alignment_engine'], linear_space_width=pair['linear_space_width'], stats=stats)
+    result['common_size'] = common_dom_tree.size
+    result['testing_size'] = dom_a.size
+    result['missing_count'] = len(missing_nodes)
+
+    with Phase(stats, DUMP_PHASE):
+        if pair.get('dump_common_tree') is not None:
+            find_tree_diff.DumpCommonTree(common_dom_tree, pair['dump_common_tree'])
+        if pair.get('dump_missing_nodes') is not None:
+            find_tree_diff.DumpMissingNodes(missing_nodes, pair['dump_missing_nodes'])
+
+
+def CreateArgumentParser():
+    '''
+    Returns the parser of the command line arguments of Main.
+    '''
+    parser = ArgumentParser()
+    parser.add_argument('manifest', help='JSONL file with one pair of DOM trees per line')
+    parser.add_argument('output', help='JSONL file where the result of each pair is written')
+    parser.add_argument('--workers', default=cpu_count(), type=int)
+    parser.add_argument('--chunksize', default=1, type=int)
+    parser.add_argument('--hdp', default=False, action='store_true')
+    parser.add_argument('--only-structure', default=False, action='store_true')
+    parser.add_argument('--alignment-engine', default=LCS_ENGINE, choices=ALIGNMENT_ENGINES)
+    parser.add_argument('--linear-space-width', default=DEFAULT_LINEAR_SPACE_WIDTH, type=int)
+    parser.add_argument('--raw-html', default=False, action='store_true')
+    parser.add_argument('--html-parser', default=DEFAULT_HTML_PARSER, choices=HTML_PARSERS)
+    parser.add_argument('--streaming-json', default=False, action='store_true')
+    parser.add_argument('--compact-tree', default=False, action='store_true')
+    parser.add_argument('--cache-dir', default=None, help='directory of the on-disk cache of built DOM trees')
+    parser.add_argument('--cache-max-bytes', default=DEFAULT_MAX_BYTES, type=int)
+    parser.add_argument('--skip-above-similarity', default=None, type=float, help='skip the diff of the pairs whose estimated similarity is at least this')
+    parser.add_argument('--stats', default=False, action='store_true', help='add the timing and the counters of each comparison to its record')
+    return parser
+
+
+if __name__ == '__main__':
+    args = CreateArgumentParser().parse_args()
+    Main()
@@ -0,0 +1,79 @@
+import batch_tree_diff
+import interning
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+DOM_A = '{"result":{"root":{"nodeId":1,"nodeName":"#document","children":[{"nodeId":2,"parentId":1,"nodeName":"DIV","attributes":["class","a b"],"children":[{"nodeId":3,"parentId":2,"nodeName":"#text","nodeValue":"hello"}]},{"nodeId":4,"parentId":1,"nodeName":"SPAN","attributes":["id","x"]}]}}}'
+DOM_B = '{"result":{"root":{"nodeId":1,"nodeName":"#document","children":[{"nodeId":2,"parentId":1,"nodeName":"DIV","attributes":["class","b a"],"children":[{"nodeId":3,"parentId":2,"nodeName":"#text","nodeValue":"world"}]},{"nodeId":4,"parentId":1,"nodeName":"SPAN","attributes":["id","x"]}]}}}'
+
+class TestBatchTreeDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dom_a = os.path.join(self.tmp_dir, 'a.json')
+        self.dom_b = os.path.join(self.tmp_dir, 'b.json')
+        with open(self.dom_a, 'w') as f:
+            f.write(DOM_A)
+        with open(self.dom_b, 'w') as f:
+            f.write(DOM_B)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def test_compare_pair(self):
+        '''
+        Tests that pairs with different options can be compared side by side.
+        '''
+        defaults = { 'hdp': False, 'only_structure': False, 'raw_html': False, 'html_parser': 'html5lib', 'streaming_json': False, 'compact_tree': False, 'alignment_engine': 'lcs', 'linear_space_width': 2000, 'cache_dir': None, 'cache_max_bytes': 1024 * 1024, 'stats': False, 'skip_above_similarity': None }
+        pair = batch_tree_diff.ReadManifestEntry(json.dumps({ 'dom_tree_a': self.dom_a, 'dom_tree_b': self.dom_b, 'id': 7 }), defaults)
+        result = batch_tree_diff.ComparePair(pair)
+        self.assertEqual(None, result['error'])
+        self.assertEqual(7, result['id'])
+        self.assertEqual(2, result['common_size'])
+        self.assertEqual(3, result['testing_size'])
+        self.assertEqual(1, result['missing_count'])
+        # The keys of the pair are not kept by the worker.
+        self.assertEqual(0, interning.GetTableSizes()['node_keys'])
+
+        pair = batch_tree_diff.ReadManifestEntry(json.dumps({ 'dom_tree_a': self.dom_a, 'dom_tree_b': self.dom_b, 'only_structure': True }), defaults)
+        result = batch_tree_diff.ComparePair(pair)
+        self.assertEqual(3, result['common_size'])
+        self.assertEqual(0, result['missing_count'])
+
+
+    def test_skip_similar_pair(self):
+        '''
+        Tests that the diff is skipped when the pages are similar enough.
+        '''
+        defaults = { 'hdp': False, 'only_structure': False, 'raw_html': False, 'html_parser': 'html5lib', 'streaming_json': False, 'compact_tree': False, 'alignment_engine': 'lcs', 'linear_space_width': 2000, 'cache_dir': None, 'cache_max_bytes': 1024 * 1024, 'stats': False, 'skip_above_similarity': 0.9 }
+        pair = batch_tree_diff.ReadManifestEntry(json.dumps({ 'dom_tree_a': self.dom_a, 'dom_tree_b': self.dom_a }), defaults)
+        result = batch_tree_diff.ComparePair(pair)
+        self.assertEqual(None, result['error'])
+        self.assertEqual(1.0, result['similarity'])
+        self.assertTrue(result['skipped'])
+        self.assertEqual(None, result['common_size'])
+
+        pair = batch_tree_diff.ReadManifestEntry(json.dumps({ 'dom_tree_a': self.dom_a, 'dom_tree_b': self.dom_b }), defaults)
+        result = batch_tree_diff.ComparePair(pair)
+        self.assertFalse(result['skipped'])
+        self.assertEqual(2, result['common_size'])
+
+
+    def test_compare_pair_error(self):
+        '''
+        Tests that a failing pair is reported instead of raised.
+        '''
+        defaults = { 'hdp': False, 'only_structure': False, 'raw_html': False, 'html_parser': 'html5lib', 'streaming_json': False, 'compact_tree': False, 'alignment_engine': 'lcs', 'linear_space_width': 2000, 'cache_dir': None, 'cache_max_bytes': 1024 * 1024, 'stats': False, 'skip_above_similarity': None }
+        pair = batch_tree_diff.ReadManifestEntry(json.dumps({ 'dom_tree_a': self.dom_a, 'dom_tree_b': os.path.join(self.tmp_dir, 'missing.json') }), defaults)
+        result = batch_tree_diff.ComparePair(pair)
+        self.assertTrue(result['error'].startswith('IOError'))
+        self.assertEqual(None, result['common_size'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+from argparse import ArgumentParser
+from DOMTree import DOMTree
+
+import dom_generator
+import find_tree_diff
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tree_edit_distance
+import utils
+
+# The phases that are timed, in the order they run.
+PHASES = [ 'get_dom_tree_json', 'get_dom_tree_html', 'construct_dom_tree', 'find_common_nodes', 'main_diff', 'tree_edit_distance', 'serialize' ]
+
+def Main():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = dom_generator.WritePagePair(tmp_dir, dom_generator.CreateGenerator(args))
+        results = RunBenchmarks(paths, args.repeat, args.hdp)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    report = {
+        'config': {
+            'seed': args.seed,
+            'depth': args.depth,
+            'fan_out': args.fan_out,
+            'text_size': args.text_size,
+            'attribute_churn': args.attribute_churn,
+            'mutation_rate': args.mutation_rate,
+            'move_rate': args.move_rate,
+            'repeat': args.repeat,
+            'hdp': args.hdp,
+        },
+        'python': platform.python_version(),
+        'results': results,
+    }
+    for phase in PHASES:
+        print '{0:<20} {1:.4f}s'.format(phase, results[phase]['seconds'])
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['config'] != report['config']:
+            print 'WARNING: the baseline was run with a different configuration'
+        regressions = CompareResults(baseline['results'], results, args.tolerance)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+def RunBenchmarks(paths, repeat, for_hdp):
+    '''
+    Times each of the phases and returns the results keyed by the phase.
+
+    Each phase runs repeat times and the fastest run is reported.
+    '''
+    with open(paths['a_json'], 'r') as input_file:
+        dom_json = input_file.read()
+    dom_a = utils.GetDOMTree(paths['a_json'], for_hdp)
+    dom_b = utils.GetDOMTree(paths['b_json'], for_hdp)
+    sibling_pairs = GetSiblingPairs(dom_b, dom_a)
+    main_args = find_tree_diff.CreateArgumentParser().parse_args([ paths['a_json'], paths['b_json'] ] + ([ '--hdp' ] if for_hdp else []))
+
+    results = {}
+    results['get_dom_tree_json'] = TimePhase(repeat, lambda: utils.GetDOMTree(paths['a_json'], for_hdp))
+    results['get_dom_tree_html'] = TimePhase(repeat, lambda: utils.GetDOMTree(paths['a_html'], for_hdp, True))
+    # ConstructDOMTree modifies the JSON, so each run gets a fresh copy.
+    results['construct_dom_tree'] = TimePhase(repeat, lambda root: DOMTree(root, for_hdp), lambda: json.loads(dom_json)['result']['root'])
+    results['find_common_nodes'] = TimePhase(repeat, lambda: [ find_tree_diff.FindCommonNodes(c, t) for c, t in sibling_pairs ])
+    results['main_diff'] = TimePhase(repeat, lambda: RunMain(main_args))
+    # The edit distance is compared with the distance of the level-wise diff,
+    # which is what it falls back to when it runs out of budget.
+    results['tree_edit_distance'] = TimePhase(repeat, lambda: tree_edit_distance.TreeEditDistance(dom_b, dom_a))
+    edit_distance = tree_edit_distance.TreeEditDistance(dom_b, dom_a)
+    level_wise = tree_edit_distance.TreeEditDistance(dom_b, dom_a, max_cells=0)
+    for k in [ 'engine', 'distance', 'cells', 'memory_bytes', 'fallback_reason' ]:
+        results['tree_edit_distance'][k] = edit_distance[k]
+    results['tree_edit_distance']['level_wise_distance'] = level_wise['distance']
+    results['serialize'] = TimePhase(repeat, lambda: dom_a.Serialize())
+    results['get_dom_tree_json']['nodes'] = dom_a.size
+    results['find_common_nodes']['sibling_lists'] = len(sibling_pairs)
+    return results
+
+
+def TimePhase(repeat, func, setup=None):
+    '''
+    Returns the fastest and all the times of repeat runs of func. When setup
+    is given, its result is passed to func and it is not timed.
+    '''
+    runs = []
+    for i in xrange(repeat):
+        func_args = [ setup() ] if setup is not None else []
+        start = time.time()
+        func(*func_args)
+        runs.append(time.time() - start)
+    return { 'seconds': min(runs), 'runs': runs }
+
+
+def GetSiblingPairs(correct_dom, testing_dom):
+    '''
+    Returns the (correct children, testing children) pairs of the nodes with
+    the same id in both trees. Unchanged generated nodes keep their ids.
+    '''
+    testing_nodes = { n.id: n for n in testing_dom.IterSubtree(testing_dom.root_node) }
+    pairs = []
+    for node in correct_dom.IterSubtree(correct_dom.root_node):
+        if node.id in testing_nodes:
+            correct_children = correct_dom.GetChildren(node.id)
+            testing_children = testing_dom.GetChildren(node.id)
+            if len(correct_children) > 0 or len(testing_children) > 0:
+                pairs.append((correct_children, testing_children))
+    return pairs
+
+
+def RunMain(main_args):
+    '''
+    Runs find_tree_diff.Main with the output discarded.
+    '''
+    find_tree_diff.args = main_args
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            find_tree_diff.Main()
+        finally:
+            sys.stdout = stdout
+
+
+def CompareResults(baseline_results, results, tolerance):
+    '''
+    Prints the change of each phase against the baseline and returns the
+    phases that are slower than the baseline by more than tolerance.
+    '''
+    regressions = []
+    for phase in PHASES:
+        if phase not in baseline_results or phase not in results:
+            continue
+        baseline_seconds = baseline_results[phase]['seconds']
+        seconds = results[phase]['seconds']
+        ratio = seconds / baseline_seconds if baseline_seconds > 0 else 1.0
+        status = 'ok'
+        if ratio > 1 + tolerance:
+            status = 'REGRESSION'
+            regressions.append(phase)
+        print '{0:<20} {1:.4f}s -> {2:.4f}s ({3:+.1f}%) {4}'.format(phase, baseline_seconds, seconds, (ratio - 1) * 100, status)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    dom_generator.AddGeneratorArguments(parser)
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--hdp', default=False, action='store_true')
+    parser.add_argument('--output', default=None, help='JSON file where the results are written')
+    parser.add_argument('--baseline', default=None, help='JSON file with the results of an earlier run to compare against')
+    parser.add_argument('--tolerance', default=0.1, type=float, help='the slowdown relative to the baseline that is reported as a regression')
+    args = parser.parse_args()
+    Main()
@@ -0,0 +1,556 @@
+from argparse import ArgumentParser
+from fingerprint import ComputeFullKeyHash, MixHash
+from html_parsers import DEFAULT_HTML_PARSER, HTML_PARSERS
+from tree_cache import FileLock
+
+import errno
+import heapq
+import interning
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import utils
+
+# Bump this when the layout of the segments changes.
+INDEX_FORMAT_VERSION = 2
+
+# The kinds of the terms. A node term is the equality hash of a node, as in
+# DOMNode.key, and a subtree term is the hash of a whole subtree, as in
+# DOMTree.SubtreeHash. Both are stable across processes.
+NODE_KIND = 0
+SUBTREE_KIND = 1
+
+# The subtrees smaller than this are not indexed. A single node is already
+# indexed as a node term.
+DEFAULT_MIN_SUBTREE_SIZE = 2
+
+# The number of pages written into each segment by the command line.
+DEFAULT_BATCH_SIZE = 1000
+
+MANIFEST_FILENAME = 'index.json'
+PAGES_FILENAME = 'pages.jsonl'
+LOCK_FILENAME = 'lock'
+SEGMENT_SUFFIX = '.segment'
+
+# The segment starts with the magic and the header, followed by the sorted
+# term entries, the postings and the top table. The header is the format
+# version, the number of entries, the first page id, the number of pages,
+# and the offset and the length of the top table. Each entry is the kind,
+# the hash, the offset and the byte length of the postings, the number of
+# pages and the size of the subtree. The top table has the positions of the
+# subtree entries from the most to the least pages, and then from the
+# largest to the smallest subtree.
+SEGMENT_MAGIC = 'DCIX'
+HEADER_FORMAT = '<4sIIIIQI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ENTRY_FORMAT = '<BQQIII'
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+TOP_FORMAT = '<I'
+TOP_SIZE = struct.calcsize(TOP_FORMAT)
+
+class CorpusIndex(object):
+    '''
+    An on-disk inverted index from the node and the subtree hashes to the
+    pages of a crawl that contain them.
+
+    The index is a list of immutable segments, one per batch of added pages.
+    Each segment has a sorted table of the terms of its pages and, for each
+    term, the sorted ids of the pages that contain it as varint deltas. The
+    segments are memory-mapped and a term is found with a binary search in
+    each of them, so queries do not load any tree. The page ids increase
+    with the segments, so the postings of a term are the concatenation of
+    its postings in each segment. Adding pages writes a new segment and
+    never rewrites the existing ones. Merge compacts the segments into one.
+    '''
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        try:
+            os.makedirs(index_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.segments = []
+        self.page_count = 0
+        self.Reload()
+
+
+    def Reload(self):
+        '''
+        Maps the segments listed in the manifest, which may have been added
+        by another process.
+        '''
+        self.Close()
+        manifest = self.ReadManifest()
+        self.segments = [ _Segment(os.path.join(self.index_dir, name)) for name in manifest['segments'] ]
+        self.page_count = manifest['page_count']
+
+
+    def Close(self):
+        for segment in self.segments:
+            segment.Close()
+        self.segments = []
+
+
+    def AddPages(self, named_trees, min_subtree_size=DEFAULT_MIN_SUBTREE_SIZE):
+        '''
+        Adds the (name, DOM tree) pairs to the index as a new segment.
+
+        Returns the ids of the added pages.
+        '''
+        postings = {}
+        names = []
+        for name, dom_tree in named_trees:
+            names.append(name)
+            for term, size in GetPageTerms(dom_tree, min_subtree_size).iteritems():
+                entry = postings.get(term)
+                if entry is None:
+                    postings[term] = [ size, [ len(names) - 1 ] ]
+                else:
+                    entry[1].append(len(names) - 1)
+        if len(names) == 0:
+            return []
+
+        with FileLock(os.path.join(self.index_dir, LOCK_FILENAME)):
+            manifest = self.ReadManifest()
+            first_page_id = manifest['page_count']
+            segment_name = GetNextSegmentName(manifest)
+            WriteSegment(os.path.join(self.index_dir, segment_name), first_page_id, len(names), [ (term, size, [ first_page_id + i for i in pages ]) for term, (size, pages) in postings.iteritems() ])
+            with open(os.path.join(self.index_dir, PAGES_FILENAME), 'a') as pages_file:
+                for i, name in enumerate(names):
+                    pages_file.write(json.dumps({ 'page_id': first_page_id + i, 'name': name }) + '\n')
+            manifest['segments'].append(segment_name)
+            manifest['page_count'] += len(names)
+            self.WriteManifest(manifest)
+        self.Reload()
+        return range(first_page_id, first_page_id + len(names))
+
+
+    def Merge(self):
+        '''
+        Merges all the segments into a single one.
+        '''
+        with FileLock(os.path.join(self.index_dir, LOCK_FILENAME)):
+            self.Reload()
+            manifest = self.ReadManifest()
+            if len(manifest['segments']) <= 1:
+                return
+            merged = {}
+            for segment in self.segments:
+                for i in xrange(segment.entry_count):
+                    kind, term_hash, _, _, _, size = segment.GetEntry(i)
+                    entry = merged.setdefault((kind, term_hash), [ size, [] ])
+                    entry[1].extend(segment.GetPostings(i))
+            segment_name = GetNextSegmentName(manifest)
+            WriteSegment(os.path.join(self.index_dir, segment_name), 0, manifest['page_count'], [ (term, size, pages) for term, (size, pages) in merged.iteritems() ])
+            old_segments = manifest['segments']
+            manifest['segments'] = [ segment_name ]
+            self.WriteManifest(manifest)
+            self.Close()
+            for name in old_segments:
+                os.remove(os.path.join(self.index_dir, name))
+            self.Reload()
+
+
+    def GetPages(self, term):
+        '''
+        Returns the sorted ids of the pages that contain the (kind, hash)
+        term.
+        '''
+        pages = []
+        for segment in self.segments:
+            i = segment.Find(term)
+            if i is not None:
+                pages.extend(segment.GetPostings(i))
+        return pages
+
+
+    def GetPagesWithNode(self, node):
+        '''
+        Returns the ids of the pages that contain a node equal to the node.
+        '''
+        return self.GetPages(GetNodeTerm(node))
+
+
+    def GetPagesWithSubtree(self, dom_tree, node):
+        '''
+        Returns the ids of the pages that contain the subtree of dom_tree
+        rooted at node. The subtrees that are smaller than the minimum size
+        of the index are not found, except for single nodes.
+        '''
+        return self.GetPages(GetSubtreeTerm(dom_tree, node))
+
+
+    def GetCoOccurringPages(self, terms):
+        '''
+        Returns the sorted ids of the pages that contain all the terms.
+        '''
+        postings = sorted([ self.GetPages(term) for term in terms ], key=len)
+        if len(postings) == 0:
+            return []
+        pages = postings[0]
+        for other in postings[1:]:
+            other_pages = set(other)
+            pages = [ p for p in pages if p in other_pages ]
+        return pages
+
+
+    def GetTopSubtrees(self, k, min_size=DEFAULT_MIN_SUBTREE_SIZE):
+        '''
+        Returns the k subtrees of at least min_size nodes that are in the
+        most pages, and then the largest ones, as maps with the keys hash,
+        size, page_count and first_page_id.
+
+        The top tables of the segments are read from their heads in turns,
+        and each subtree that is read is counted in all the segments. The
+        reading stops once no subtree that was not read can be in more pages
+        than the k-th one, which is the sum of the page counts at the heads,
+        so only the heads of the tables are read.
+        '''
+        if k <= 0:
+            return []
+        # A min-heap of the k best (page count, size, hash) that were read.
+        top = []
+        seen = set()
+        cursors = [ 0 ] * len(self.segments)
+        while True:
+            bound = 0
+            bound_size = 0
+            read_any = False
+            for s, segment in enumerate(self.segments):
+                entry = None
+                while cursors[s] < segment.top_count:
+                    entry = segment.GetEntry(segment.GetTopPosition(cursors[s]))
+                    cursors[s] += 1
+                    if entry[5] >= min_size:
+                        break
+                    entry = None
+                if entry is None:
+                    continue
+                read_any = True
+                _, term_hash, _, _, count, size = entry
+                bound += count
+                bound_size = size
+                if term_hash not in seen:
+                    seen.add(term_hash)
+                    item = (self.CountSubtreePages(term_hash), size, term_hash)
+                    if len(top) < k:
+                        heapq.heappush(top, item)
+                    elif item > top[0]:
+                        heapq.heapreplace(top, item)
+            if not read_any:
+                break
+            # A single table is in the order of the result, so the subtrees
+            # after its head are not better than the head. With several
+            # tables, a subtree after the heads may have the same count and
+            # a larger size.
+            if len(top) == k and top[0][:2] >= ((bound, bound_size) if len(self.segments) == 1 else (bound + 1, 0)):
+                break
+        return [ { 'hash': term_hash, 'size': size, 'page_count': count, 'first_page_id': self.GetPages((SUBTREE_KIND, term_hash))[0] } for count, size, term_hash in sorted(top, reverse=True) ]
+
+
+    def CountSubtreePages(self, term_hash):
+        '''
+        Returns the number of pages that contain the subtree with the hash.
+        '''
+        count = 0
+        for segment in self.segments:
+            i = segment.Find((SUBTREE_KIND, term_hash))
+            if i is not None:
+                count += segment.GetEntry(i)[4]
+        return count
+
+
+    def GetPageNames(self):
+        '''
+        Returns the names of the pages by their ids.
+        '''
+        names = [ None ] * self.page_count
+        pages_path = os.path.join(self.index_dir, PAGES_FILENAME)
+        if os.path.exists(pages_path):
+            with open(pages_path, 'r') as pages_file:
+                for line in pages_file:
+                    page = json.loads(line)
+                    if page['page_id'] < self.page_count:
+                        names[page['page_id']] = page['name']
+        return names
+
+
+    def ReadManifest(self):
+        try:
+            with open(os.path.join(self.index_dir, MANIFEST_FILENAME), 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return { 'version': INDEX_FORMAT_VERSION, 'segments': [], 'page_count': 0 }
+        if manifest['version'] != INDEX_FORMAT_VERSION:
+            raise ValueError('Unsupported index version: {0}'.format(manifest['version']))
+        return manifest
+
+
+    def WriteManifest(self, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=self.index_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.rename(tmp_path, os.path.join(self.index_dir, MANIFEST_FILENAME))
+
+
+def GetNextSegmentName(manifest):
+    '''
+    Returns a segment name that comes after the names of the segments in
+    the manifest.
+    '''
+    number = max([ int(name[:-len(SEGMENT_SUFFIX)]) for name in manifest['segments'] ] + [ -1 ]) + 1
+    return '{0:08d}{1}'.format(number, SEGMENT_SUFFIX)
+
+
+class _Segment(object):
+    '''
+    A memory-mapped segment of the index.
+    '''
+    def __init__(self, path):
+        self.segment_file = open(path, 'rb')
+        self.data = mmap.mmap(self.segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from('<4sI', self.data, 0)
+        if magic != SEGMENT_MAGIC or version != INDEX_FORMAT_VERSION:
+            raise ValueError('Not an index segment: {0}'.format(path))
+        _, _, self.entry_count, self.first_page_id, self.page_count, self.top_offset, self.top_count = struct.unpack_from(HEADER_FORMAT, self.data, 0)
+
+
+    def Close(self):
+        self.data.close()
+        self.segment_file.close()
+
+
+    def GetEntry(self, i):
+        return struct.unpack_from(ENTRY_FORMAT, self.data, HEADER_SIZE + i * ENTRY_SIZE)
+
+
+    def GetTopPosition(self, rank):
+        '''
+        Returns the position of the entry at the rank of the top table.
+        '''
+        return struct.unpack_from(TOP_FORMAT, self.data, self.top_offset + rank * TOP_SIZE)[0]
+
+
+    def Find(self, term):
+        '''
+        Returns the position of the entry of the (kind, hash) term, or None.
+        '''
+        low = self.LowerBound(term)
+        if low < self.entry_count and self.GetEntry(low)[:2] == term:
+            return low
+        return None
+
+
+    def FindKindStart(self, kind):
+        '''
+        Returns the position of the first entry of the kind.
+        '''
+        return self.LowerBound((kind, 0))
+
+
+    def LowerBound(self, term):
+        low = 0
+        high = self.entry_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.GetEntry(middle)[:2] < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+    def GetPostings(self, i):
+        '''
+        Returns the page ids of the entry.
+        '''
+        _, _, offset, length, _, _ = self.GetEntry(i)
+        return DecodeDeltas(self.data[offset:offset + length])
+
+
+def WriteSegment(path, first_page_id, page_count, postings):
+    '''
+    Writes the (term, size, page ids) postings into a new segment at path.
+    '''
+    postings = sorted(postings)
+    encoded = [ EncodeDeltas(pages) for _, _, pages in postings ]
+    top = sorted([ i for i, ((kind, _), _, _) in enumerate(postings) if kind == SUBTREE_KIND ], key=lambda i: (-len(postings[i][2]), -postings[i][1], i))
+    offset = HEADER_SIZE + len(postings) * ENTRY_SIZE
+    top_offset = offset + sum([ len(data) for data in encoded ])
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as segment_file:
+            segment_file.write(struct.pack(HEADER_FORMAT, SEGMENT_MAGIC, INDEX_FORMAT_VERSION, len(postings), first_page_id, page_count, top_offset, len(top)))
+            for ((kind, term_hash), size, pages), data in zip(postings, encoded):
+                segment_file.write(struct.pack(ENTRY_FORMAT, kind, term_hash, offset, len(data), len(pages), size))
+                offset += len(data)
+            for data in encoded:
+                segment_file.write(data)
+            for i in top:
+                segment_file.write(struct.pack(TOP_FORMAT, i))
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def EncodeDeltas(values):
+    '''
+    Returns the sorted values as the varints of their differences.
+    '''
+    encoded = bytearray()
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            encoded.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        encoded.append(delta)
+    return str(encoded)
+
+
+def DecodeDeltas(data):
+    values = []
+    value = 0
+    delta = 0
+    shift = 0
+    for byte in bytearray(data):
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        value += delta
+        values.append(value)
+        delta = 0
+        shift = 0
+    return values
+
+
+def GetNodeTerm(node):
+    return (NODE_KIND, ComputeFullKeyHash(node))
+
+
+def GetSubtreeTerm(dom_tree, node):
+    '''
+    Returns the term of the subtree rooted at node, which is the node term
+    when the node has no children.
+    '''
+    if len(dom_tree.GetChildren(node.id)) == 0:
+        return GetNodeTerm(node)
+    return (SUBTREE_KIND, ComputeStableSubtreeHashes(dom_tree, node)[node.id])
+
+
+def ComputeStableSubtreeHashes(dom_tree, root, key_hashes=None):
+    '''
+    Returns the id of each node in the subtree rooted at root to the hash
+    of its subtree. The hashes have the semantics of DOMTree.SubtreeHash
+    and are the same in every process.
+
+    The stable hashes of the nodes are kept in key_hashes by the keys of
+    the nodes for the caller, instead of in a global table, so indexing a
+    corpus does not keep the nodes of all its pages in memory.
+    '''
+    hashes = {}
+    if key_hashes is None:
+        key_hashes = {}
+    for node in reversed(list(dom_tree.IterSubtree(root))):
+        subtree_hash = key_hashes.get(node.key)
+        if subtree_hash is None:
+            subtree_hash = key_hashes[node.key] = ComputeFullKeyHash(node)
+        children = dom_tree.GetChildren(node.id)
+        for child in children:
+            subtree_hash = MixHash(subtree_hash, hashes[child.id])
+        hashes[node.id] = MixHash(subtree_hash, len(children))
+    return hashes
+
+
+def GetPageTerms(dom_tree, min_subtree_size=DEFAULT_MIN_SUBTREE_SIZE):
+    '''
+    Returns the distinct terms of the page, each with the size of its
+    subtree.
+    '''
+    terms = {}
+    if dom_tree.root_node is None:
+        return terms
+    key_hashes = {}
+    subtree_hashes = ComputeStableSubtreeHashes(dom_tree, dom_tree.root_node, key_hashes)
+    for node in dom_tree.IterSubtree(dom_tree.root_node):
+        terms[(NODE_KIND, key_hashes[node.key])] = 1
+        size = dom_tree.SubtreeSize(node)
+        if size >= min_subtree_size:
+            terms[(SUBTREE_KIND, subtree_hashes[node.id])] = size
+    return terms
+
+
+def Main():
+    index = CorpusIndex(args.index_dir)
+    filenames = list(args.add)
+    if args.add_list is not None:
+        with open(args.add_list, 'r') as list_file:
+            filenames.extend([ line.strip() for line in list_file if line.strip() != '' ])
+    for start in xrange(0, len(filenames), args.batch_size):
+        batch = filenames[start:start + args.batch_size]
+        page_ids = index.AddPages(((f, utils.GetDOMTree(f, args.hdp, args.raw_html, html_parser=args.html_parser)) for f in batch), args.min_subtree_size)
+        # The trees of the batch are gone, so the keys they interned are
+        # released before the next batch.
+        interning.ResetInternTables()
+        print 'ADDED: {0} pages, ids {1}-{2}'.format(len(page_ids), page_ids[0], page_ids[-1])
+    if args.merge:
+        index.Merge()
+        print 'MERGED'
+
+    if args.query is not None:
+        query_tree = utils.GetDOMTree(args.query, args.hdp, args.raw_html, html_parser=args.html_parser)
+        if args.query_node_id is None:
+            query_nodes = [ query_tree.root_node ]
+        else:
+            query_nodes = [ n for n in query_tree.IterSubtree(query_tree.root_node) if n.id in args.query_node_id ]
+        start = time.time()
+        terms = [ GetSubtreeTerm(query_tree, n) for n in query_nodes ]
+        pages = index.GetCoOccurringPages(terms)
+        elapsed = time.time() - start
+        names = index.GetPageNames()
+        for page_id in pages:
+            print '{0} {1}'.format(page_id, names[page_id])
+        print 'FOUND: {0} pages in {1:.2f}ms'.format(len(pages), elapsed * 1000)
+
+    if args.top_k is not None:
+        start = time.time()
+        top = index.GetTopSubtrees(args.top_k, args.min_subtree_size)
+        elapsed = time.time() - start
+        for t in top:
+            print json.dumps(t, sort_keys=True)
+        print 'TOP: {0} subtrees in {1:.2f}ms'.format(len(top), elapsed * 1000)
+    index.Close()
+
+
+def CreateArgumentParser():
+    '''
+    Returns the parser of the command line arguments of Main.
+    '''
+    parser = ArgumentParser()
+    parser.add_argument('index_dir')
+    parser.add_argument('--add', default=[], nargs='*', help='dom tree files to add to the index')
+    parser.add_argument('--add-list', default=None, help='file with one dom tree file to add per line')
+    parser.add_argument('--batch-size', default=DEFAULT_BATCH_SIZE, type=int, help='the number of pages in each new segment')
+    parser.add_argument('--merge', default=False, action='store_true', help='merge the segments into one')
+    parser.add_argument('--query', default=None, help='dom tree file with the subtrees to look up')
+    parser.add_argument('--query-node-id', default=None, type=int, nargs='+', help='the roots of the subtrees to look up, all of which the pages must contain; the root of the query tree by default')
+    parser.add_argument('--top-k', default=None, type=int, help='print the subtrees that are in the most pages')
+    parser.add_argument('--min-subtree-size', default=DEFAULT_MIN_SUBTREE_SIZE, type=int)
+    parser.add_argument('--hdp', default=False, action='store_true')
+    parser.add_argument('--raw-html', default=False, action='store_true')
+    parser.add_argument('--html-parser', default=DEFAULT_HTML_PARSER, choices=HTML_PARSERS)
+    return parser
+
+
+if __name__ == '__main__':
+    args = CreateArgumentParser().parse_args()
+    Main()
@@ -0,0 +1,111 @@
+from DOMTree import DOMTree
+
+import corpus_index
+import dom_generator
+import fingerprint
+import shutil
+import tempfile
+import unittest
+
+PAGES = [
+    '<html><body><div class="widget"><p>a</p><p>b</p></div><span>x</span></body></html>',
+    '<html><body><span>x</span><ul><li>1</li></ul></body></html>',
+    '<html><body><ul><li>1</li></ul><div class="widget"><p>a</p><p>b</p></div></body></html>',
+    '<html><body><div class="widget"><p>a</p><p>c</p></div><ul><li>1</li></ul></body></html>',
+]
+
+class TestCorpusIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.trees = [ DOMTree(html) for html in PAGES ]
+
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+
+    def FindNode(self, dom_tree, node_type, class_name=None):
+        for node in dom_tree.IterSubtree(dom_tree.root_node):
+            if node.type == node_type and (class_name is None or node.attributes.get('class') == class_name):
+                return node
+
+
+    def test_deltas(self):
+        values = [ 0, 1, 127, 128, 300, 70000, 2 ** 33 ]
+        self.assertEqual(values, corpus_index.DecodeDeltas(corpus_index.EncodeDeltas(values)))
+
+
+    def test_queries(self):
+        index = corpus_index.CorpusIndex(self.index_dir)
+        self.assertEqual([ 0, 1 ], index.AddPages([ ('p0', self.trees[0]), ('p1', self.trees[1]) ]))
+        # Pages are appended in a new segment.
+        self.assertEqual([ 2, 3 ], index.AddPages([ ('p2', self.trees[2]), ('p3', self.trees[3]) ]))
+        self.assertEqual(2, len(index.segments))
+
+        widget = self.FindNode(self.trees[0], 'div', 'widget')
+        ul = self.FindNode(self.trees[1], 'ul')
+        span = self.FindNode(self.trees[0], 'span')
+        for i in range(2):
+            self.assertEqual([ 0, 2 ], index.GetPagesWithSubtree(self.trees[0], widget))
+            self.assertEqual([ 1, 2, 3 ], index.GetPagesWithSubtree(self.trees[1], ul))
+            # The node alone is in every page with the widget class.
+            self.assertEqual([ 0, 2, 3 ], index.GetPagesWithNode(widget))
+            self.assertEqual([ 0, 1 ], index.GetPagesWithSubtree(self.trees[0], span))
+            self.assertEqual([ 2 ], index.GetCoOccurringPages([ corpus_index.GetSubtreeTerm(self.trees[0], widget), corpus_index.GetSubtreeTerm(self.trees[1], ul) ]))
+            self.assertEqual([], index.GetPagesWithSubtree(DOMTree('<div><b>none</b></div>'), DOMTree('<div><b>none</b></div>').root_node))
+
+            top = index.GetTopSubtrees(1, min_size=3)
+            self.assertEqual([ (3, 2, 0) ], [ (t['size'], t['page_count'], t['first_page_id']) for t in top ])
+            top = index.GetTopSubtrees(2)
+            self.assertEqual([ (2, 3, 1), (3, 2, 0) ], [ (t['size'], t['page_count'], t['first_page_id']) for t in top ])
+            self.assertEqual([ 'p0', 'p1', 'p2', 'p3' ], index.GetPageNames())
+
+            # The same results after the segments are merged and the index
+            # is opened again.
+            index.Merge()
+            self.assertEqual(1, len(index.segments))
+            index.Close()
+            index = corpus_index.CorpusIndex(self.index_dir)
+        self.assertEqual([ 4 ], index.AddPages([ ('p4', self.trees[0]) ]))
+        self.assertEqual([ 0, 2, 4 ], index.GetPagesWithSubtree(self.trees[0], widget))
+        index.Close()
+
+
+
+    def test_top_subtrees(self):
+        '''
+        Tests that the top subtrees read from the heads of the top tables
+        are the top subtrees of all the terms, and that indexing does not
+        keep the node hashes in the global table.
+        '''
+        generator = dom_generator.PageGenerator(seed=3, depth=4, mutation_rate=0.2)
+        page = generator.GeneratePage()
+        trees = []
+        for i in range(12):
+            page = generator.MutatePage(page)
+            trees.append(DOMTree(dom_generator.ToDevToolsJSON(page)['result']['root']))
+        index = corpus_index.CorpusIndex(self.index_dir)
+        hash_count = len(fingerprint._full_key_hashes)
+        for start in range(0, len(trees), 5):
+            index.AddPages([ ('p{0}'.format(i), trees[i]) for i in range(start, min(start + 5, len(trees))) ])
+        self.assertEqual(hash_count, len(fingerprint._full_key_hashes))
+
+        for merge in [ False, True ]:
+            if merge:
+                index.Merge()
+            # The expected top subtrees from every subtree term of the pages.
+            page_counts = {}
+            for tree in trees:
+                for (kind, term_hash), size in corpus_index.GetPageTerms(tree).iteritems():
+                    if kind == corpus_index.SUBTREE_KIND:
+                        page_counts[term_hash] = (page_counts.get(term_hash, (0, size))[0] + 1, size)
+            for k, min_size in [ (1, 2), (5, 2), (5, 10), (1000, 2) ]:
+                expected = sorted([ (count, size) for count, size in page_counts.itervalues() if size >= min_size ], reverse=True)[:k]
+                top = index.GetTopSubtrees(k, min_size)
+                self.assertEqual(expected, [ (t['page_count'], t['size']) for t in top ])
+        index.Close()
+
+
+if __name__ == '__main__':
+    unittest.main()
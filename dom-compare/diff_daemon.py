@@ -0,0 +1,476 @@
+from argparse import ArgumentParser
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import deque, OrderedDict
+from diff_stats import DiffStats, DIFF_PHASE, Phase
+from dom_snapshot import GetSnapshotResult
+from DOMTree import DOMTree
+from find_tree_diff import PreparedBaseline
+from html_parsers import DEFAULT_HTML_PARSER, HTML_PARSERS
+from interning import DEFAULT_MAX_INTERNED_KEYS
+from moved_subtrees import DEFAULT_MIN_MOVED_SIZE
+from sibling_alignment import DEFAULT_LINEAR_SPACE_WIDTH, LCS_ENGINE
+from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+from tree_cache import DEFAULT_MAX_BYTES, TreeCache
+
+import find_tree_diff
+import interning
+import json
+import moved_subtrees
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import utils
+
+# The number of built trees and prepared baselines that are kept in memory.
+DEFAULT_MAX_TREES = 64
+DEFAULT_MAX_BASELINES = 16
+
+# The number of the most recent request latencies the percentiles are
+# computed from.
+LATENCY_WINDOW = 10000
+
+# The options of a diff request and their defaults, which are the defaults
+# of find_tree_diff.
+REQUEST_OPTIONS = {
+    'hdp': False,
+    'only_structure': False,
+    'alignment_engine': LCS_ENGINE,
+    'linear_space_width': DEFAULT_LINEAR_SPACE_WIDTH,
+    'raw_html': False,
+    'html_parser': DEFAULT_HTML_PARSER,
+    'compact_tree': False,
+    'detect_moves': False,
+    'min_moved_size': DEFAULT_MIN_MOVED_SIZE,
+    'dump_common_tree': None,
+    'dump_missing_nodes': None,
+    'dump_moved_nodes': None,
+    'stats': False,
+}
+
+# The options that write files, whose paths are relative to the dump
+# directory of the daemon.
+DUMP_OPTIONS = [ 'dump_common_tree', 'dump_missing_nodes', 'dump_moved_nodes' ]
+
+# The only content type of the requests POSTed over HTTP. A web page cannot
+# POST it to another origin without a preflight, which is not answered.
+JSON_CONTENT_TYPE = 'application/json'
+
+DIFF_COMMAND = 'diff'
+METRICS_COMMAND = 'metrics'
+PING_COMMAND = 'ping'
+
+class ComparisonService(object):
+    '''
+    Runs the diff requests of the daemon with the built trees and the
+    prepared baselines kept in memory between the requests.
+
+    A request is a map with the command, diff by default. A diff request
+    names the testing tree with dom_tree_a and the correct tree with
+    dom_tree_b, as in find_tree_diff, or passes them inline with
+    dom_json_a and dom_json_b, which are DOM.getDocument or
+    DOMSnapshot.captureSnapshot results, or with dom_html_a and dom_html_b.
+    The other keys are the options of find_tree_diff in REQUEST_OPTIONS and
+    an id that is copied to the response. The dump options name files in
+    dump_dir, and are rejected when there is no dump_dir. The trees read from files are
+    kept in a LRU keyed by the path, the modification time and the options
+    they were built with, so a file that changed is built again. The
+    inline trees are not kept. The requests may run concurrently.
+
+    The trees share the intern tables of the process, which keep every
+    distinct key of the trees that were built, so evicting a tree does not
+    release its keys. Once the tables have more than max_interned_keys
+    entries, the service waits for the running requests, drops all the
+    resident trees and baselines and resets the tables.
+    '''
+    def __init__(self, max_trees=DEFAULT_MAX_TREES, max_baselines=DEFAULT_MAX_BASELINES, cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, max_interned_keys=DEFAULT_MAX_INTERNED_KEYS, dump_dir=None):
+        self.trees = _LRU(max_trees)
+        self.baselines = _LRU(max_baselines)
+        self.max_interned_keys = max_interned_keys
+        self.dump_dir = os.path.realpath(dump_dir) if dump_dir is not None else None
+        self.cache = TreeCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+        self.lock = threading.Lock()
+        # The locks of the trees and the baselines that are being built.
+        self.build_locks = {}
+        self.started = time.time()
+        self.counters = { 'requests': 0, 'errors': 0, 'tree_hits': 0, 'tree_misses': 0, 'baseline_hits': 0, 'baseline_misses': 0, 'intern_resets': 0 }
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        # The number of running diff requests, and whether the intern tables
+        # are waiting for them to be reset. No request starts meanwhile.
+        self.generation_condition = threading.Condition(threading.Lock())
+        self.running_requests = 0
+        self.resetting = False
+
+
+    def Handle(self, request):
+        '''
+        Returns the response to the request. Errors are reported in the
+        response instead of being raised.
+        '''
+        command = request.get('command', DIFF_COMMAND)
+        if command == PING_COMMAND:
+            return { 'ok': True }
+        if command == METRICS_COMMAND:
+            return self.GetMetrics()
+
+        start = time.time()
+        response = { 'error': None }
+        if 'id' in request:
+            response['id'] = request['id']
+        try:
+            if command != DIFF_COMMAND:
+                raise ValueError('Unknown command: {0}'.format(command))
+            self.StartRequest()
+            try:
+                self.Diff(request, response)
+            finally:
+                self.FinishRequest()
+        except Exception as e:
+            response['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        self.ResetInternTablesIfFull()
+        latency = time.time() - start
+        response['latency_ms'] = latency * 1000
+        with self.lock:
+            self.counters['requests'] += 1
+            if response['error'] is not None:
+                self.counters['errors'] += 1
+            self.latencies.append(latency)
+        return response
+
+
+    def Diff(self, request, response):
+        '''
+        Runs the diff of the request and adds its result to the response.
+        '''
+        options = dict(REQUEST_OPTIONS)
+        for option in REQUEST_OPTIONS:
+            if option in request:
+                options[option] = request[option]
+        dump_paths = { option: self.GetDumpPath(options[option]) for option in DUMP_OPTIONS if options[option] is not None }
+        stats = DiffStats() if options['stats'] else None
+
+        testing_dom, _ = self.GetTree(request, 'a', options, stats)
+        correct_dom, correct_key = self.GetTree(request, 'b', options, stats)
+        baseline = self.GetBaseline(correct_dom, correct_key, options)
+        # The baseline may outlive its tree in the LRU, and was built from an
+        # identical one.
+        correct_dom = baseline.correct_dom
+
+        added_nodes = [] if options['detect_moves'] else None
+        with Phase(stats, DIFF_PHASE):
+            common_dom_tree, missing_nodes = baseline.Diff(testing_dom, stats=stats, added_nodes=added_nodes)
+        moved = []
+        if options['detect_moves']:
+            moved, missing_nodes, added_nodes = moved_subtrees.FindMovedSubtrees(correct_dom, testing_dom, missing_nodes, added_nodes, options['only_structure'], options['min_moved_size'])
+            response['moved_count'] = len(moved)
+        response['common_size'] = common_dom_tree.size
+        response['testing_size'] = testing_dom.size
+        response['missing_count'] = len(missing_nodes)
+
+        if 'dump_common_tree' in dump_paths:
+            find_tree_diff.DumpCommonTree(common_dom_tree, dump_paths['dump_common_tree'])
+        if 'dump_missing_nodes' in dump_paths:
+            find_tree_diff.DumpMissingNodes(missing_nodes, dump_paths['dump_missing_nodes'])
+        if 'dump_moved_nodes' in dump_paths:
+            find_tree_diff.DumpMovedNodes(moved, dump_paths['dump_moved_nodes'])
+        if stats is not None:
+            response['stats'] = stats.ToRecord()
+
+
+    def GetDumpPath(self, filename):
+        '''
+        Returns the path of the dump file with the given name in the dump
+        directory. Raises ValueError when there is no dump directory or the
+        file is outside of it.
+        '''
+        if self.dump_dir is None:
+            raise ValueError('The dump options need the daemon to run with --dump-dir')
+        path = os.path.realpath(os.path.join(self.dump_dir, filename))
+        if not path.startswith(self.dump_dir + os.sep):
+            raise ValueError('The dump file is outside of the dump directory: {0}'.format(filename))
+        return path
+
+
+    def GetTree(self, request, side, options, stats):
+        '''
+        Returns the tree of the side of the request, a or b, and its key in
+        the LRU, which is None for the inline trees.
+        '''
+        if 'dom_json_' + side in request:
+            dom_json = request['dom_json_' + side]
+            snapshot = GetSnapshotResult(dom_json)
+            return DOMTree(snapshot if snapshot is not None else dom_json['result']['root'], options['hdp']), None
+        if 'dom_html_' + side in request:
+            return DOMTree(request['dom_html_' + side], options['hdp'], options['html_parser']), None
+
+        filename = os.path.abspath(request['dom_tree_' + side])
+        file_stat = os.stat(filename)
+        key = (filename, file_stat.st_mtime, file_stat.st_size, bool(options['hdp']), bool(options['raw_html']), options['html_parser'] if options['raw_html'] else None, bool(options['compact_tree']))
+        dom_tree = self.GetOrBuild(self.trees, key, 'tree', lambda: utils.GetDOMTree(filename, options['hdp'], options['raw_html'], html_parser=options['html_parser'], compact=options['compact_tree'], cache=self.cache, stats=stats))
+        return dom_tree, key
+
+
+    def GetBaseline(self, correct_dom, correct_key, options):
+        '''
+        Returns the PreparedBaseline of the correct tree with the options.
+        '''
+        if correct_key is None:
+            return PreparedBaseline(correct_dom, options['only_structure'], options['alignment_engine'], options['linear_space_width'])
+        key = (correct_key, bool(options['only_structure']), options['alignment_engine'], options['linear_space_width'])
+        return self.GetOrBuild(self.baselines, key, 'baseline', lambda: PreparedBaseline(correct_dom, options['only_structure'], options['alignment_engine'], options['linear_space_width']))
+
+
+    def GetOrBuild(self, lru, key, counter, build):
+        '''
+        Returns the value of the key in the LRU, built with build when it is
+        not there. The concurrent requests for the same key wait for a
+        single build.
+        '''
+        with self.lock:
+            key_lock = self.build_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            value = lru.Get(key)
+            if value is not None:
+                self.Count(counter + '_hits')
+                return value
+            self.Count(counter + '_misses')
+            value = build()
+            lru.Put(key, value)
+            with self.lock:
+                self.build_locks.pop(key, None)
+            return value
+
+
+    def StartRequest(self):
+        with self.generation_condition:
+            while self.resetting:
+                self.generation_condition.wait()
+            self.running_requests += 1
+
+
+    def FinishRequest(self):
+        with self.generation_condition:
+            self.running_requests -= 1
+            if self.running_requests == 0:
+                self.generation_condition.notify_all()
+
+
+    def ResetInternTablesIfFull(self):
+        '''
+        Drops the resident trees and baselines and resets the intern tables
+        when they have more than max_interned_keys entries. The reset waits
+        for the running requests, as their trees use the old ids.
+        '''
+        if interning.GetInternedKeyCount() <= self.max_interned_keys:
+            return
+        with self.generation_condition:
+            if self.resetting:
+                return
+            self.resetting = True
+            try:
+                while self.running_requests > 0:
+                    self.generation_condition.wait()
+                if interning.GetInternedKeyCount() > self.max_interned_keys:
+                    self.trees.Clear()
+                    self.baselines.Clear()
+                    interning.ResetInternTables()
+                    self.Count('intern_resets')
+            finally:
+                self.resetting = False
+                self.generation_condition.notify_all()
+
+
+    def Count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+    def GetMetrics(self):
+        '''
+        Returns the counters, the percentiles of the recent request latencies,
+        the number of resident trees and baselines and the sizes of the intern
+        tables.
+        '''
+        with self.lock:
+            metrics = dict(self.counters)
+            latencies = sorted(self.latencies)
+        metrics['uptime_seconds'] = time.time() - self.started
+        metrics['resident_trees'] = len(self.trees)
+        metrics['resident_baselines'] = len(self.baselines)
+        metrics['intern_generation'] = interning.GetGeneration()
+        metrics['intern_table_sizes'] = interning.GetTableSizes()
+        metrics['interned_keys'] = sum(metrics['intern_table_sizes'].values())
+        for name, fraction in [ ('p50', 0.5), ('p90', 0.9), ('p99', 0.99) ]:
+            metrics['latency_{0}_ms'.format(name)] = latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000 if len(latencies) > 0 else None
+        metrics['latency_max_ms'] = latencies[-1] * 1000 if len(latencies) > 0 else None
+        return metrics
+
+
+class _LRU(object):
+    '''
+    A thread-safe map that keeps the max_size most recently used entries.
+    '''
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def Get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is not None:
+                self.entries[key] = value
+            return value
+
+    def Put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def Clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class UnixSocketServer(ThreadingMixIn, UnixStreamServer):
+    '''
+    Serves the requests over a Unix socket, one JSON request per line and
+    one JSON response per line. A connection may send many requests.
+    '''
+    daemon_threads = True
+
+    def __init__(self, socket_path, service):
+        self.service = service
+        UnixStreamServer.__init__(self, socket_path, _UnixSocketHandler)
+
+
+class _UnixSocketHandler(StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if line.strip() == '':
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = { 'error': 'ValueError: {0}'.format(e) }
+            else:
+                response = self.server.service.Handle(request)
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+
+class LocalHTTPServer(ThreadingMixIn, HTTPServer):
+    '''
+    Serves the requests over HTTP on localhost. A request is POSTed as JSON
+    and the metrics are at GET /metrics. The requests must have the JSON
+    content type, and the requests of the web pages of other origins are
+    rejected.
+    '''
+    daemon_threads = True
+
+    def __init__(self, port, service):
+        self.service = service
+        HTTPServer.__init__(self, ('127.0.0.1', port), _HTTPHandler)
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.Respond(200, self.server.service.GetMetrics())
+        elif self.path == '/ping':
+            self.Respond(200, { 'ok': True })
+        else:
+            self.Respond(404, { 'error': 'Not found: {0}'.format(self.path) })
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        if self.headers.gettype() != JSON_CONTENT_TYPE:
+            self.Respond(415, { 'error': 'The content type must be {0}'.format(JSON_CONTENT_TYPE) })
+            return
+        origin = self.headers.getheader('origin')
+        if origin is not None and origin not in self.GetOwnOrigins():
+            self.Respond(403, { 'error': 'Forbidden origin: {0}'.format(origin) })
+            return
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            self.Respond(400, { 'error': 'ValueError: {0}'.format(e) })
+            return
+        self.Respond(200, self.server.service.Handle(request))
+
+    def GetOwnOrigins(self):
+        port = self.server.server_address[1]
+        return [ 'http://127.0.0.1:{0}'.format(port), 'http://localhost:{0}'.format(port) ]
+
+    def Respond(self, status, response):
+        body = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def SendRequest(socket_path, request):
+    '''
+    Sends the request to the daemon on the Unix socket and returns the
+    response.
+    '''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request) + '\n')
+        return json.loads(client.makefile('r').readline())
+    finally:
+        client.close()
+
+
+def Main():
+    if args.send is not None:
+        print json.dumps(SendRequest(args.socket, json.loads(args.send)), sort_keys=True)
+        return
+
+    service = ComparisonService(args.max_trees, args.max_baselines, args.cache_dir, args.cache_max_bytes, args.max_interned_keys, args.dump_dir)
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixSocketServer(args.socket, service)
+        print 'LISTENING: ' + args.socket
+    else:
+        server = LocalHTTPServer(args.port, service)
+        print 'LISTENING: http://127.0.0.1:{0}'.format(server.server_address[1])
+    # SIGTERM stops the daemon as Ctrl-C does, so the socket is removed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--socket', default=None, help='path of the Unix socket to listen on')
+    parser.add_argument('--port', default=8765, type=int, help='localhost port of the HTTP server, when there is no socket')
+    parser.add_argument('--max-trees', default=DEFAULT_MAX_TREES, type=int, help='the number of built trees kept in memory')
+    parser.add_argument('--max-baselines', default=DEFAULT_MAX_BASELINES, type=int, help='the number of prepared baselines kept in memory')
+    parser.add_argument('--cache-dir', default=None, help='directory of the on-disk cache of built DOM trees')
+    parser.add_argument('--cache-max-bytes', default=DEFAULT_MAX_BYTES, type=int)
+    parser.add_argument('--max-interned-keys', default=DEFAULT_MAX_INTERNED_KEYS, type=int, help='drop the resident trees and reset the intern tables above this many entries')
+    parser.add_argument('--dump-dir', default=None, help='directory of the files written by the dump options of the requests, which are rejected without it')
+    parser.add_argument('--send', default=None, help='send this JSON request to the daemon on --socket and print the response')
+    args = parser.parse_args()
+    Main()
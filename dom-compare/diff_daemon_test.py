@@ -0,0 +1,206 @@
+from DOMTree import DOMTree
+
+import diff_daemon
+import dom_generator
+import DOMNode
+import find_tree_diff
+import interning
+import json
+import os
+import shutil
+import signature_trie
+import sys
+import tempfile
+import threading
+import unittest
+import urllib2
+import utils
+
+class TestDiffDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = dom_generator.WritePagePair(self.tmp_dir, dom_generator.PageGenerator(seed=5, depth=5))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def GetExpected(self):
+        dom_a = utils.GetDOMTree(self.paths['a_json'], False)
+        dom_b = utils.GetDOMTree(self.paths['b_json'], False)
+        common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(dom_b, dom_a)
+        return common_dom_tree.size, dom_a.size, len(missing_nodes)
+
+
+    def test_warm_trees(self):
+        '''
+        Tests that the trees and the baselines are reused and evicted, and
+        that the inline trees give the same result.
+        '''
+        service = diff_daemon.ComparisonService(max_trees=2)
+        request = { 'dom_tree_a': self.paths['a_json'], 'dom_tree_b': self.paths['b_json'], 'id': 7 }
+        expected = self.GetExpected()
+        for i in range(2):
+            response = service.Handle(request)
+            self.assertEqual(None, response['error'])
+            self.assertEqual(7, response['id'])
+            self.assertEqual(expected, (response['common_size'], response['testing_size'], response['missing_count']))
+        metrics = service.GetMetrics()
+        self.assertEqual((2, 2, 1, 1), (metrics['tree_hits'], metrics['tree_misses'], metrics['baseline_hits'], metrics['baseline_misses']))
+
+        # The same files with other options are other trees.
+        response = service.Handle(dict(request, hdp=True, stats=True))
+        self.assertTrue('phases' in response['stats'])
+        self.assertEqual(2, service.GetMetrics()['resident_trees'])
+
+        with open(self.paths['a_json'], 'r') as input_file:
+            dom_json_a = json.load(input_file)
+        response = service.Handle({ 'dom_json_a': dom_json_a, 'dom_tree_b': self.paths['b_json'] })
+        self.assertEqual(expected, (response['common_size'], response['testing_size'], response['missing_count']))
+
+        response = service.Handle({ 'dom_tree_a': os.path.join(self.tmp_dir, 'missing.json'), 'dom_tree_b': self.paths['b_json'] })
+        self.assertTrue(response['error'].startswith('OSError'))
+        metrics = service.GetMetrics()
+        self.assertEqual(5, metrics['requests'])
+        self.assertEqual(1, metrics['errors'])
+        self.assertTrue(metrics['latency_max_ms'] >= metrics['latency_p50_ms'] > 0)
+
+
+    def test_concurrent_builds(self):
+        '''
+        Tests that the trees built on concurrent requests get distinct
+        interned ids for distinct keys and signatures.
+        '''
+        interning.ResetInternTables()
+        service = diff_daemon.ComparisonService()
+        requests = []
+        for i in range(16):
+            output_dir = os.path.join(self.tmp_dir, str(i))
+            os.mkdir(output_dir)
+            paths = dom_generator.WritePagePair(output_dir, dom_generator.PageGenerator(seed=i, depth=4))
+            requests.append({ 'dom_tree_a': paths['a_json'], 'dom_tree_b': paths['b_json'], 'id': i })
+
+        responses = {}
+        def Send(request):
+            responses[request['id']] = service.Handle(request)
+        check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [ threading.Thread(target=Send, args=(r,)) for r in requests ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(check_interval)
+
+        for key_ids in [ DOMNode._node_key_ids, DOMNode._structure_key_ids, signature_trie._signature_ids ]:
+            self.assertEqual(len(key_ids), len(set(key_ids.values())))
+        self.assertEqual(len(signature_trie._signature_entries), len(signature_trie._signature_ids) + 1)
+        for request in requests:
+            response = responses[request['id']]
+            dom_a = utils.GetDOMTree(request['dom_tree_a'], False)
+            dom_b = utils.GetDOMTree(request['dom_tree_b'], False)
+            common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(dom_b, dom_a)
+            self.assertEqual((common_dom_tree.size, len(missing_nodes)), (response['common_size'], response['missing_count']))
+
+
+    def test_intern_reset(self):
+        '''
+        Tests that the resident trees are dropped and the intern tables are
+        reset once they are over their size, and that the results do not
+        change.
+        '''
+        service = diff_daemon.ComparisonService(max_interned_keys=1)
+        request = { 'dom_tree_a': self.paths['a_json'], 'dom_tree_b': self.paths['b_json'], 'stats': True }
+        expected = self.GetExpected()
+        generation = interning.GetGeneration()
+        for i in range(2):
+            response = service.Handle(request)
+            self.assertEqual(expected, (response['common_size'], response['testing_size'], response['missing_count']))
+        metrics = service.GetMetrics()
+        self.assertEqual(2, metrics['intern_resets'])
+        self.assertEqual(generation + 2, metrics['intern_generation'])
+        self.assertEqual(0, metrics['resident_trees'])
+        self.assertEqual(0, metrics['intern_table_sizes']['node_keys'])
+        self.assertEqual(4, metrics['tree_misses'])
+
+
+    def CreateHTTPRequest(self, url, request, headers={}):
+        return urllib2.Request(url + '/', json.dumps(request), dict(headers, **{ 'Content-Type': 'application/json' }))
+
+
+    def test_dump_dir(self):
+        '''
+        Tests that the dump files are written in the dump directory, and that
+        the dump options are rejected without one or outside of it.
+        '''
+        request = { 'dom_tree_a': self.paths['a_json'], 'dom_tree_b': self.paths['b_json'], 'dump_missing_nodes': 'missing.json' }
+        response = diff_daemon.ComparisonService().Handle(request)
+        self.assertIn('--dump-dir', response['error'])
+
+        dump_dir = os.path.join(self.tmp_dir, 'dumps')
+        os.mkdir(dump_dir)
+        service = diff_daemon.ComparisonService(dump_dir=dump_dir)
+        self.assertIsNone(service.Handle(request)['error'])
+        self.assertTrue(os.path.exists(os.path.join(dump_dir, 'missing.json')))
+        for filename in [ '../missing.json', os.path.join(self.tmp_dir, 'missing.json'), '' ]:
+            response = service.Handle(dict(request, dump_common_tree=filename))
+            self.assertIn('outside of the dump directory', response['error'])
+            self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'missing.json')))
+
+
+    def test_servers(self):
+        '''
+        Tests the concurrent requests over the Unix socket and over HTTP.
+        '''
+        service = diff_daemon.ComparisonService()
+        socket_path = os.path.join(self.tmp_dir, 'daemon.sock')
+        servers = [ diff_daemon.UnixSocketServer(socket_path, service), diff_daemon.LocalHTTPServer(0, service) ]
+        for server in servers:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+        try:
+            expected = self.GetExpected()
+            request = { 'dom_tree_a': self.paths['a_json'], 'dom_tree_b': self.paths['b_json'] }
+            responses = []
+            def Send(i):
+                responses.append(diff_daemon.SendRequest(socket_path, dict(request, id=i)))
+            threads = [ threading.Thread(target=Send, args=(i,)) for i in range(4) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual([ 0, 1, 2, 3 ], sorted([ r['id'] for r in responses ]))
+            for response in responses:
+                self.assertEqual(expected, (response['common_size'], response['testing_size'], response['missing_count']))
+
+            url = 'http://127.0.0.1:{0}'.format(servers[1].server_address[1])
+            response = json.loads(urllib2.urlopen(self.CreateHTTPRequest(url, request)).read())
+            self.assertEqual(expected, (response['common_size'], response['testing_size'], response['missing_count']))
+            metrics = json.loads(urllib2.urlopen(url + '/metrics').read())
+            self.assertEqual(5, metrics['requests'])
+            self.assertEqual(2, metrics['tree_misses'])
+            self.assertEqual({ 'ok': True }, diff_daemon.SendRequest(socket_path, { 'command': 'ping' }))
+
+            # The requests that a web page can send are rejected.
+            for http_request, status in [
+                    (urllib2.Request(url + '/', json.dumps(request), { 'Content-Type': 'text/plain' }), 415),
+                    (urllib2.Request(url + '/', json.dumps(request)), 415),
+                    (self.CreateHTTPRequest(url, request, { 'Origin': 'http://example.com' }), 403) ]:
+                with self.assertRaises(urllib2.HTTPError) as context:
+                    urllib2.urlopen(http_request)
+                self.assertEqual(status, context.exception.code)
+            response = json.loads(urllib2.urlopen(self.CreateHTTPRequest(url, request, { 'Origin': url })).read())
+            self.assertIsNone(response['error'])
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
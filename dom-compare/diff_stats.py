@@ -0,0 +1,205 @@
+import os
+import resource
+import time
+
+# The phases of a comparison, in the order they run.
+LOAD_PHASE = 'load'
+PARSE_PHASE = 'parse'
+BUILD_PHASE = 'build'
+DIFF_PHASE = 'diff'
+DUMP_PHASE = 'dump'
+PHASES = [ LOAD_PHASE, PARSE_PHASE, BUILD_PHASE, DIFF_PHASE, DUMP_PHASE ]
+
+# The current resident set size is read from here, when there is one.
+STATM_PATH = '/proc/self/statm'
+# On Linux, writing 5 to clear_refs resets the peak resident set size, which
+# is VmHWM in the status file.
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+RESET_PEAK_RSS = '5'
+STATUS_PATH = '/proc/self/status'
+PEAK_RSS_FIELD = 'VmHWM:'
+PAGE_SIZE_KB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+
+class DiffStats(object):
+    '''
+    Collects the wall time and the memory of the phases of a comparison and
+    the counters of the hot paths.
+
+    Each phase has the seconds spent in it, peak_rss_kb, the highest
+    resident set size of the process during the phase, rss_delta_kb, the
+    change of the resident set size over the phase, and rss_end_kb, the
+    resident set size when the phase last ended. The peak is reset when a
+    phase starts, which is only possible on Linux, and the RSS fields are
+    None where they cannot be read. The peak covers the whole process, so
+    the phases of concurrent comparisons see each other's allocations. The
+    peak RSS of the process is reported once in the record as max_rss_kb.
+
+    The instrumented functions take an optional stats argument. When it is
+    None nothing is collected, so the instrumentation can be left in place.
+    The counters are:
+        nodes_equal_calls: the nodes compared while backtracking the LCS table.
+        lcs_cells: the cells of the LCS tables that were computed.
+        levels_visited: the pairs of parents whose children were aligned.
+        subtrees_matched: the pairs of subtrees that matched by their hash.
+        widest_sibling_list: the longest list of children that was aligned.
+        skipped_nodes: the nodes dropped by DOMTree.ShouldSkipNode.
+    '''
+    def __init__(self, callback=None):
+        '''
+        Params:
+            callback: called with the record of the comparison from Report.
+        '''
+        self.callback = callback
+        self.phases = {}
+        self.counters = {}
+        # The timers of the phases that are running, outermost first.
+        self.open_timers = []
+
+
+    def Phase(self, name):
+        '''
+        Returns a context manager that adds the time spent in it to the phase.
+        '''
+        return _PhaseTimer(self, name)
+
+
+    def AddPhaseTime(self, name, seconds, start_rss_kb=None, end_rss_kb=None, peak_rss_kb=None):
+        phase = self.phases.setdefault(name, { 'seconds': 0.0, 'peak_rss_kb': None, 'rss_delta_kb': None, 'rss_end_kb': None })
+        phase['seconds'] += seconds
+        if peak_rss_kb is not None:
+            phase['peak_rss_kb'] = max(phase['peak_rss_kb'], peak_rss_kb)
+        if start_rss_kb is not None and end_rss_kb is not None:
+            phase['rss_delta_kb'] = (phase['rss_delta_kb'] or 0) + end_rss_kb - start_rss_kb
+            phase['rss_end_kb'] = end_rss_kb
+
+
+    def Count(self, name, count=1):
+        '''
+        Adds count to the counter.
+        '''
+        self.counters[name] = self.counters.get(name, 0) + count
+
+
+    def Max(self, name, value):
+        '''
+        Sets the counter to value when value is larger.
+        '''
+        if value > self.counters.get(name, 0):
+            self.counters[name] = value
+
+
+    def ToRecord(self, **fields):
+        '''
+        Returns the record of the comparison with the given extra fields.
+        '''
+        record = dict(fields)
+        record['phases'] = self.phases
+        record['counters'] = self.counters
+        record['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return record
+
+
+    def Report(self, **fields):
+        '''
+        Passes the record of the comparison to the callback and returns it.
+        '''
+        record = self.ToRecord(**fields)
+        if self.callback is not None:
+            self.callback(record)
+        return record
+
+
+class _PhaseTimer(object):
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = None
+        self.start_rss_kb = None
+        # The peak RSS of the phase before the last reset of the peak, or
+        # None when the peak could not be reset.
+        self.peak_rss_kb = None
+
+    def __enter__(self):
+        # The enclosing phases keep their peak so far, as the reset drops it.
+        peak_rss_kb = GetPeakRSS()
+        for timer in self.stats.open_timers:
+            if timer.peak_rss_kb is not None:
+                timer.peak_rss_kb = max(timer.peak_rss_kb, peak_rss_kb)
+        self.stats.open_timers.append(self)
+        self.start_rss_kb = GetCurrentRSS()
+        self.peak_rss_kb = self.start_rss_kb if ResetPeakRSS() else None
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.time() - self.start
+        end_rss_kb = GetCurrentRSS()
+        peak_rss_kb = None
+        if self.peak_rss_kb is not None:
+            peak_rss_kb = max(self.peak_rss_kb, GetPeakRSS())
+        self.stats.open_timers.remove(self)
+        self.stats.AddPhaseTime(self.name, seconds, self.start_rss_kb, end_rss_kb, peak_rss_kb)
+
+
+class _NoPhase(object):
+    '''
+    The context manager of a phase when the stats are disabled.
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+def GetCurrentRSS():
+    '''
+    Returns the current resident set size of the process in KB, or None
+    when it cannot be read.
+    '''
+    try:
+        with open(STATM_PATH, 'r') as statm_file:
+            return int(statm_file.read().split()[1]) * PAGE_SIZE_KB
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+def ResetPeakRSS():
+    '''
+    Resets the peak resident set size of the process to the current one.
+    Returns whether it was reset.
+    '''
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as clear_refs_file:
+            clear_refs_file.write(RESET_PEAK_RSS)
+        return True
+    except IOError:
+        return False
+
+
+def GetPeakRSS():
+    '''
+    Returns the peak resident set size of the process in KB since the last
+    reset, or None when it cannot be read.
+    '''
+    try:
+        with open(STATUS_PATH, 'r') as status_file:
+            for line in status_file:
+                if line.startswith(PEAK_RSS_FIELD):
+                    return int(line.split()[1])
+    except (IOError, IndexError, ValueError):
+        pass
+    return None
+
+
+def Phase(stats, name):
+    '''
+    Returns the context manager of the phase, which does nothing when stats
+    is None.
+    '''
+    if stats is None:
+        return _NO_PHASE
+    return stats.Phase(name)
@@ -0,0 +1,111 @@
+from diff_stats import DiffStats, PHASES, Phase
+from DOMTree import DOMTree
+
+import diff_stats
+import find_tree_diff
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import utils
+
+DOM_A = '{"result":{"root":{"nodeId":1,"nodeName":"#document","children":[{"nodeId":2,"parentId":1,"nodeName":"DIV","attributes":["class","a b"],"children":[{"nodeId":3,"parentId":2,"nodeName":"#text","nodeValue":"hello"}]},{"nodeId":4,"parentId":1,"nodeName":"#comment","nodeValue":"c"},{"nodeId":5,"parentId":1,"nodeName":"SPAN","attributes":["id","x"]},{"nodeId":6,"parentId":1,"nodeName":"P"}]}}}'
+DOM_B = '{"result":{"root":{"nodeId":1,"nodeName":"#document","children":[{"nodeId":2,"parentId":1,"nodeName":"DIV","attributes":["class","b a"],"children":[{"nodeId":3,"parentId":2,"nodeName":"#text","nodeValue":"world"}]},{"nodeId":5,"parentId":1,"nodeName":"SPAN","attributes":["id","x"]}]}}}'
+
+class TestDiffStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dom_a = os.path.join(self.tmp_dir, 'a.json')
+        self.dom_b = os.path.join(self.tmp_dir, 'b.json')
+        with open(self.dom_a, 'w') as f:
+            f.write(DOM_A)
+        with open(self.dom_b, 'w') as f:
+            f.write(DOM_B)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def test_counters(self):
+        '''
+        Tests the counters of a comparison.
+        '''
+        records = []
+        stats = DiffStats(records.append)
+        dom_a = utils.GetDOMTree(self.dom_a, False, stats=stats)
+        dom_b = utils.GetDOMTree(self.dom_b, False, stats=stats)
+        find_tree_diff.CompareDOMTrees(dom_b, dom_a, stats=stats)
+        stats.Report(name='test')
+
+        self.assertEqual(1, len(records))
+        record = records[0]
+        self.assertEqual('test', record['name'])
+        for phase in [ 'load', 'parse', 'build', 'diff' ]:
+            self.assertTrue(record['phases'][phase]['seconds'] >= 0)
+            if os.path.exists('/proc/self/statm'):
+                self.assertTrue(record['phases'][phase]['rss_end_kb'] > 0)
+                self.assertNotEqual(None, record['phases'][phase]['rss_delta_kb'])
+        self.assertTrue(record['max_rss_kb'] > 0)
+        counters = record['counters']
+        # The comment of A is skipped.
+        self.assertEqual(1, counters['skipped_nodes'])
+        self.assertEqual(1, counters['levels_visited'])
+        self.assertEqual(3, counters['widest_sibling_list'])
+        self.assertEqual(2 * 3, counters['lcs_cells'])
+        self.assertTrue(counters['nodes_equal_calls'] > 0)
+
+
+    def test_phase_peak_rss(self):
+        '''
+        Tests that the peak RSS of a phase includes the memory that is freed
+        before the phase ends, and that an enclosing phase keeps the peak of
+        the phases it runs.
+        '''
+        if not diff_stats.ResetPeakRSS():
+            self.skipTest('the peak RSS cannot be reset')
+        stats = DiffStats()
+        size_kb = 64 * 1024
+        with Phase(stats, 'load'):
+            with Phase(stats, 'parse'):
+                buffer = bytearray(size_kb * 1024)
+                del buffer
+            with Phase(stats, 'build'):
+                pass
+        phases = stats.ToRecord()['phases']
+        self.assertGreater(phases['parse']['peak_rss_kb'] - phases['parse']['rss_end_kb'], size_kb // 2)
+        self.assertGreater(phases['load']['peak_rss_kb'] - phases['load']['rss_end_kb'], size_kb // 2)
+        self.assertLess(phases['build']['peak_rss_kb'] - phases['build']['rss_end_kb'], size_kb // 2)
+
+
+    def test_main(self):
+        '''
+        Tests that Main appends one record per comparison to the stats file.
+        '''
+        stats_file = os.path.join(self.tmp_dir, 'stats.jsonl')
+        find_tree_diff.args = find_tree_diff.CreateArgumentParser().parse_args([ self.dom_a, self.dom_b, '--stats-file', stats_file ])
+        find_tree_diff.Main()
+        find_tree_diff.Main()
+        with open(stats_file, 'r') as f:
+            records = [ json.loads(line) for line in f ]
+        self.assertEqual(2, len(records))
+        self.assertEqual(self.dom_a, records[0]['dom_tree_a'])
+        self.assertEqual(2, records[0]['common_size'])
+        self.assertEqual(1, records[0]['missing_count'])
+        self.assertEqual(set(PHASES), set(records[0]['phases'].keys()))
+
+
+    def test_disabled(self):
+        '''
+        Tests that the results do not depend on the stats.
+        '''
+        expected = find_tree_diff.CompareDOMTrees(utils.GetDOMTree(self.dom_b, False), utils.GetDOMTree(self.dom_a, False))
+        got = find_tree_diff.CompareDOMTrees(utils.GetDOMTree(self.dom_b, False), utils.GetDOMTree(self.dom_a, False), stats=DiffStats())
+        self.assertEqual(json.dumps(expected[0].Serialize()), json.dumps(got[0].Serialize()))
+        self.assertEqual([ n.id for n in expected[1] ], [ n.id for n in got[1] ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+from importlib import import_module
+
+import os
+import sys
+
+# The commands, in the order of the usage, with the module that implements
+# each one and the directory of the module relative to this file. Only the
+# module of the command that runs is imported, so the parsers and the other
+# modules that the other commands need are never loaded.
+COMMANDS = [
+    ('diff', 'find_tree_diff', '.', 'find the nodes of tree A that are missing in tree B'),
+    ('exists', 'check_dom_node_exists', 'old_scripts', 'count the nodes of each tree that exist in the other one'),
+    ('value-diff', 'find_nodes_diff_in_value', 'old_scripts', 'find the nodes whose value changed'),
+    ('batch', 'batch_tree_diff', '.', 'compare the pairs of trees of a manifest'),
+    ('index', 'corpus_index', '.', 'build and query the index of node and subtree hashes'),
+]
+
+def Main(argv):
+    commands = { c[0]: c for c in COMMANDS }
+    if len(argv) > 0 and argv[0] in ('-h', '--help'):
+        PrintUsage(sys.stdout)
+        return 0
+    if len(argv) == 0 or argv[0] not in commands:
+        PrintUsage(sys.stderr)
+        return 2
+
+    name, module_name, directory, _ = commands[argv[0]]
+    module = LoadCommandModule(module_name, directory)
+    parser = module.CreateArgumentParser()
+    parser.prog = '{0} {1}'.format(os.path.basename(sys.argv[0]), name)
+    # The scripts read their arguments from the global args of the module.
+    module.args = parser.parse_args(argv[1:])
+    module.Main()
+    return 0
+
+
+def LoadCommandModule(module_name, directory):
+    '''
+    Imports the module of a command from its directory.
+    '''
+    path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), directory))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return import_module(module_name)
+
+
+def PrintUsage(output_file):
+    output_file.write('usage: {0} <command> [<args>]\n\ncommands:\n'.format(os.path.basename(sys.argv[0])))
+    for name, _, _, description in COMMANDS:
+        output_file.write('  {0:<12}{1}\n'.format(name, description))
+    output_file.write('\nRun {0} <command> -h for the arguments of a command.\n'.format(os.path.basename(sys.argv[0])))
+
+
+if __name__ == '__main__':
+    sys.exit(Main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+DOM_A = '{"result":{"root":{"nodeId":1,"nodeName":"#document","children":[{"nodeId":2,"parentId":1,"nodeName":"DIV","attributes":["class","a b"],"children":[{"nodeId":3,"parentId":2,"nodeName":"#text","nodeValue":"hello"}]},{"nodeId":4,"parentId":1,"nodeName":"SPAN","attributes":["id","x"]}]}}}'
+DOM_B = '{"result":{"root":{"nodeId":1,"nodeName":"#document","children":[{"nodeId":2,"parentId":1,"nodeName":"DIV","attributes":["class","b a"],"children":[{"nodeId":3,"parentId":2,"nodeName":"#text","nodeValue":"world"}]},{"nodeId":4,"parentId":1,"nodeName":"SPAN","attributes":["id","x"]}]}}}'
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+class TestDOMCompare(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dom_a = os.path.join(self.tmp_dir, 'a.json')
+        self.dom_b = os.path.join(self.tmp_dir, 'b.json')
+        with open(self.dom_a, 'w') as f:
+            f.write(DOM_A)
+        with open(self.dom_b, 'w') as f:
+            f.write(DOM_B)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def RunCommand(self, command_args):
+        return subprocess.check_output([ sys.executable, os.path.join(DIRECTORY, 'dom_compare.py') ] + command_args, stderr=subprocess.STDOUT)
+
+
+    def test_commands(self):
+        '''
+        Tests that each command runs the Main of its script.
+        '''
+        self.assertEqual(self.RunCommand([ 'diff', self.dom_a, self.dom_b ]).splitlines()[-1], '2 3')
+        self.assertIn('Matched A: 2', self.RunCommand([ 'exists', self.dom_a, self.dom_b ]))
+        output = self.RunCommand([ 'value-diff', self.dom_a, self.dom_b ])
+        self.assertEqual(output.splitlines()[-1], '1 3')
+        self.assertIn('ADDED: 2 pages', self.RunCommand([ 'index', os.path.join(self.tmp_dir, 'index'), '--add', self.dom_a, self.dom_b ]))
+
+
+    def test_unknown_command(self):
+        '''
+        Tests that the usage is printed for a missing or unknown command.
+        '''
+        for command_args in [ [], [ 'merge' ] ]:
+            with self.assertRaises(subprocess.CalledProcessError) as context:
+                self.RunCommand(command_args)
+            self.assertEqual(context.exception.returncode, 2)
+            self.assertIn('value-diff', context.exception.output)
+
+
+    def test_json_diff_skips_heavy_modules(self):
+        '''
+        Tests that the diff of JSON dumps does not import the HTML parsers,
+        the streaming JSON parser or multiprocessing.
+        '''
+        script = '\n'.join([
+            'import os, sys',
+            'sys.stdout = open(os.devnull, "w")',
+            'import dom_compare',
+            'dom_compare.Main([ "diff", {0!r}, {1!r} ])'.format(self.dom_a, self.dom_b),
+            'sys.stdout = sys.__stdout__',
+            'print " ".join(sorted([ m for m in [ "bs4", "ijson", "multiprocessing" ] if m in sys.modules ]))',
+        ])
+        self.assertEqual(subprocess.check_output([ sys.executable, '-c', script ], cwd=DIRECTORY).strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,338 @@
+from argparse import ArgumentParser
+from cgi import escape
+
+import json
+import os
+import random
+
+# The tags used for the generated elements. The leaves are more likely to be
+# inline elements.
+CONTAINER_TAGS = [ 'div', 'section', 'ul', 'nav', 'article', 'main', 'aside' ]
+LEAF_TAGS = [ 'span', 'a', 'p', 'li', 'b', 'img', 'label' ]
+
+WORDS = [ 'lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod', 'tempor' ]
+
+class PageNode(object):
+    '''
+    A node of a generated page. The page is converted into the DevTools JSON
+    format or into HTML.
+    '''
+    __slots__ = [ 'id', 'name', 'attributes', 'text', 'children' ]
+
+    def __init__(self, node_id, name, attributes, text, children):
+        self.id = node_id
+        self.name = name
+        self.attributes = attributes
+        self.text = text
+        self.children = children
+
+
+class PageGenerator(object):
+    '''
+    Generates seeded pages and mutated copies of them.
+
+    Params:
+        seed: the seed of the random generator.
+        depth: the depth of the body subtree.
+        fan_out: the maximum number of children of an element.
+        text_size: the number of characters of the text of an element.
+        attribute_churn: the probability that an attribute value of an element
+            is changed in the mutated page.
+        mutation_rate: the probability that an element is removed, or that a
+            new element is inserted next to it, in the mutated page.
+        move_rate: the probability that an element is moved into another
+            container in the mutated page.
+    '''
+    def __init__(self, seed=0, depth=8, fan_out=6, text_size=20, attribute_churn=0.05, mutation_rate=0.05, move_rate=0.0):
+        self.random = random.Random(seed)
+        self.depth = depth
+        self.fan_out = fan_out
+        self.text_size = text_size
+        self.attribute_churn = attribute_churn
+        self.mutation_rate = mutation_rate
+        self.move_rate = move_rate
+        self.next_node_id = 1
+
+
+    def GeneratePage(self):
+        '''
+        Returns the root PageNode of a new page.
+        '''
+        head = self.NewNode('head', {}, '', [ self.NewNode('title', {}, self.GenerateText(), []) ])
+        body = self.NewNode('body', { 'class': 'page' }, '', self.GenerateChildren(self.depth))
+        html = self.NewNode('html', { 'lang': 'en' }, '', [ head, body ])
+        return self.NewNode('#document', {}, '', [ html ])
+
+
+    def GenerateChildren(self, depth):
+        '''
+        Returns the children of an element at the given remaining depth.
+        '''
+        if depth == 0:
+            return []
+        children = []
+        for i in xrange(self.random.randint(1, self.fan_out)):
+            children.append(self.GenerateElement(depth - 1))
+        return children
+
+
+    def GenerateElement(self, depth):
+        '''
+        Returns a new element with its subtree.
+        '''
+        if depth == 0 or self.random.random() < 0.2:
+            name = self.random.choice(LEAF_TAGS)
+            text = self.GenerateText() if name != 'img' else ''
+            return self.NewNode(name, self.GenerateAttributes(name), text, [])
+        name = self.random.choice(CONTAINER_TAGS)
+        return self.NewNode(name, self.GenerateAttributes(name), '', self.GenerateChildren(depth))
+
+
+    def GenerateAttributes(self, name):
+        '''
+        Returns the attributes of a new element.
+        '''
+        attributes = { 'class': '{0} {0}--{1}'.format(name, self.random.randint(0, 20)) }
+        if self.random.random() < 0.3:
+            attributes['id'] = '{0}-{1}'.format(name, self.next_node_id)
+        if name == 'a':
+            attributes['href'] = '/page/{0}'.format(self.random.randint(0, 1000))
+        elif name == 'img':
+            attributes['src'] = '/img/{0}.png'.format(self.random.randint(0, 1000))
+        if self.random.random() < 0.05:
+            attributes['style'] = 'display: none'
+        return attributes
+
+
+    def GenerateText(self):
+        '''
+        Returns a text of about text_size characters.
+        '''
+        words = []
+        length = 0
+        while length < self.text_size:
+            word = self.random.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return ' '.join(words)
+
+
+    def NewNode(self, name, attributes, text, children):
+        node = PageNode(self.next_node_id, name, attributes, text, children)
+        self.next_node_id += 1
+        return node
+
+
+    def MutatePage(self, page):
+        '''
+        Returns a mutated copy of the page. Unchanged elements keep their ids.
+        '''
+        mutated_page = self.MutateNode(page, self.depth + 2)
+        if self.move_rate > 0:
+            self.MoveElements(mutated_page)
+        return mutated_page
+
+
+    def MutateNode(self, node, depth):
+        attributes = dict(node.attributes)
+        for k in attributes.keys():
+            if self.random.random() < self.attribute_churn:
+                attributes[k] = '{0}-changed-{1}'.format(attributes[k], self.random.randint(0, 1000))
+        children = []
+        for child in node.children:
+            # The top level elements are kept, so that B is not mostly empty.
+            if node.name not in [ '#document', 'html', 'body' ] and self.random.random() < self.mutation_rate:
+                # Remove the element.
+                continue
+            children.append(self.MutateNode(child, depth - 1))
+            if node.name not in [ '#document', 'html' ] and self.random.random() < self.mutation_rate:
+                # Insert a new element next to it.
+                children.append(self.GenerateElement(max(depth - 2, 0)))
+        return PageNode(node.id, node.name, attributes, node.text, children)
+
+
+    def MoveElements(self, page):
+        '''
+        Detaches elements from their containers and inserts each of them at a
+        random position of another container.
+        '''
+        moved = []
+        for container in FindContainers(page):
+            kept = []
+            for child in container.children:
+                if self.random.random() < self.move_rate:
+                    moved.append(child)
+                else:
+                    kept.append(child)
+            container.children = kept
+        containers = FindContainers(page)
+        for node in moved:
+            container = self.random.choice(containers)
+            container.children.insert(self.random.randint(0, len(container.children)), node)
+
+
+def FindContainers(page):
+    '''
+    Returns the body and the container elements of the page.
+    '''
+    containers = []
+    nodes = [ page ]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        if node.name == 'body' or node.name in CONTAINER_TAGS:
+            containers.append(node)
+        nodes.extend(node.children)
+    return containers
+
+
+def ToDevToolsJSON(page):
+    '''
+    Returns the page as the result of DOM.getDocument.
+    '''
+    return { 'id': 1, 'result': { 'root': ToDevToolsNode(page, None) } }
+
+
+def ToDevToolsNode(node, parent_id):
+    # The ids of the #text nodes are negative so that they do not collide
+    # with the ids of the elements.
+    result = {
+        'nodeId': node.id,
+        'nodeType': 9 if node.name == '#document' else 1,
+        'nodeName': node.name.upper() if node.name != '#document' else node.name,
+        'nodeValue': '',
+        'attributes': [],
+        'children': [],
+    }
+    if parent_id is not None:
+        result['parentId'] = parent_id
+    for k in sorted(node.attributes.keys()):
+        result['attributes'].append(k)
+        result['attributes'].append(node.attributes[k])
+    if node.text != '':
+        result['children'].append({ 'nodeId': -node.id, 'parentId': node.id, 'nodeType': 3, 'nodeName': '#text', 'nodeValue': node.text })
+    for child in node.children:
+        result['children'].append(ToDevToolsNode(child, node.id))
+    result['childNodeCount'] = len(result['children'])
+    return result
+
+
+def ToDOMSnapshot(page):
+    '''
+    Returns the page as the result of DOMSnapshot.captureSnapshot with the
+    display and visibility computed styles. The elements hidden with
+    display: none and the head are not rendered, so they have no layout.
+    '''
+    strings = []
+    string_indices = {}
+    def AddString(text):
+        if text not in string_indices:
+            string_indices[text] = len(strings)
+            strings.append(text)
+        return string_indices[text]
+
+    nodes = { 'parentIndex': [], 'nodeType': [], 'nodeName': [], 'nodeValue': [], 'backendNodeId': [], 'attributes': [] }
+    layout = { 'nodeIndex': [], 'styles': [], 'bounds': [] }
+    def AddNode(parent_index, node_id, node_type, name, value, attributes):
+        nodes['parentIndex'].append(parent_index)
+        nodes['nodeType'].append(node_type)
+        nodes['nodeName'].append(AddString(name))
+        nodes['nodeValue'].append(AddString(value))
+        nodes['backendNodeId'].append(node_id)
+        nodes['attributes'].append(attributes)
+        return len(nodes['parentIndex']) - 1
+
+    # The nodes are added in the document order.
+    stack = [ (page, -1, False) ]
+    while len(stack) > 0:
+        node, parent_index, hidden = stack.pop()
+        attributes = []
+        for k in sorted(node.attributes.keys()):
+            attributes.extend([ AddString(k), AddString(node.attributes[k]) ])
+        name = node.name.upper() if node.name != '#document' else node.name
+        index = AddNode(parent_index, node.id, 9 if node.name == '#document' else 1, name, '', attributes)
+        hidden = hidden or node.name == 'head' or node.attributes.get('style', '').replace(' ', '') == 'display:none'
+        if not hidden:
+            layout['nodeIndex'].append(index)
+            layout['styles'].append([ AddString('block'), AddString('visible') ])
+            layout['bounds'].append([ 0, 0, 100, 20 ])
+        if node.text != '':
+            AddNode(index, -node.id, 3, '#text', node.text, [])
+        for child in reversed(node.children):
+            stack.append((child, index, hidden))
+    return { 'id': 1, 'result': { 'documents': [ { 'nodes': nodes, 'layout': layout } ], 'strings': strings } }
+
+
+def ToHtml(page):
+    '''
+    Returns the page as an HTML document.
+    '''
+    parts = [ '<!DOCTYPE html>' ]
+    for child in page.children:
+        AppendHtml(child, parts)
+    return ''.join(parts)
+
+
+def AppendHtml(node, parts):
+    attributes = ''.join([ ' {0}="{1}"'.format(k, escape(node.attributes[k], True)) for k in sorted(node.attributes.keys()) ])
+    parts.append('<{0}{1}>'.format(node.name, attributes))
+    if node.name == 'img':
+        return
+    parts.append(escape(node.text))
+    for child in node.children:
+        AppendHtml(child, parts)
+    parts.append('</{0}>'.format(node.name))
+
+
+def WritePagePair(output_dir, generator):
+    '''
+    Writes page A, and page B that is the mutated copy of A, in the JSON, the
+    snapshot and the HTML formats. Returns the paths of the files.
+    '''
+    page_a = generator.GeneratePage()
+    page_b = generator.MutatePage(page_a)
+    paths = {}
+    for name, page in [ ('a', page_a), ('b', page_b) ]:
+        paths[name + '_json'] = os.path.join(output_dir, name + '.json')
+        with open(paths[name + '_json'], 'w') as output_file:
+            json.dump(ToDevToolsJSON(page), output_file)
+        paths[name + '_snapshot'] = os.path.join(output_dir, name + '.snapshot.json')
+        with open(paths[name + '_snapshot'], 'w') as output_file:
+            json.dump(ToDOMSnapshot(page), output_file)
+        paths[name + '_html'] = os.path.join(output_dir, name + '.html')
+        with open(paths[name + '_html'], 'w') as output_file:
+            output_file.write(ToHtml(page))
+    return paths
+
+
+def AddGeneratorArguments(parser):
+    '''
+    Adds the knobs of the generator to the argument parser.
+    '''
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--depth', default=8, type=int)
+    parser.add_argument('--fan-out', default=6, type=int)
+    parser.add_argument('--text-size', default=20, type=int)
+    parser.add_argument('--attribute-churn', default=0.05, type=float)
+    parser.add_argument('--mutation-rate', default=0.05, type=float)
+    parser.add_argument('--move-rate', default=0.0, type=float)
+
+
+def CreateGenerator(parsed_args):
+    '''
+    Returns the generator configured by the arguments from AddGeneratorArguments.
+    '''
+    return PageGenerator(parsed_args.seed, parsed_args.depth, parsed_args.fan_out, parsed_args.text_size, parsed_args.attribute_churn, parsed_args.mutation_rate, parsed_args.move_rate)
+
+
+def Main():
+    paths = WritePagePair(args.output_dir, CreateGenerator(args))
+    for name in sorted(paths.keys()):
+        print '{0}: {1}'.format(name, paths[name])
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('output_dir')
+    AddGeneratorArguments(parser)
+    args = parser.parse_args()
+    Main()
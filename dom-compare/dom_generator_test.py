@@ -0,0 +1,72 @@
+from DOMTree import DOMTree
+
+import dom_generator
+import find_tree_diff
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import utils
+
+class TestDOMGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def test_seed(self):
+        '''
+        Tests that the same seed generates the same pages.
+        '''
+        pages = []
+        for i in range(2):
+            generator = dom_generator.PageGenerator(seed=3, depth=4)
+            page_a = generator.GeneratePage()
+            page_b = generator.MutatePage(page_a)
+            pages.append((json.dumps(dom_generator.ToDevToolsJSON(page_a)), dom_generator.ToHtml(page_b)))
+        self.assertEqual(pages[0], pages[1])
+        generator = dom_generator.PageGenerator(seed=4, depth=4)
+        self.assertNotEqual(pages[0][0], json.dumps(dom_generator.ToDevToolsJSON(generator.GeneratePage())))
+
+
+    def test_json_and_html(self):
+        '''
+        Tests that the JSON and the HTML of a page build the same tree.
+        '''
+        paths = dom_generator.WritePagePair(self.tmp_dir, dom_generator.PageGenerator(seed=1, depth=5))
+        json_tree = utils.GetDOMTree(paths['a_json'], False)
+        html_tree = utils.GetDOMTree(paths['a_html'], False, True)
+        # The HTML has the doctype node in addition.
+        self.assertEqual(json_tree.size + 1, html_tree.size)
+        self.assertEqual([ n.type for n in json_tree ], [ n.type for n in html_tree if n.type != 'doctype' ])
+
+
+    def test_mutation(self):
+        '''
+        Tests that B is the same as A without mutations, and differs from A
+        with mutations.
+        '''
+        generator = dom_generator.PageGenerator(seed=2, depth=5, attribute_churn=0, mutation_rate=0)
+        page = generator.GeneratePage()
+        dom_a = DOMTree(dom_generator.ToDevToolsJSON(page)['result']['root'])
+        dom_b = DOMTree(dom_generator.ToDevToolsJSON(generator.MutatePage(page))['result']['root'])
+        common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(dom_b, dom_a)
+        self.assertEqual(dom_a.size, common_dom_tree.size)
+        self.assertEqual(0, len(missing_nodes))
+
+        generator = dom_generator.PageGenerator(seed=2, depth=5, attribute_churn=0.1, mutation_rate=0.1)
+        page = generator.GeneratePage()
+        dom_a = DOMTree(dom_generator.ToDevToolsJSON(page)['result']['root'])
+        dom_b = DOMTree(dom_generator.ToDevToolsJSON(generator.MutatePage(page))['result']['root'])
+        common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(dom_b, dom_a)
+        self.assertTrue(common_dom_tree.size < dom_b.size)
+        self.assertTrue(len(missing_nodes) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
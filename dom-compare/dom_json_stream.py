@@ -0,0 +1,197 @@
+from DOMNode import DOMNode, ConstructSignature, SerializeAttributes, NODE_ATTRIBUTES, NODE_CHILDREN, NODE_ID, NODE_NAME, NODE_PARENT_ID, NODE_VALUE
+from signature_trie import ROOT_SIGNATURE_ID
+
+import gzip
+
+GZIP_MAGIC = '\x1f\x8b'
+ZSTD_MAGIC = '\x28\xb5\x2f\xfd'
+
+# The path to the root node in the DOM.getDocument dump.
+ROOT_PATH = [ 'result', 'root' ]
+
+# The ijson module, imported when first used as it is slow to import.
+_ijson = None
+
+# The fields of a node object that are used for building the DOMNode.
+NODE_FIELDS = { NODE_ID, NODE_NAME, NODE_VALUE, NODE_PARENT_ID }
+
+class MissingRootError(ValueError):
+    '''
+    Raised when the dump does not have result.root.
+    '''
+
+
+class DOMNodeRecord(object):
+    '''
+    The parsed DOM node with the records of its children that are kept.
+    '''
+    __slots__ = [ 'node', 'local_signature', 'has_parent_id', 'children' ]
+
+    def __init__(self, node, local_signature, has_parent_id, children):
+        self.node = node
+        self.local_signature = local_signature
+        self.has_parent_id = has_parent_id
+        self.children = children
+
+
+class _NodeFrame(object):
+    '''
+    The state of a node object that is being parsed.
+    '''
+    __slots__ = [ 'fields', 'attributes', 'children', 'child_count', 'text_value', 'key' ]
+
+    def __init__(self):
+        self.fields = {}
+        self.attributes = None
+        self.children = []
+        self.child_count = 0
+        self.text_value = None
+        self.key = None
+
+
+class _ContainerFrame(object):
+    '''
+    The state of a map or an array that is not a node.
+    '''
+    __slots__ = [ 'kind', 'key' ]
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.key = None
+
+
+def IsStreamingAvailable():
+    '''
+    Returns whether the streaming JSON parser is installed.
+    '''
+    return GetIjson() is not None
+
+
+def GetIjson():
+    '''
+    Returns the ijson module, or None when it is not installed.
+    '''
+    global _ijson
+    if _ijson is None:
+        try:
+            import ijson
+        except ImportError:
+            return None
+        _ijson = ijson
+    return _ijson
+
+
+def OpenDOMFile(filename):
+    '''
+    Returns the file object of the given dump. Gzip and zstd compressed dumps
+    are decompressed transparently.
+    '''
+    with open(filename, 'rb') as input_file:
+        magic = input_file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(filename, 'rb')
+    if magic == ZSTD_MAGIC:
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'))
+    return open(filename, 'rb')
+
+
+def ParseDOMJSON(input_file, for_hdp, should_skip):
+    '''
+    Parses the DOM.getDocument dump from the incremental JSON event stream
+    and returns the record of the root node, or None when there is no root.
+
+    The DOMNode of a node is built as soon as its JSON object ends, so the
+    dictionary of the whole dump is never held in memory. Nodes for which
+    should_skip(node, for_hdp) is true are dropped together with their
+    subtrees.
+    '''
+    found_root = False
+    root_record = None
+    stack = []
+    for event, value in GetIjson().basic_parse(input_file):
+        top = stack[-1] if len(stack) > 0 else None
+        if event == 'map_key':
+            top.key = value
+        elif event == 'start_map':
+            if IsChildPosition(top):
+                stack.append(_NodeFrame())
+            elif IsRootPosition(stack):
+                found_root = True
+                stack.append(_NodeFrame())
+            else:
+                stack.append(_ContainerFrame('map'))
+        elif event == 'end_map':
+            frame = stack.pop()
+            if type(frame) is not _NodeFrame:
+                continue
+            record = FinishNode(frame, for_hdp, should_skip)
+            if IsChildPosition(stack[-1]):
+                parent = stack[-2]
+                parent.child_count += 1
+                if parent.child_count == 1 and frame.fields.get(NODE_NAME, '').lower() == '#text':
+                    parent.text_value = frame.fields.get(NODE_VALUE, '')
+                if record is not None:
+                    parent.children.append(record)
+            else:
+                root_record = record
+        elif event == 'start_array':
+            if type(top) is _NodeFrame and top.key == NODE_ATTRIBUTES:
+                top.attributes = []
+                stack.append(_ContainerFrame('attributes'))
+            elif type(top) is _NodeFrame and top.key == NODE_CHILDREN:
+                stack.append(_ContainerFrame('children'))
+            else:
+                stack.append(_ContainerFrame('array'))
+        elif event == 'end_array':
+            stack.pop()
+        elif type(top) is _NodeFrame:
+            if top.key in NODE_FIELDS:
+                top.fields[top.key] = value
+        elif top is not None and top.kind == 'attributes':
+            stack[-2].attributes.append(value)
+
+    if not found_root:
+        raise MissingRootError('The DOM dump does not have result.root')
+    return root_record
+
+
+def IsChildPosition(frame):
+    '''
+    Returns whether a map that starts in frame is a child node.
+    '''
+    return type(frame) is _ContainerFrame and frame.kind == 'children'
+
+
+def IsRootPosition(stack):
+    '''
+    Returns whether a map that starts on top of the stack is the root node.
+    '''
+    return len(stack) == len(ROOT_PATH) and \
+            all([ type(f) is _ContainerFrame and f.kind == 'map' for f in stack ]) and \
+            [ f.key for f in stack ] == ROOT_PATH
+
+
+def FinishNode(frame, for_hdp, should_skip):
+    '''
+    Returns the record of the node that has been parsed, or None when the
+    node is skipped.
+    '''
+    fields = frame.fields
+    attributes = frame.attributes if frame.attributes is not None else []
+    attrs = SerializeAttributes(attributes, for_hdp)
+
+    # The value of a node with a single #text child is the value of the text.
+    value = ''
+    children = frame.children
+    if frame.child_count == 1 and frame.text_value is not None:
+        value = frame.text_value
+        children = []
+
+    has_parent_id = NODE_PARENT_ID in fields
+    parent_id = fields[NODE_PARENT_ID] if has_parent_id else -1
+    node = DOMNode(fields[NODE_ID], fields[NODE_NAME], value, attrs, parent_id, ROOT_SIGNATURE_ID)
+    if should_skip(node, for_hdp):
+        return None
+    local_signature = ConstructSignature(fields[NODE_NAME], attributes, for_hdp)
+    return DOMNodeRecord(node, local_signature, has_parent_id, children)
@@ -0,0 +1,80 @@
+from DOMTree import DOMTree
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import utils
+
+DOM_JSON = '''{"id":1,"result":{"root":{"nodeId":1,"backendNodeId":1,"nodeType":9,"nodeName":"#document","localName":"","nodeValue":"","childNodeCount":2,"children":[
+    {"nodeId":2,"parentId":1,"nodeType":10,"nodeName":"html","localName":"","nodeValue":""},
+    {"nodeId":3,"parentId":1,"nodeType":1,"nodeName":"HTML","localName":"html","nodeValue":"","children":[
+        {"nodeId":4,"parentId":3,"nodeType":1,"nodeName":"HEAD","localName":"head","nodeValue":"","children":[
+            {"nodeId":5,"parentId":4,"nodeType":1,"nodeName":"TITLE","localName":"title","nodeValue":"","children":[{"nodeId":6,"parentId":5,"nodeType":3,"nodeName":"#text","localName":"","nodeValue":"The title"}],"attributes":[]},
+            {"nodeId":7,"parentId":4,"nodeType":1,"nodeName":"SCRIPT","localName":"script","nodeValue":"","attributes":["src","a.js"]}],"attributes":[]},
+        {"nodeId":8,"parentId":3,"nodeType":1,"nodeName":"BODY","localName":"body","nodeValue":"","children":[
+            {"nodeId":9,"parentId":8,"nodeType":1,"nodeName":"DIV","localName":"div","nodeValue":"","children":[
+                {"nodeId":10,"parentId":9,"nodeType":3,"nodeName":"#text","localName":"","nodeValue":"Hello "},
+                {"nodeId":11,"parentId":9,"nodeType":1,"nodeName":"B","localName":"b","nodeValue":"","children":[{"nodeId":12,"parentId":11,"nodeType":3,"nodeName":"#text","localName":"","nodeValue":"world"}],"attributes":[]}],
+             "attributes":["class","b a","data-x","1"]},
+            {"nodeId":13,"parentId":8,"nodeType":1,"nodeName":"IFRAME","localName":"iframe","nodeValue":"","contentDocument":{"nodeId":14,"nodeName":"#document","children":[{"nodeId":15,"parentId":14,"nodeName":"P"}]},"attributes":["src","f.html"]},
+            {"nodeId":16,"parentId":8,"nodeType":8,"nodeName":"#comment","localName":"","nodeValue":"c"},
+            {"nodeId":17,"parentId":8,"nodeType":1,"nodeName":"DIV","localName":"div","nodeValue":"","attributes":["style","display: none","id","hidden"],"children":[{"nodeId":18,"parentId":17,"nodeName":"SPAN","attributes":[]}]}],
+         "attributes":[]}],
+     "attributes":["lang","en"]}]}}}'''
+
+class TestDOMJSONStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dom_filename = os.path.join(self.tmp_dir, 'dom.json')
+        with open(self.dom_filename, 'w') as f:
+            f.write(DOM_JSON)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def assertSameTree(self, expected, got):
+        self.assertEqual(expected.size, got.size)
+        self.assertEqual(json.dumps(expected.Serialize()), json.dumps(got.Serialize()))
+        for expected_node, got_node in zip(iter(expected), iter(got)):
+            self.assertEqual(expected_node, got_node)
+            self.assertEqual(expected_node.parent_id, got_node.parent_id)
+            self.assertEqual(expected_node.signature, got_node.signature)
+
+
+    def test_streaming_matches_json(self):
+        '''
+        Tests that the streaming reader builds the same tree as the JSON reader.
+        '''
+        for for_hdp in [ False, True ]:
+            expected = DOMTree(json.loads(DOM_JSON)['result']['root'], for_hdp)
+            got = utils.GetDOMTree(self.dom_filename, for_hdp, streaming=True)
+            self.assertSameTree(expected, got)
+            self.assertEqual(utils.GetDOMTree(self.dom_filename, for_hdp).size, got.size)
+
+
+    def test_gzip(self):
+        '''
+        Tests reading a gzip compressed dump.
+        '''
+        gzip_filename = self.dom_filename + '.gz'
+        with gzip.open(gzip_filename, 'wb') as f:
+            f.write(DOM_JSON)
+        expected = DOMTree(json.loads(DOM_JSON)['result']['root'])
+        self.assertSameTree(expected, utils.GetDOMTree(gzip_filename, False, streaming=True))
+        self.assertSameTree(expected, utils.GetDOMTree(gzip_filename, False))
+
+
+    def test_missing_root(self):
+        with open(self.dom_filename, 'w') as f:
+            f.write('{"id":1,"result":{}}')
+        self.assertRaises(ValueError, utils.GetDOMTree, self.dom_filename, False, False, True)
+
+
+if __name__ == '__main__':
+    unittest.main()
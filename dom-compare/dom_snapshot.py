@@ -0,0 +1,125 @@
+from DOMNode import SerializeAttributes
+
+# The computed styles that the snapshots are captured with, in order. The
+# snapshot only has the values, so the order must match the computedStyles
+# parameter of DOMSnapshot.captureSnapshot.
+DEFAULT_COMPUTED_STYLES = [ 'display', 'visibility' ]
+
+# The DOM node types of the snapshot.
+ELEMENT_NODE = 1
+TEXT_NODE = 3
+
+# These tags are always considered visible, as in DOMNode.IsVisible.
+VISIBILITY_EXEMPTIONS = { '#document', 'html', 'head', 'body' }
+
+class DOMSnapshot(object):
+    '''
+    The nodes of the main document of a DOMSnapshot.captureSnapshot result,
+    kept in the parallel arrays of the snapshot. The strings are resolved
+    from the string table when they are read.
+    '''
+    def __init__(self, snapshot, computed_styles=DEFAULT_COMPUTED_STYLES):
+        self.strings = snapshot['strings']
+        # The frames are in the following documents and are not read.
+        document = snapshot['documents'][0]
+        nodes = document['nodes']
+        self.parent_indices = nodes['parentIndex']
+        self.node_types = nodes['nodeType']
+        self.node_names = nodes['nodeName']
+        self.node_values = nodes.get('nodeValue')
+        self.attributes = nodes.get('attributes')
+        self.backend_node_ids = nodes.get('backendNodeId')
+        self.size = len(self.parent_indices)
+
+        # Maps the index of each rendered node to its index in the layout.
+        layout = document.get('layout', {})
+        self.layout_indices = { node_index: i for i, node_index in enumerate(layout.get('nodeIndex', [])) }
+        self.styles = layout.get('styles', [])
+        self.bounds = layout.get('bounds', [])
+        self.style_positions = { name: i for i, name in enumerate(computed_styles) }
+
+
+    def GetString(self, string_index):
+        '''
+        Returns the string at the index of the string table. Missing strings
+        are -1.
+        '''
+        if string_index < 0:
+            return ''
+        return self.strings[string_index]
+
+
+    def GetNodeId(self, index):
+        if self.backend_node_ids is not None:
+            return self.backend_node_ids[index]
+        return index
+
+
+    def GetNodeName(self, index):
+        return self.strings[self.node_names[index]]
+
+
+    def GetNodeValue(self, index):
+        if self.node_values is None:
+            return ''
+        return self.GetString(self.node_values[index])
+
+
+    def GetAttributes(self, index, for_hdp):
+        '''
+        Returns the attributes of the node as a map.
+        '''
+        if self.attributes is None:
+            return {}
+        return SerializeAttributes([ self.strings[s] for s in self.attributes[index] ], for_hdp)
+
+
+    def GetComputedStyle(self, layout_index, name):
+        '''
+        Returns the computed style of the rendered node, or None when the
+        snapshot was not captured with it.
+        '''
+        position = self.style_positions.get(name)
+        styles = self.styles[layout_index] if layout_index < len(self.styles) else []
+        if position is None or position >= len(styles):
+            return None
+        return self.GetString(styles[position])
+
+
+    def IsVisible(self, index, node_type, in_head):
+        '''
+        Returns whether the node is visible from its layout. An element that
+        is not rendered, has display: none or visibility: hidden, or has an
+        empty box is not visible. The elements in the head are never rendered
+        and are considered visible.
+        '''
+        if node_type in VISIBILITY_EXEMPTIONS or self.node_types[index] != ELEMENT_NODE:
+            return True
+        layout_index = self.layout_indices.get(index)
+        if layout_index is None:
+            return in_head
+        if self.GetComputedStyle(layout_index, 'display') == 'none':
+            return False
+        if self.GetComputedStyle(layout_index, 'visibility') in ('hidden', 'collapse'):
+            return False
+        if layout_index < len(self.bounds):
+            bounds = self.bounds[layout_index]
+            if len(bounds) == 4 and bounds[2] == 0 and bounds[3] == 0:
+                return False
+        return True
+
+
+def IsDOMSnapshot(dom_json):
+    '''
+    Returns whether the JSON is a DOMSnapshot.captureSnapshot result.
+    '''
+    return type(dom_json) == dict and 'documents' in dom_json and 'strings' in dom_json
+
+
+def GetSnapshotResult(dom_json):
+    '''
+    Returns the snapshot in the dump, which is either the DevTools response
+    or its result, or None when the dump is not a snapshot.
+    '''
+    result = dom_json.get('result', dom_json) if type(dom_json) == dict else None
+    return result if IsDOMSnapshot(result) else None
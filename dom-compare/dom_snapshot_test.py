@@ -0,0 +1,79 @@
+from DOMTree import DOMTree
+
+import dom_generator
+import json
+import shutil
+import tempfile
+import unittest
+import utils
+
+class TestDOMSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def test_same_as_json(self):
+        '''
+        Tests that the snapshot and the JSON of a page build the same tree.
+        '''
+        paths = dom_generator.WritePagePair(self.tmp_dir, dom_generator.PageGenerator(seed=2, depth=5))
+        json_tree = utils.GetDOMTree(paths['a_json'], False)
+        for streaming in [ False, True ]:
+            snapshot_tree = utils.GetDOMTree(paths['a_snapshot'], False, streaming=streaming)
+            self.assertEqual(json_tree.size, snapshot_tree.size)
+            self.assertEqual(json.dumps(json_tree.Serialize()), json.dumps(snapshot_tree.Serialize()))
+            self.assertEqual([ n.signature for n in json_tree.IterSubtree(json_tree.root_node) ], [ n.signature for n in snapshot_tree.IterSubtree(snapshot_tree.root_node) ])
+
+
+    def test_hdp_same_as_html(self):
+        '''
+        Tests that HDP skips the same hidden elements in the snapshot as in
+        the HTML, where they are hidden by their inline style.
+        '''
+        paths = dom_generator.WritePagePair(self.tmp_dir, dom_generator.PageGenerator(seed=2, depth=5))
+        html_tree = utils.GetDOMTree(paths['a_html'], True, True)
+        snapshot_tree = utils.GetDOMTree(paths['a_snapshot'], True)
+        self.assertTrue(snapshot_tree.skipped_count > 0)
+        # The HTML has the doctype node in addition.
+        self.assertEqual([ n.type for n in html_tree if n.type != 'doctype' ], [ n.type for n in snapshot_tree ])
+
+
+    def test_layout_visibility(self):
+        '''
+        Tests that HDP skips the elements that are hidden by their computed
+        style, are not rendered or are empty, without an inline style.
+        '''
+        strings = [ '#document', 'HTML', 'HEAD', 'TITLE', '#text', 'title', 'BODY', 'DIV', 'P', 'block', 'visible', 'hidden', 'class', 'x', '' ]
+        nodes = {
+            # document, html, head, title, text, body, shown div, hidden div, its p, not rendered div, empty div
+            'parentIndex': [ -1, 0, 1, 2, 3, 1, 5, 5, 7, 5, 5 ],
+            'nodeType': [ 9, 1, 1, 1, 3, 1, 1, 1, 1, 1, 1 ],
+            'nodeName': [ 0, 1, 2, 3, 4, 6, 7, 7, 8, 7, 7 ],
+            'nodeValue': [ 14, 14, 14, 14, 5, 14, 14, 14, 14, 14, 14 ],
+            'backendNodeId': [ 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11 ],
+            'attributes': [ [], [], [], [], [], [], [ 12, 13 ], [ 12, 13 ], [], [], [] ],
+        }
+        layout = {
+            'nodeIndex': [ 1, 5, 6, 7, 8, 10 ],
+            'styles': [ [ 9, 10 ], [ 9, 10 ], [ 9, 10 ], [ 9, 11 ], [ 9, 11 ], [ 9, 10 ] ],
+            'bounds': [ [ 0, 0, 100, 100 ], [ 0, 0, 100, 100 ], [ 0, 0, 100, 20 ], [ 0, 20, 100, 20 ], [ 0, 20, 100, 20 ], [ 0, 40, 0, 0 ] ],
+        }
+        snapshot = { 'documents': [ { 'nodes': nodes, 'layout': layout } ], 'strings': strings }
+
+        dom_tree = DOMTree(snapshot, True)
+        self.assertEqual([ 1, 2, 3, 6, 4, 7 ], [ n.id for n in dom_tree ])
+        self.assertEqual('title', dom_tree.GetChildren(3)[0].value)
+        self.assertEqual(3, dom_tree.skipped_count)
+
+        dom_tree = DOMTree(snapshot, False)
+        self.assertEqual(10, dom_tree.size)
+        self.assertEqual(0, dom_tree.skipped_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
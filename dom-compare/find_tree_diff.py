@@ -2,72 +2,414 @@ from argparse import ArgumentParser
 from collections import deque
 from DOMNode import DOMNode 
 from DOMTree import DOMTree
+from html_parsers import DEFAULT_HTML_PARSER, HTML_PARSERS
+from itertools import izip
+from moved_subtrees import DEFAULT_MIN_MOVED_SIZE
+from parallel_diff import DEFAULT_MIN_SUBTREE_SIZE
+from diff_stats import DiffStats, DIFF_PHASE, DUMP_PHASE, Phase
+from sibling_alignment import ALIGNMENT_ENGINES, ANCHOR_ENGINE, DEFAULT_LINEAR_SPACE_WIDTH, LCS_ENGINE
+from tree_cache import DEFAULT_MAX_BYTES, TreeCache
 
+import fingerprint
 import json
+import moved_subtrees
+import parallel_diff
+import sibling_alignment
+import tree_json_writer
 import utils
 
 def Main():
-    dom_a = utils.GetDOMTree(args.dom_tree_a, args.hdp, args.raw_html)
-    dom_b = utils.GetDOMTree(args.dom_tree_b, args.hdp, args.raw_html)
+    stats = DiffStats(AppendStatsRecord) if args.stats_file is not None else None
+    cache = TreeCache(args.cache_dir, args.cache_max_bytes) if args.cache_dir is not None else None
+    dom_a = None
+    dom_b = None
+    if args.skip_above_similarity is not None:
+        # The fingerprints are read from the cache when they are there, so
+        # a similar pair is screened without building its trees.
+        fingerprint_a, dom_a = fingerprint.GetFileFingerprint(args.dom_tree_a, args.hdp, args.raw_html, args.streaming_json, args.html_parser, args.compact_tree, cache, stats=stats)
+        fingerprint_b, dom_b = fingerprint.GetFileFingerprint(args.dom_tree_b, args.hdp, args.raw_html, args.streaming_json, args.html_parser, args.compact_tree, cache, stats=stats)
+        similarity = fingerprint_a.Similarity(fingerprint_b, args.only_structure)
+        print 'SIMILARITY: {0:.4f}'.format(similarity)
+        if similarity >= args.skip_above_similarity:
+            print 'SKIPPED'
+            return
+    if dom_a is None:
+        dom_a = utils.GetDOMTree(args.dom_tree_a, args.hdp, args.raw_html, args.streaming_json, args.html_parser, args.compact_tree, cache, stats)
+    if dom_b is None:
+        dom_b = utils.GetDOMTree(args.dom_tree_b, args.hdp, args.raw_html, args.streaming_json, args.html_parser, args.compact_tree, cache, stats)
+    if args.debug and cache is not None:
+        print 'CACHE STATS: ' + json.dumps(cache.Stats(), sort_keys=True)
 
     # Assume that DOM B is the corrent DOM Tree.
     correct_dom = dom_b
     testing_dom = dom_a
 
-    queued_correct_common_nodes = deque([ correct_dom.root_node ])
-    queued_testing_common_nodes = deque([ testing_dom.root_node ])
-    
     # Check root_node. degenerative case:
     if correct_dom.root_node != testing_dom.root_node:
         print 'NOTHING MATCHED!'
 
-    # Populate the root node.
-    common_dom_tree = DOMTree({})
-    common_dom_tree.AddNode(-1, correct_dom.root_node)
-    all_missing_nodes = []
-    while len(queued_correct_common_nodes) > 0 and len(queued_testing_common_nodes) > 0:
-        correct_front = queued_correct_common_nodes.popleft()
-        correct_nodes_children = correct_dom.GetChildren(correct_front.id)
-
-        testing_front = queued_testing_common_nodes.popleft()
-        testing_nodes_children = testing_dom.GetChildren(testing_front.id)
-
-        if args.debug:
-            print 'COMPARING:'
-            print '\tcorrect: ' + str(len(correct_nodes_children))
-            PrintNodeList(correct_nodes_children, indent='\t')
-            print '\ttesting: ' + str(len(testing_nodes_children))
-            PrintNodeList(testing_nodes_children, indent='\t')
-
-        correct_common_nodes, testing_common_nodes, missing_nodes = FindCommonNodes(correct_nodes_children, testing_nodes_children, args.debug)
-        queued_correct_common_nodes.extend(correct_common_nodes)
-        queued_testing_common_nodes.extend(testing_common_nodes)
-        all_missing_nodes.extend(missing_nodes)
-
-        for n in correct_common_nodes:
-            common_dom_tree.AddNode(correct_front.id, n)
-
-        if args.debug:
-            # print 'correct: ' + str(len(correct_common_nodes))
-            # PrintNodeList(correct_common_nodes)
-            # print 'queued: ' 
-            # PrintNodeList(queued_correct_common_nodes)
-            # print '================================================='
-            pass
-        
-        if None in correct_common_nodes:
-            break
+    added_nodes = [] if args.detect_moves else None
+    # The missing nodes are written as they are found, unless they are needed
+    # after the diff.
+    all_missing_nodes = None
+    if args.workers > 1:
+        with Phase(stats, DIFF_PHASE):
+            baseline = PreparedBaseline(correct_dom, args.only_structure, args.alignment_engine, args.linear_space_width)
+            common_dom_tree, all_missing_nodes = parallel_diff.ParallelDiff(baseline, testing_dom, args.workers, args.parallel_min_subtree_size, stats, added_nodes)
+    elif args.detect_moves:
+        common_dom_tree, all_missing_nodes = CompareDOMTrees(correct_dom, testing_dom, args.only_structure, args.debug, args.alignment_engine, args.linear_space_width, stats, added_nodes)
+    else:
+        missing_file = open(args.dump_missing_nodes, 'w') if args.dump_missing_nodes is not None else None
+        try:
+            common_dom_tree, missing_count = StreamDiff(correct_dom, testing_dom, missing_file, args.only_structure, args.debug, args.alignment_engine, args.linear_space_width, stats)
+        finally:
+            if missing_file is not None:
+                missing_file.close()
     print '{0} {1}'.format(common_dom_tree.size, dom_a.size)
-    if args.dump_common_tree is not None:
-        with open(args.dump_common_tree, 'w') as output_file:
-            output_file.write(json.dumps({ 'result': { 'root': common_dom_tree.Serialize() } }))
+    moved = []
+    if args.detect_moves:
+        with Phase(stats, DIFF_PHASE):
+            moved, all_missing_nodes, added_nodes = moved_subtrees.FindMovedSubtrees(correct_dom, testing_dom, all_missing_nodes, added_nodes, args.only_structure, args.min_moved_size)
+        print 'MOVED: {0}'.format(len(moved))
+    with Phase(stats, DUMP_PHASE):
+        if args.dump_common_tree is not None:
+            DumpCommonTree(common_dom_tree, args.dump_common_tree)
 
-    if args.dump_missing_nodes is not None:
-        with open(args.dump_missing_nodes, 'w') as output_file:
-            for n in all_missing_nodes:
-                # print '[MISSING] ' + n
-                missing_data = { 'str': str(n), 'signature': n.signature }
-                output_file.write(json.dumps(missing_data) + '\n')
+        if args.dump_missing_nodes is not None and all_missing_nodes is not None:
+            DumpMissingNodes(all_missing_nodes, args.dump_missing_nodes)
+
+        if args.dump_moved_nodes is not None:
+            DumpMovedNodes(moved, args.dump_moved_nodes)
+
+    if all_missing_nodes is not None:
+        missing_count = len(all_missing_nodes)
+    if stats is not None:
+        stats.Report(dom_tree_a=args.dom_tree_a, dom_tree_b=args.dom_tree_b, common_size=common_dom_tree.size, testing_size=dom_a.size, missing_count=missing_count)
+
+
+def AppendStatsRecord(record):
+    '''
+    Appends the stats record of the comparison to the stats file as a JSON line.
+    '''
+    with open(args.stats_file, 'a') as stats_file:
+        stats_file.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+# The types of the events of PreparedBaseline.IterDiff.
+MATCHED_EVENT = 'matched'
+SUBTREE_MATCHED_EVENT = 'subtree_matched'
+MISSING_EVENT = 'missing'
+ADDED_EVENT = 'added'
+LEVEL_FINISHED_EVENT = 'level_finished'
+
+def CompareDOMTrees(correct_dom, testing_dom, only_structure=False, debug=False, engine=LCS_ENGINE, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH, stats=None, added_nodes=None):
+    '''
+    Compares the two DOM trees level by level. When stats is a DiffStats,
+    the time of the diff and its counters are recorded there. When
+    added_nodes is a list, the nodes from testing_dom that are not in
+    correct_dom are appended to it.
+
+    Returns the common DOM tree and the list of nodes from correct_dom
+    that are missing from testing_dom.
+    '''
+    with Phase(stats, DIFF_PHASE):
+        return PreparedBaseline(correct_dom, only_structure, engine, linear_space_width).Diff(testing_dom, debug, stats, added_nodes)
+
+
+class PreparedBaseline(object):
+    '''
+    The index of a correct DOM tree that is compared against many testing
+    trees. The children and their equality keys of every node, and the size
+    and the hash of every subtree are looked up once, so each comparison
+    only pays for the testing tree.
+    '''
+    def __init__(self, correct_dom, only_structure=False, engine=LCS_ENGINE, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH):
+        self.correct_dom = correct_dom
+        self.only_structure = only_structure
+        self.engine = engine
+        self.linear_space_width = linear_space_width
+
+        # Maps the node id to the children of the node and their equality keys.
+        self._children = {}
+        self._child_keys = {}
+
+        # Maps the node id to the (size, hash) of the subtree of the node. An
+        # equal pair only marks the subtrees as candidates, see SubtreeMatches.
+        self._subtrees = {}
+
+        # The (node id, children) pairs of the nodes with children in the
+        # depth-first order, and the node id to the range of the pairs of its
+        # descendants. A matching subtree is copied from its range.
+        self._child_lists = []
+        self._descendant_ranges = {}
+        if correct_dom.root_node is None:
+            return
+        for node in correct_dom.IterSubtree(correct_dom.root_node):
+            children = correct_dom.GetChildren(node.id)
+            self._children[node.id] = children
+            self._child_keys[node.id] = GetEqualityKeys(children, only_structure)
+            self._subtrees[node.id] = (correct_dom.SubtreeSize(node), correct_dom.SubtreeHash(node, only_structure))
+        self.IndexDescendants(correct_dom.root_node)
+
+
+    def IndexDescendants(self, root_node):
+        '''
+        Populates the child lists in the depth-first order and the range of
+        the descendants of each node.
+        '''
+        stack = [ (root_node, False) ]
+        start_of_id = {}
+        while len(stack) > 0:
+            node, finished = stack.pop()
+            if finished:
+                self._descendant_ranges[node.id] = (start_of_id.pop(node.id), len(self._child_lists))
+                continue
+            children = self._children[node.id]
+            start_of_id[node.id] = len(self._child_lists)
+            if len(children) > 0:
+                self._child_lists.append((node.id, children))
+            stack.append((node, True))
+            stack.extend([ (child, False) for child in reversed(children) ])
+
+
+    def Diff(self, testing_dom, debug=False, stats=None, added_nodes=None, mapping=None):
+        '''
+        Compares the correct DOM tree with testing_dom level by level. When
+        stats is a DiffStats, the counters of the diff are added there. When
+        added_nodes is a list, the nodes from testing_dom that are not in the
+        correct DOM tree are appended to it. When mapping is a list, the
+        matched (correct node, testing node) pairs are appended to it.
+
+        Returns the common DOM tree and the list of nodes from the correct DOM
+        tree that are missing from testing_dom.
+        '''
+        correct_dom = self.correct_dom
+
+        # Populate the root node.
+        common_dom_tree = DOMTree({})
+        common_dom_tree.AddNode(-1, correct_dom.root_node)
+        all_missing_nodes = []
+        if mapping is not None:
+            mapping.append((correct_dom.root_node, testing_dom.root_node))
+        self.DiffSubtrees(testing_dom, correct_dom.root_node, testing_dom.root_node, common_dom_tree, all_missing_nodes, debug, stats, added_nodes, mapping)
+        return common_dom_tree, all_missing_nodes
+
+
+    def IterDiff(self, testing_dom, debug=False, stats=None):
+        '''
+        Compares the correct DOM tree with testing_dom level by level and
+        yields the events of the diff as they are found, so the caller does
+        not have to hold the whole result.
+
+        Each event is an (event type, correct node, testing node, correct
+        parent) tuple:
+            MATCHED_EVENT: the nodes matched. The roots match with no parent.
+            SUBTREE_MATCHED_EVENT: the matched nodes have identical subtrees,
+                so all their descendants match and are not yielded.
+            MISSING_EVENT: the correct node has no match. The testing node
+                is None.
+            ADDED_EVENT: the testing node has no match. The correct node is
+                None.
+            LEVEL_FINISHED_EVENT: the children of the matched nodes were
+                aligned.
+        The nodes of a missing or an added subtree are only yielded for its
+        root.
+        '''
+        yield (MATCHED_EVENT, self.correct_dom.root_node, testing_dom.root_node, None)
+        for event in self.IterDiffSubtrees(testing_dom, self.correct_dom.root_node, testing_dom.root_node, debug, stats):
+            yield event
+
+
+    def DiffSubtrees(self, testing_dom, correct_root, testing_root, common_dom_tree, all_missing_nodes, debug=False, stats=None, added_nodes=None, mapping=None, dispatch=None):
+        '''
+        Compares the subtree of the correct DOM tree rooted at correct_root
+        with the subtree of testing_dom rooted at testing_root level by level,
+        as Diff does. The common nodes are added to common_dom_tree, which
+        must hold correct_root, and the missing nodes to all_missing_nodes.
+        dispatch is passed to IterDiffSubtrees.
+        '''
+        for event_type, correct_node, testing_node, correct_parent in self.IterDiffSubtrees(testing_dom, correct_root, testing_root, debug, stats, dispatch):
+            self.AddToCommonTree(common_dom_tree, event_type, correct_node, correct_parent)
+            if event_type == MATCHED_EVENT:
+                if mapping is not None:
+                    mapping.append((correct_node, testing_node))
+            elif event_type == SUBTREE_MATCHED_EVENT:
+                if mapping is not None:
+                    # Identical subtrees are visited in the same order. The
+                    # roots were matched with their siblings.
+                    pairs = izip(self.correct_dom.IterSubtree(correct_node), testing_dom.IterSubtree(testing_node))
+                    next(pairs)
+                    mapping.extend(pairs)
+            elif event_type == MISSING_EVENT:
+                all_missing_nodes.append(correct_node)
+            elif event_type == ADDED_EVENT and added_nodes is not None:
+                added_nodes.append(testing_node)
+
+
+    def AddToCommonTree(self, common_dom_tree, event_type, correct_node, correct_parent):
+        '''
+        Adds the nodes that matched in an event of IterDiff to the common DOM
+        tree.
+        '''
+        if event_type == MATCHED_EVENT:
+            common_dom_tree.AddNode(correct_parent.id if correct_parent is not None else -1, correct_node)
+        elif event_type == SUBTREE_MATCHED_EVENT:
+            start, end = self._descendant_ranges[correct_node.id]
+            common_dom_tree.AddChildLists(self._child_lists[start:end])
+
+
+    def IterDiffSubtrees(self, testing_dom, correct_root, testing_root, debug=False, stats=None, dispatch=None):
+        '''
+        Yields the events of the diff of the subtrees rooted at correct_root
+        and testing_root, as IterDiff does, without the event of the roots.
+
+        When dispatch is given, it is called with each pair of matched nodes
+        below the roots before they are compared. The pairs it returns True
+        for are left to the caller.
+        '''
+        only_structure = self.only_structure
+        levels_visited = 0
+        subtrees_matched = 0
+        widest_sibling_list = 0
+        lcs_cell_count = sibling_alignment.GetLCSCellCount()
+        queued_correct_common_nodes = deque([ correct_root ])
+        queued_testing_common_nodes = deque([ testing_root ])
+        while len(queued_correct_common_nodes) > 0 and len(queued_testing_common_nodes) > 0:
+            correct_front = queued_correct_common_nodes.popleft()
+            testing_front = queued_testing_common_nodes.popleft()
+
+            if self.SubtreeMatches(testing_dom, correct_front, testing_front):
+                # The whole subtrees match, so there is no need to descend into them.
+                subtrees_matched += 1
+                yield (SUBTREE_MATCHED_EVENT, correct_front, testing_front, None)
+                continue
+
+            if dispatch is not None and correct_front is not correct_root and dispatch(correct_front, testing_front):
+                continue
+
+            correct_nodes_children = self._children.get(correct_front.id, [])
+            correct_keys = self._child_keys.get(correct_front.id, [])
+            testing_nodes_children = testing_dom.GetChildren(testing_front.id)
+            testing_keys = GetEqualityKeys(testing_nodes_children, only_structure)
+            levels_visited += 1
+            widest_sibling_list = max(widest_sibling_list, len(correct_keys), len(testing_keys))
+
+            if debug:
+                print 'COMPARING:'
+                print '\tcorrect: ' + str(len(correct_nodes_children))
+                PrintNodeList(correct_nodes_children, indent='\t')
+                print '\ttesting: ' + str(len(testing_nodes_children))
+                PrintNodeList(testing_nodes_children, indent='\t')
+
+            correct_common_nodes, testing_common_nodes, missing_nodes = FindCommonNodesFromKeys(correct_nodes_children, correct_keys, testing_nodes_children, testing_keys, debug, only_structure, self.engine, self.linear_space_width, stats)
+            queued_correct_common_nodes.extend(correct_common_nodes)
+            queued_testing_common_nodes.extend(testing_common_nodes)
+            for c, t in izip(correct_common_nodes, testing_common_nodes):
+                if c is not None:
+                    yield (MATCHED_EVENT, c, t, correct_front)
+            for n in missing_nodes:
+                yield (MISSING_EVENT, n, None, correct_front)
+            if len(testing_common_nodes) < len(testing_nodes_children):
+                matched_ids = set([ id(n) for n in testing_common_nodes ])
+                for n in testing_nodes_children:
+                    if id(n) not in matched_ids:
+                        yield (ADDED_EVENT, None, n, correct_front)
+            yield (LEVEL_FINISHED_EVENT, correct_front, testing_front, None)
+
+            if None in correct_common_nodes:
+                break
+
+        if stats is not None:
+            stats.Count('levels_visited', levels_visited)
+            stats.Count('subtrees_matched', subtrees_matched)
+            stats.Count('lcs_cells', sibling_alignment.GetLCSCellCount() - lcs_cell_count)
+            stats.Max('widest_sibling_list', widest_sibling_list)
+
+
+    def SubtreeMatches(self, testing_dom, correct_node, testing_node):
+        '''
+        Returns whether the subtree of correct_node is equal to the subtree of
+        testing_node in testing_dom. The sizes and the hashes of the subtrees
+        are compared first, and a match is confirmed by comparing the keys of
+        the children of each pair of nodes, so a hash collision does not hide
+        a difference.
+        '''
+        only_structure = self.only_structure
+        if self._subtrees.get(correct_node.id) != (testing_dom.SubtreeSize(testing_node), testing_dom.SubtreeHash(testing_node, only_structure)):
+            return False
+        if GetEqualityKeys([ correct_node ], only_structure) != GetEqualityKeys([ testing_node ], only_structure):
+            return False
+        pairs = [ (correct_node, testing_node) ]
+        while len(pairs) > 0:
+            correct_parent, testing_parent = pairs.pop()
+            testing_children = testing_dom.GetChildren(testing_parent.id)
+            if self._child_keys[correct_parent.id] != GetEqualityKeys(testing_children, only_structure):
+                return False
+            pairs.extend(izip(self._children[correct_parent.id], testing_children))
+        return True
+
+
+    def DiffMany(self, testing_doms, debug=False, stats=None):
+        '''
+        Yields the result of Diff for each of the testing trees.
+        '''
+        for testing_dom in testing_doms:
+            yield self.Diff(testing_dom, debug, stats)
+
+
+def StreamDiff(correct_dom, testing_dom, missing_file=None, only_structure=False, debug=False, engine=LCS_ENGINE, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH, stats=None):
+    '''
+    Same as CompareDOMTrees, with the missing nodes written to missing_file
+    as they are found instead of being kept in a list.
+
+    Returns the common DOM tree and the number of missing nodes.
+    '''
+    missing_count = 0
+    with Phase(stats, DIFF_PHASE):
+        baseline = PreparedBaseline(correct_dom, only_structure, engine, linear_space_width)
+        common_dom_tree = DOMTree({})
+        for event_type, correct_node, _, correct_parent in baseline.IterDiff(testing_dom, debug, stats):
+            if event_type == MISSING_EVENT:
+                missing_count += 1
+                if missing_file is not None:
+                    missing_file.write(GetMissingNodeLine(correct_node))
+            else:
+                baseline.AddToCommonTree(common_dom_tree, event_type, correct_node, correct_parent)
+    return common_dom_tree, missing_count
+
+
+def DumpCommonTree(common_dom_tree, output_filename):
+    '''
+    Writes the common DOM tree to the output file in the DevTools format.
+    '''
+    with open(output_filename, 'w') as output_file:
+        output_file.write('{"result": {"root": ')
+        tree_json_writer.WriteTreeJSON(common_dom_tree, output_file)
+        output_file.write('}}')
+
+
+def DumpMissingNodes(missing_nodes, output_filename):
+    '''
+    Writes the missing nodes to the output file, one JSON object per line.
+    '''
+    with open(output_filename, 'w') as output_file:
+        for n in missing_nodes:
+            output_file.write(GetMissingNodeLine(n))
+
+
+def GetMissingNodeLine(node):
+    missing_data = { 'str': str(node), 'signature': node.signature }
+    return json.dumps(missing_data) + '\n'
+
+
+def DumpMovedNodes(moved, output_filename):
+    '''
+    Writes the moved subtrees to the output file, one JSON object per line.
+    '''
+    with open(output_filename, 'w') as output_file:
+        for m in moved:
+            moved_data = { 'str': str(m['correct_node']), 'signature': m['correct_node'].signature, 'new_signature': m['testing_node'].signature, 'old_parent_id': m['old_parent_id'], 'new_parent_id': m['new_parent_id'], 'size': m['size'] }
+            output_file.write(json.dumps(moved_data) + '\n')
 
 
 def PrintNodeList(node_list, indent=''):
@@ -75,44 +417,64 @@ def PrintNodeList(node_list, indent=''):
         print indent + str(n)
 
 
-def FindCommonNodes(correct_nodes, testing_nodes, debug=False):
+def FindCommonNodes(correct_nodes, testing_nodes, debug=False, only_structure=False, engine=LCS_ENGINE, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH):
     '''
     FindCommonNodes uses LCS to find the common nodes between the 
     same level of the DOM tree.
 
+    When one of the lists is wider than linear_space_width, the LCS is
+    computed in linear space instead of with the full LCS array.
+
     Returns the longest commond DOM nodes for this level and the diffs of the nodes.
     '''
-    c = SetupLCS(correct_nodes, testing_nodes, debug)
+    correct_keys = GetEqualityKeys(correct_nodes, only_structure)
+    testing_keys = GetEqualityKeys(testing_nodes, only_structure)
+    return FindCommonNodesFromKeys(correct_nodes, correct_keys, testing_nodes, testing_keys, debug, only_structure, engine, linear_space_width)
+
+
+def FindCommonNodesFromKeys(correct_nodes, correct_keys, testing_nodes, testing_keys, debug=False, only_structure=False, engine=LCS_ENGINE, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH, stats=None):
+    '''
+    Same as FindCommonNodes with the equality keys of the nodes already
+    computed.
+    '''
+    if correct_keys == testing_keys:
+        # Every node matches the node at the same position.
+        return deque(correct_nodes), deque(testing_nodes), deque()
+
+    linear_space = sibling_alignment.UseLinearSpace(correct_nodes, testing_nodes, linear_space_width)
+    if debug:
+        print 'LCS PEAK MEMORY: {0} bytes'.format(sibling_alignment.EstimateLCSMemory(len(correct_nodes), len(testing_nodes), linear_space))
+
+    if engine == ANCHOR_ENGINE or linear_space:
+        if engine == ANCHOR_ENGINE:
+            matches = sibling_alignment.AnchorAlign(correct_keys, testing_keys, linear_space_width)
+        else:
+            matches = sibling_alignment.LinearSpaceAlign(correct_keys, testing_keys)
+        if debug:
+            print 'MATCHES: ' + str(matches)
+        return GetCommonAndMissingNodesFromMatches(matches, correct_nodes, testing_nodes)
+
+    c = sibling_alignment.ComputeLCSTable(correct_keys, testing_keys)
+    if debug:
+        PrintLCSArray(c)
     correct_common_nodes = deque()
     testing_common_nodes = deque()
     missing_nodes = deque()
 
     # Find the missing nodes when there are common nodes.
-    GetCommonAndMissingNodes(c, correct_nodes, testing_nodes, len(correct_nodes) - 1, len(testing_nodes) - 1, correct_common_nodes, testing_common_nodes, missing_nodes, debug)
+    GetCommonAndMissingNodes(c, correct_nodes, testing_nodes, len(correct_nodes) - 1, len(testing_nodes) - 1, correct_common_nodes, testing_common_nodes, missing_nodes, debug, only_structure, stats)
     return correct_common_nodes, testing_common_nodes, missing_nodes
 
 
-def SetupLCS(correct_nodes, testing_nodes, debug):
+def SetupLCS(correct_nodes, testing_nodes, debug, only_structure=False):
     '''
     Computes and returns the LCS 2-D array.
     '''
-    # Setup the LCS array
-    c = [[ 0 for x in range(len(testing_nodes) + 1) ] for y in range(len(correct_nodes) + 1) ]
-
-    # Compute LCS
-    # for i, correct_node in enumerate(correct_nodes):
-    #     for j, testing_node in enumerate(testing_nodes):
-    #         if NodesEqual(correct_node, testing_node):
-    #             c[i + 1][j + 1] = c[i][j] + 1
-    #         else:
-    #             c[i + 1][j + 1] = max(c[i + 1][j], c[i][j + 1])
-    for i, correct_node in enumerate(correct_nodes):
-        for j, testing_node in enumerate(testing_nodes):
-            if NodesEqual(correct_node, testing_node):
-                c[i][j] = c[i - 1][j - 1] + 1
-            else:
-                c[i][j] = max(c[i][j - 1], c[i - 1][j])
-    
+    correct_keys = GetEqualityKeys(correct_nodes, only_structure)
+    testing_keys = GetEqualityKeys(testing_nodes, only_structure)
+
+    c = sibling_alignment.ComputeLCSTable(correct_keys, testing_keys)
+
     if debug:
         PrintLCSArray(c)
     return c
@@ -127,40 +489,68 @@ def PrintLCSArray(c):
         print line
 
 
-def GetCommonAndMissingNodes(lcs_arr, correct_nodes, testing_nodes, i, j, correct_common_nodes, testing_common_nodes, missing_nodes, debug):
+def GetCommonAndMissingNodes(lcs_arr, correct_nodes, testing_nodes, i, j, correct_common_nodes, testing_common_nodes, missing_nodes, debug, only_structure=False, stats=None):
     '''
     Returns the nodes that are missing from the correct nodes.
+
+    The LCS array is backtracked iteratively from (i, j), so the width of
+    the lists is not bounded by the recursion limit.
     '''
-    if i < 0 and j < 0:
-        pass
-    elif i < 0:
-        # print_diff(c, x, y, i, j-1)
-        GetCommonAndMissingNodes(lcs_arr, correct_nodes, testing_nodes, i, j - 1, correct_common_nodes, testing_common_nodes, missing_nodes, debug)
-    elif j < 0:
-        missing_nodes.appendleft(correct_nodes[i])
-        GetCommonAndMissingNodes(lcs_arr, correct_nodes, testing_nodes, i - 1, j, correct_common_nodes, testing_common_nodes,  missing_nodes, debug)
-    elif NodesEqual(correct_nodes[i], testing_nodes[j]):
-        correct_common_nodes.appendleft(correct_nodes[i])
-        testing_common_nodes.appendleft(testing_nodes[j])
-        GetCommonAndMissingNodes(lcs_arr, correct_nodes, testing_nodes, i - 1, j - 1, correct_common_nodes, testing_common_nodes, missing_nodes, debug)
-    elif lcs_arr[i][j-1] >= lcs_arr[i-1][j]:
-        GetCommonAndMissingNodes(lcs_arr, correct_nodes, testing_nodes, i, j - 1, correct_common_nodes, testing_common_nodes, missing_nodes, debug)
-        # print("+ " + y[j])
-    elif lcs_arr[i][j-1] < lcs_arr[i-1][j]:
-        missing_nodes.appendleft(correct_nodes[i])
-        GetCommonAndMissingNodes(lcs_arr, correct_nodes, testing_nodes, i - 1, j, correct_common_nodes, testing_common_nodes, missing_nodes, debug)
-
-
-def NodesEqual(node_a, node_b):
+    nodes_equal_calls = 0
+    while i >= 0:
+        if j < 0:
+            missing_nodes.appendleft(correct_nodes[i])
+            i -= 1
+            continue
+        nodes_equal_calls += 1
+        if NodesEqual(correct_nodes[i], testing_nodes[j], only_structure):
+            correct_common_nodes.appendleft(correct_nodes[i])
+            testing_common_nodes.appendleft(testing_nodes[j])
+            i -= 1
+            j -= 1
+        elif lcs_arr[i][j-1] >= lcs_arr[i-1][j]:
+            j -= 1
+        else:
+            missing_nodes.appendleft(correct_nodes[i])
+            i -= 1
+    if stats is not None:
+        stats.Count('nodes_equal_calls', nodes_equal_calls)
+
+
+def GetCommonAndMissingNodesFromMatches(matches, correct_nodes, testing_nodes):
+    '''
+    Returns the common nodes of both sides and the missing nodes given the
+    list of matching (correct index, testing index) pairs.
+    '''
+    correct_common_nodes = deque()
+    testing_common_nodes = deque()
+    missing_nodes = deque()
+    next_correct_index = 0
+    for i, j in matches:
+        missing_nodes.extend(correct_nodes[next_correct_index:i])
+        correct_common_nodes.append(correct_nodes[i])
+        testing_common_nodes.append(testing_nodes[j])
+        next_correct_index = i + 1
+    missing_nodes.extend(correct_nodes[next_correct_index:])
+    return correct_common_nodes, testing_common_nodes, missing_nodes
+
+
+def NodesEqual(node_a, node_b, only_structure=False):
     '''
     Returns true if node_a and node_b are equal in some way: structurally or the whole node.
     '''
-    try:
-        if args.only_structure:
-            return node_a.CompareStructure(node_b)
-    except:
-        pass
-    return node_a == node_b
+    if only_structure:
+        return node_a.structure_key == node_b.structure_key
+    return node_a.key == node_b.key
+
+
+def GetEqualityKeys(nodes, only_structure=False):
+    '''
+    Returns the list of interned equality keys of the nodes.
+    '''
+    if only_structure:
+        return [ n.structure_key for n in nodes ]
+    return [ n.key for n in nodes ]
 
 
 def FindNodeIndex(target, nodes):
@@ -173,15 +563,36 @@ def FindNodeIndex(target, nodes):
     return -1
 
 
-if __name__ == '__main__':
+def CreateArgumentParser():
+    '''
+    Returns the parser of the command line arguments of Main.
+    '''
     parser = ArgumentParser()
     parser.add_argument('dom_tree_a')
     parser.add_argument('dom_tree_b')
     parser.add_argument('--hdp', default=False, action='store_true')
     parser.add_argument('--only-structure', default=False, action='store_true')
+    parser.add_argument('--alignment-engine', default=LCS_ENGINE, choices=ALIGNMENT_ENGINES)
+    parser.add_argument('--linear-space-width', default=DEFAULT_LINEAR_SPACE_WIDTH, type=int)
+    parser.add_argument('--workers', default=1, type=int, help='compare the large matched subtrees in this many processes')
+    parser.add_argument('--parallel-min-subtree-size', default=DEFAULT_MIN_SUBTREE_SIZE, type=int, help='the smallest matched subtree that is sent to a worker')
     parser.add_argument('--dump-common-tree', default=None)
     parser.add_argument('--dump-missing-nodes', default=None)
+    parser.add_argument('--detect-moves', default=False, action='store_true', help='report the missing subtrees that moved elsewhere in the tree as moved')
+    parser.add_argument('--min-moved-size', default=DEFAULT_MIN_MOVED_SIZE, type=int)
+    parser.add_argument('--dump-moved-nodes', default=None)
     parser.add_argument('--debug', default=False, action='store_true')
     parser.add_argument('--raw-html', default=False, action='store_true')
-    args = parser.parse_args()
+    parser.add_argument('--html-parser', default=DEFAULT_HTML_PARSER, choices=HTML_PARSERS)
+    parser.add_argument('--streaming-json', default=False, action='store_true')
+    parser.add_argument('--compact-tree', default=False, action='store_true')
+    parser.add_argument('--cache-dir', default=None, help='directory of the on-disk cache of built DOM trees')
+    parser.add_argument('--cache-max-bytes', default=DEFAULT_MAX_BYTES, type=int)
+    parser.add_argument('--skip-above-similarity', default=None, type=float, help='skip the diff when the estimated similarity of the pages is at least this')
+    parser.add_argument('--stats-file', default=None, help='JSONL file where the timing and the counters of the comparison are appended')
+    return parser
+
+
+if __name__ == '__main__':
+    args = CreateArgumentParser().parse_args()
     Main()
@@ -1,6 +1,10 @@
 from DOMNode import DOMNode, ConstructDOMNodeObj
+from diff_stats import DiffStats
+from DOMTree import DOMTree
+from StringIO import StringIO
 
 import find_tree_diff
+import json
 import unittest
 
 class TestDOMNode(unittest.TestCase):
@@ -140,5 +144,92 @@ class TestDOMNode(unittest.TestCase):
             self.assertEquals(expected[i], missing_nodes[i])
 
 
+    def test_anchor_engine(self):
+        # The anchor engine returns the same results as the LCS engine when
+        # nodes are inserted between identical runs.
+        dom1 = [ DOMNode(i, 'div', '', { 'class': 'item-{0}'.format(i % 3) }, -1, '') for i in range(12) ]
+        dom2 = dom1[:4] + [ DOMNode(100, 'div', '', { 'class': 'ad' }, -1, '') ] + dom1[4:10]
+
+        expected = find_tree_diff.FindCommonNodes(dom1, dom2)
+        got = find_tree_diff.FindCommonNodes(dom1, dom2, engine=find_tree_diff.ANCHOR_ENGINE)
+        for expected_nodes, got_nodes in zip(expected, got):
+            self.assertEquals(list(expected_nodes), list(got_nodes))
+
+
+    def test_wide_sibling_list(self):
+        # Wider than the recursion limit.
+        dom1 = [ DOMNode(i, 'li', str(i % 7), {}, -1, '') for i in range(1500) ]
+        dom2 = [ n for n in dom1 if n.id % 10 != 0 ]
+
+        for linear_space_width in [ None, 500 ]:
+            common_nodes, testing_common_nodes, missing_nodes = find_tree_diff.FindCommonNodes(dom1, dom2, linear_space_width=linear_space_width)
+            self.assertEquals(len(dom2), len(common_nodes))
+            self.assertEquals(len(dom2), len(testing_common_nodes))
+            self.assertEquals(len(dom1) - len(dom2), len(missing_nodes))
+
+
+    def test_prepared_baseline(self):
+        # The prepared baseline gives the same results as CompareDOMTrees for
+        # every testing tree.
+        correct_html = '<html><body><div class="a"><p>1</p><p>2</p></div><ul><li>x</li><li>y</li><li>z</li></ul><span>s</span></body></html>'
+        testing_htmls = [
+            correct_html,
+            '<html><body><div class="a"><p>1</p></div><ul><li>x</li><li>z</li></ul><span>s</span></body></html>',
+            '<html><body><ul><li>y</li></ul><div class="a"><p>2</p><p>1</p></div></body></html>',
+            '<html><body></body></html>',
+        ]
+        correct_dom = DOMTree(correct_html)
+        for only_structure in [ False, True ]:
+            prepared = find_tree_diff.PreparedBaseline(correct_dom, only_structure)
+            results = list(prepared.DiffMany([ DOMTree(html) for html in testing_htmls ]))
+            self.assertEquals(len(testing_htmls), len(results))
+            for html, (common_dom_tree, missing_nodes) in zip(testing_htmls, results):
+                expected_tree, expected_missing = find_tree_diff.CompareDOMTrees(correct_dom, DOMTree(html), only_structure)
+                self.assertEquals(expected_tree.size, common_dom_tree.size)
+                self.assertEquals(json.dumps(expected_tree.Serialize()), json.dumps(common_dom_tree.Serialize()))
+                self.assertEquals([ n.id for n in expected_missing ], [ n.id for n in missing_nodes ])
+            self.assertEquals(correct_dom.size, results[0][0].size)
+
+
+    def test_subtree_hash_collision(self):
+        # A subtree whose hash collides with the correct one is still
+        # compared node by node.
+        correct_dom = DOMTree('<html><body><div><p>1</p><p>2</p></div></body></html>')
+        testing_dom = DOMTree('<html><body><div><p>1</p><p>3</p></div></body></html>')
+        testing_dom._subtree_hashes = dict(correct_dom._subtree_hashes)
+        common_dom_tree, missing_nodes = find_tree_diff.PreparedBaseline(correct_dom).Diff(testing_dom)
+        self.assertEquals([ '2' ], [ n.value for n in missing_nodes ])
+        self.assertEquals(correct_dom.size - 1, common_dom_tree.size)
+
+        # The identical subtrees are still matched as a whole.
+        stats = DiffStats()
+        find_tree_diff.PreparedBaseline(correct_dom).Diff(DOMTree('<html><body><div><p>1</p><p>2</p></div></body></html>'), stats=stats)
+        self.assertEquals(1, stats.counters['subtrees_matched'])
+
+
+    def test_iter_diff_events(self):
+        # The events of IterDiff add up to the result of Diff, and the
+        # missing nodes written by StreamDiff are the ones of Diff.
+        correct_dom = DOMTree('<html><body><div class="a"><p>1</p><p>2</p></div><ul><li>x</li><li>y</li></ul></body></html>')
+        testing_dom = DOMTree('<html><body><div class="a"><p>1</p><p>2</p></div><ul><li>x</li><li>w</li></ul></body></html>')
+        prepared = find_tree_diff.PreparedBaseline(correct_dom)
+        added_nodes = []
+        expected_tree, expected_missing = prepared.Diff(testing_dom, added_nodes=added_nodes)
+
+        events = list(prepared.IterDiff(testing_dom))
+        self.assertEquals((find_tree_diff.MATCHED_EVENT, correct_dom.root_node, testing_dom.root_node, None), events[0])
+        event_types = set([ e[0] for e in events ])
+        self.assertTrue(find_tree_diff.SUBTREE_MATCHED_EVENT in event_types)
+        self.assertTrue(find_tree_diff.LEVEL_FINISHED_EVENT in event_types)
+        self.assertEquals([ n.id for n in expected_missing ], [ e[1].id for e in events if e[0] == find_tree_diff.MISSING_EVENT ])
+        self.assertEquals([ n.id for n in added_nodes ], [ e[2].id for e in events if e[0] == find_tree_diff.ADDED_EVENT ])
+
+        missing_file = StringIO()
+        common_dom_tree, missing_count = find_tree_diff.StreamDiff(correct_dom, testing_dom, missing_file)
+        self.assertEquals(len(expected_missing), missing_count)
+        self.assertEquals(json.dumps(expected_tree.Serialize()), json.dumps(common_dom_tree.Serialize()))
+        self.assertEquals(''.join([ find_tree_diff.GetMissingNodeLine(n) for n in expected_missing ]), missing_file.getvalue())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,296 @@
+from argparse import ArgumentParser
+from html_parsers import DEFAULT_HTML_PARSER, HTML_PARSERS
+from interning import RegisterTable
+
+import hashlib
+import heapq
+import struct
+import time
+import utils
+
+# The number of hashes kept in each MinHash sketch. The error of the
+# similarity estimate is about 1 / sqrt(DEFAULT_SKETCH_SIZE).
+DEFAULT_SKETCH_SIZE = 128
+
+SIMHASH_BITS = 64
+_MASK = (1 << 64) - 1
+
+# The number of the nearest ancestors whose types are part of the shingle of
+# a node.
+ANCESTOR_PATH_LENGTH = 3
+
+# Bump this when the shingles change, so the cached fingerprints are
+# computed again.
+FINGERPRINT_VERSION = 2
+
+# The stable 64-bit hashes of the interned equality keys. The interned keys
+# differ between processes, so they cannot be persisted themselves. They
+# are emptied with the intern tables.
+_full_key_hashes = RegisterTable('full_key_hashes', {})
+_structure_key_hashes = RegisterTable('structure_key_hashes', {})
+_type_hashes = RegisterTable('type_hashes', {})
+
+class PageFingerprint(object):
+    '''
+    The sketches of a DOM tree that estimate the similarity of two pages
+    without diffing them.
+
+    The shingle of a node is the node itself and the types of its
+    ANCESTOR_PATH_LENGTH nearest ancestors, hashed into 64 bits. Only the
+    types of the ancestors are used, so a change of the attributes or the
+    value of an ancestor does not change the shingles of its descendants.
+    The full variant hashes each node as DOMNode.key does and the structure
+    variant as structure_key does.
+    Each MinHash sketch keeps the sketch_size smallest distinct shingles.
+    The SimHash is over the full shingles weighted by their count.
+    '''
+    def __init__(self, size, minhash, structure_minhash, simhash, sketch_size=DEFAULT_SKETCH_SIZE):
+        self.size = size
+        self.minhash = minhash
+        self.structure_minhash = structure_minhash
+        self.simhash = simhash
+        self.sketch_size = sketch_size
+        self._minhash_set = frozenset(minhash)
+        self._structure_minhash_set = frozenset(structure_minhash)
+
+
+    def Similarity(self, other, only_structure=False):
+        '''
+        Returns the estimated Jaccard similarity of the shingles of the pages.
+        '''
+        if only_structure:
+            return EstimateJaccard(self._structure_minhash_set, other._structure_minhash_set, self.sketch_size)
+        return EstimateJaccard(self._minhash_set, other._minhash_set, self.sketch_size)
+
+
+    def SimHashSimilarity(self, other):
+        '''
+        Returns the fraction of the bits of the SimHashes that are equal.
+        '''
+        return 1.0 - bin(self.simhash ^ other.simhash).count('1') / float(SIMHASH_BITS)
+
+
+    def ToRecord(self):
+        '''
+        Returns the fingerprint as a tuple of plain values, for marshal.
+        '''
+        return (FINGERPRINT_VERSION, self.size, self.minhash, self.structure_minhash, self.simhash, self.sketch_size)
+
+
+    @staticmethod
+    def FromRecord(record):
+        _, size, minhash, structure_minhash, simhash, sketch_size = record
+        return PageFingerprint(size, minhash, structure_minhash, simhash, sketch_size)
+
+
+def ComputeFingerprint(dom_tree, sketch_size=DEFAULT_SKETCH_SIZE):
+    '''
+    Returns the PageFingerprint of the tree, computed in one depth-first pass.
+    '''
+    if dom_tree.root_node is None:
+        return PageFingerprint(0, [], [], 0, sketch_size)
+    full_sketch = _BottomSketch(sketch_size)
+    structure_sketch = _BottomSketch(sketch_size)
+    full_counts = {}
+    size = 0
+    # Each item is the node, the type hashes of its nearest ancestors and
+    # the hash of that path.
+    stack = [ (dom_tree.root_node, (), 0) ]
+    while len(stack) > 0:
+        node, ancestors, path_hash = stack.pop()
+        full = MixHash(path_hash, GetFullKeyHash(node))
+        structure = MixHash(path_hash, GetStructureKeyHash(node))
+        full_sketch.Add(full)
+        structure_sketch.Add(structure)
+        full_counts[full] = full_counts.get(full, 0) + 1
+        size += 1
+        children = dom_tree.GetChildren(node.id)
+        if len(children) > 0:
+            child_ancestors = (ancestors + (GetTypeHash(node.type),))[-ANCESTOR_PATH_LENGTH:]
+            child_path_hash = 0
+            for type_hash in child_ancestors:
+                child_path_hash = MixHash(child_path_hash, type_hash)
+            stack.extend([ (child, child_ancestors, child_path_hash) for child in children ])
+    return PageFingerprint(size, full_sketch.Sorted(), structure_sketch.Sorted(), ComputeSimHash(full_counts), sketch_size)
+
+
+class _BottomSketch(object):
+    '''
+    Keeps the smallest distinct values that were added.
+    '''
+    def __init__(self, sketch_size):
+        self.sketch_size = sketch_size
+        # A max-heap of the values, as a min-heap of the negated values.
+        self.heap = []
+        self.values = set()
+
+    def Add(self, value):
+        if value in self.values:
+            return
+        if len(self.heap) < self.sketch_size:
+            heapq.heappush(self.heap, -value)
+            self.values.add(value)
+        elif value < -self.heap[0]:
+            self.values.discard(-heapq.heapreplace(self.heap, -value))
+            self.values.add(value)
+
+    def Sorted(self):
+        return sorted(self.values)
+
+
+def EstimateJaccard(set_a, set_b, sketch_size):
+    '''
+    Returns the bottom-k estimate of the Jaccard similarity from the values
+    of two sketches: the fraction of the smallest values of their union that
+    are in both.
+    '''
+    if len(set_a) == 0 and len(set_b) == 0:
+        return 1.0
+    union = heapq.nsmallest(sketch_size, set_a | set_b)
+    both = 0
+    for value in union:
+        if value in set_a and value in set_b:
+            both += 1
+    return both / float(len(union))
+
+
+def ComputeSimHash(counts):
+    '''
+    Returns the SimHash of the weighted 64-bit values.
+    '''
+    simhash = 0
+    total = sum(counts.itervalues())
+    # The counts are summed by the value of each byte first, so the bits are
+    # weighted from 256 sums instead of from all the values.
+    for shift in xrange(0, SIMHASH_BITS, 8):
+        byte_counts = [ 0 ] * 256
+        for h, c in counts.iteritems():
+            byte_counts[(h >> shift) & 0xFF] += c
+        for bit in xrange(8):
+            weight = sum([ c for b, c in enumerate(byte_counts) if b & (1 << bit) ])
+            if 2 * weight > total:
+                simhash |= 1 << (shift + bit)
+    return simhash
+
+
+def MixHash(parent_hash, node_hash):
+    '''
+    Returns the 64-bit hash of a node under a parent with the given hash.
+    '''
+    x = ((parent_hash * 0x9E3779B97F4A7C15) ^ node_hash) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def GetFullKeyHash(node):
+    key_hash = _full_key_hashes.get(node.key)
+    if key_hash is None:
+        key_hash = _full_key_hashes[node.key] = ComputeFullKeyHash(node)
+    return key_hash
+
+
+def ComputeFullKeyHash(node):
+    '''
+    Returns the stable hash of the node as DOMNode.key compares it, without
+    keeping it in the table of the interned keys.
+    '''
+    other_attrs = []
+    for k, v in node.attributes.iteritems():
+        if k != 'class':
+            other_attrs.append(EncodeText(k) + '=' + EncodeText(v))
+    return StableHash([ node.type, node.value ] + sorted(other_attrs) + GetClassParts(node.attributes))
+
+
+def GetStructureKeyHash(node):
+    key_hash = _structure_key_hashes.get(node.structure_key)
+    if key_hash is None:
+        attributes = node.attributes
+        id_parts = [ 'id', attributes['id'] ] if 'id' in attributes else [ 'no id' ]
+        key_hash = StableHash([ node.type, str(len(attributes)) ] + id_parts + GetClassParts(attributes))
+        _structure_key_hashes[node.structure_key] = key_hash
+    return key_hash
+
+
+def GetTypeHash(node_type):
+    type_hash = _type_hashes.get(node_type)
+    if type_hash is None:
+        type_hash = StableHash([ 'type', node_type ])
+        _type_hashes[node_type] = type_hash
+    return type_hash
+
+
+def GetClassParts(attributes):
+    '''
+    Returns the class attribute as it is compared by the equality keys: the
+    number of classes and the set of classes.
+    '''
+    if 'class' not in attributes:
+        return [ 'no class' ]
+    class_names = attributes['class'].split()
+    return [ 'class', str(len(class_names)) ] + sorted(set(class_names))
+
+
+def StableHash(parts):
+    '''
+    Returns a 64-bit hash of the strings that is the same in every process.
+    '''
+    digest = hashlib.md5('\x1f'.join([ EncodeText(p) for p in parts ])).digest()
+    return struct.unpack('<Q', digest[:8])[0]
+
+
+def EncodeText(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return str(text)
+
+
+def GetFileFingerprint(dom_tree_filename, for_hdp, raw_html=False, streaming=False, html_parser=None, compact=False, cache=None, sketch_size=DEFAULT_SKETCH_SIZE, stats=None):
+    '''
+    Returns the fingerprint of the dom tree file and the tree when it had to
+    be built. With a cache, the fingerprint is stored next to the cached tree
+    and is read back without building the tree, in which case the tree is
+    None.
+    '''
+    key = None
+    if cache is not None:
+        key = cache.ComputeKey(dom_tree_filename, for_hdp, raw_html, html_parser)
+        record = cache.GetFingerprint(key)
+        if record is not None and len(record) == 6 and record[0] == FINGERPRINT_VERSION and record[-1] == sketch_size:
+            return PageFingerprint.FromRecord(record), None
+    dom_tree = utils.GetDOMTree(dom_tree_filename, for_hdp, raw_html, streaming, html_parser, compact, cache, stats)
+    fingerprint = ComputeFingerprint(dom_tree, sketch_size)
+    if cache is not None:
+        cache.PutFingerprint(key, fingerprint.ToRecord())
+    return fingerprint, dom_tree
+
+
+def Main():
+    fingerprints = []
+    for filename in [ args.dom_tree_a, args.dom_tree_b ]:
+        start = time.time()
+        fingerprint, _ = GetFileFingerprint(filename, args.hdp, args.raw_html, html_parser=args.html_parser, sketch_size=args.sketch_size)
+        print '{0}: {1} nodes in {2:.4f}s'.format(filename, fingerprint.size, time.time() - start)
+        fingerprints.append(fingerprint)
+    start = time.time()
+    similarity = fingerprints[0].Similarity(fingerprints[1])
+    estimate_seconds = time.time() - start
+    print 'minhash: {0:.4f}'.format(similarity)
+    print 'structure minhash: {0:.4f}'.format(fingerprints[0].Similarity(fingerprints[1], True))
+    print 'simhash: {0:.4f}'.format(fingerprints[0].SimHashSimilarity(fingerprints[1]))
+    print 'estimate: {0:.1f}us'.format(estimate_seconds * 1e6)
+    if args.threshold is not None:
+        print 'SIMILAR' if similarity >= args.threshold else 'DIFFERENT'
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('dom_tree_a')
+    parser.add_argument('dom_tree_b')
+    parser.add_argument('--hdp', default=False, action='store_true')
+    parser.add_argument('--raw-html', default=False, action='store_true')
+    parser.add_argument('--html-parser', default=DEFAULT_HTML_PARSER, choices=HTML_PARSERS)
+    parser.add_argument('--sketch-size', default=DEFAULT_SKETCH_SIZE, type=int)
+    parser.add_argument('--threshold', default=None, type=float, help='the similarity at or above which the pages are reported as similar')
+    args = parser.parse_args()
+    Main()
@@ -0,0 +1,96 @@
+from DOMTree import DOMTree
+from tree_cache import FINGERPRINT_SUFFIX, TreeCache
+
+import dom_generator
+import fingerprint
+import marshal
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+class TestFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        generator = dom_generator.PageGenerator(seed=2, depth=5)
+        self.page = generator.GeneratePage()
+        self.paths = dom_generator.WritePagePair(self.tmp_dir, generator)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def test_similarity(self):
+        '''
+        Tests that a page is similar to itself and more similar to its
+        mutated copy than to another page.
+        '''
+        fingerprint_a, dom_a = fingerprint.GetFileFingerprint(self.paths['a_json'], False)
+        fingerprint_b, _ = fingerprint.GetFileFingerprint(self.paths['b_json'], False)
+        other = fingerprint.ComputeFingerprint(DOMTree(dom_generator.ToDevToolsJSON(self.page)['result']['root']))
+        self.assertEqual(dom_a.size, fingerprint_a.size)
+        self.assertEqual(1.0, fingerprint_a.Similarity(fingerprint.ComputeFingerprint(dom_a)))
+        self.assertEqual(1.0, fingerprint_a.SimHashSimilarity(fingerprint.ComputeFingerprint(dom_a)))
+        self.assertTrue(fingerprint_a.Similarity(fingerprint_b) > fingerprint_a.Similarity(other))
+        self.assertTrue(0.0 < fingerprint_a.Similarity(fingerprint_b, True) < 1.0)
+
+
+    def test_ancestor_churn(self):
+        '''
+        Tests that a change of the attributes of an ancestor does not change
+        the shingles of its descendants.
+        '''
+        fingerprint_a = fingerprint.ComputeFingerprint(DOMTree(dom_generator.ToDevToolsJSON(self.page)['result']['root']))
+        dom_json = dom_generator.ToDevToolsJSON(self.page)
+        stack = [ dom_json['result']['root'] ]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node['nodeName'].lower() == 'body':
+                node['attributes'] = node.get('attributes', []) + [ 'class', 'churned' ]
+                break
+            stack.extend(node.get('children', []))
+        fingerprint_b = fingerprint.ComputeFingerprint(DOMTree(dom_json['result']['root']))
+        self.assertTrue(fingerprint_a.Similarity(fingerprint_b) > 0.9)
+        self.assertTrue(fingerprint_a.Similarity(fingerprint_b, True) > 0.9)
+
+
+    def test_stable(self):
+        '''
+        Tests that the fingerprint does not depend on the format of the page
+        or on the process.
+        '''
+        fingerprint_json, _ = fingerprint.GetFileFingerprint(self.paths['a_json'], False)
+        fingerprint_html, _ = fingerprint.GetFileFingerprint(self.paths['a_html'], False, True)
+        # The HTML has the doctype node in addition.
+        self.assertEqual(fingerprint_json.size + 1, fingerprint_html.size)
+        self.assertTrue(fingerprint_json.Similarity(fingerprint_html) > 0.98)
+
+        code = 'import fingerprint, marshal, sys; sys.stdout.write(marshal.dumps(fingerprint.GetFileFingerprint(sys.argv[1], False)[0].ToRecord()))'
+        output = subprocess.check_output([ sys.executable, '-c', code, self.paths['a_json'] ], cwd=os.path.dirname(os.path.abspath(fingerprint.__file__)))
+        self.assertEqual(fingerprint_json.ToRecord(), marshal.loads(output))
+
+
+    def test_cache(self):
+        '''
+        Tests that the fingerprint is read from the cache without the tree.
+        '''
+        cache = TreeCache(os.path.join(self.tmp_dir, 'cache'))
+        first, dom_tree = fingerprint.GetFileFingerprint(self.paths['a_json'], False, cache=cache)
+        self.assertNotEqual(None, dom_tree)
+        second, dom_tree = fingerprint.GetFileFingerprint(self.paths['a_json'], False, cache=cache)
+        self.assertEqual(None, dom_tree)
+        self.assertEqual(first.ToRecord(), second.ToRecord())
+
+        # The fingerprint is evicted with its tree.
+        cache.max_bytes = 0
+        with cache.Lock():
+            cache.Evict()
+        self.assertEqual([], [ f for f in os.listdir(cache.cache_dir) if f.endswith(FINGERPRINT_SUFFIX) ])
+
+
+if __name__ == '__main__':
+    unittest.main()
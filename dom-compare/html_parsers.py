@@ -0,0 +1,49 @@
+import sys
+
+# The HTML parser backends for --raw-html. All of them produce a BeautifulSoup
+# document, so the DOM tree is built in the same way for every backend.
+HTML5LIB_PARSER = 'html5lib'
+LXML_PARSER = 'lxml'
+HTML5_PARSER = 'html5-parser'
+HTML_PARSERS = [ HTML5LIB_PARSER, LXML_PARSER, HTML5_PARSER ]
+
+DEFAULT_HTML_PARSER = HTML5LIB_PARSER
+
+def ParseHtml(html, html_parser=DEFAULT_HTML_PARSER):
+    '''
+    Parses the HTML with the given backend and returns the BeautifulSoup document.
+
+    html5lib is the reference html5 parser. html5-parser is an html5 compliant
+    parser written in C and is much faster. lxml is fast, but it does not
+    follow the html5 parsing rules for malformed pages.
+    '''
+    if html_parser == HTML5_PARSER:
+        import html5_parser
+        return html5_parser.parse(html, treebuilder='soup', return_root=False)
+    if html_parser in [ HTML5LIB_PARSER, LXML_PARSER ]:
+        import bs4
+        return bs4.BeautifulSoup(html, html_parser)
+    raise ValueError('Unknown HTML parser: {0}'.format(html_parser))
+
+
+def IsParsedHtml(html):
+    '''
+    Returns whether html is a document returned by ParseHtml.
+    '''
+    # There is no document before bs4 is imported, and bs4 is only imported
+    # for the HTML inputs.
+    if 'bs4' not in sys.modules:
+        return False
+    return isinstance(html, sys.modules['bs4'].BeautifulSoup)
+
+
+def IsParserAvailable(html_parser):
+    '''
+    Returns whether the module of the given backend is installed.
+    '''
+    module_name = { HTML5LIB_PARSER: 'html5lib', LXML_PARSER: 'lxml', HTML5_PARSER: 'html5_parser' }[html_parser]
+    try:
+        __import__(module_name)
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,61 @@
+from DOMTree import DOMTree
+
+import html_parsers
+import unittest
+
+# Well-formed pages for which every backend must build the same tree.
+CORPUS = [
+    '<html><head><link rel="preload" href="foo.js"></link></head><body><div>Hello world</div></body></html>',
+    '''<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8">
+    <title>Test &amp; page</title>
+    <script src="a.js"></script>
+    <style>.a { color: red; }</style>
+  </head>
+  <body class="home page">
+    <!-- navigation -->
+    <nav id="nav"><ul><li><a href="/">Home</a></li><li><a href="/about" class="b a">About</a></li></ul></nav>
+    <div style="display: none">hidden</div>
+    <main>
+      <p>Some <b>bold</b> and <i>italic</i> text.</p>
+      <table><tbody><tr><td>1</td><td>2</td></tr></tbody></table>
+      <img src="x.png" alt="x">
+    </main>
+  </body>
+</html>''',
+    '<!DOCTYPE html><html><head></head><body><div id="grid">' + ''.join([ '<div class="item item-{0}"><span>{0}</span></div>'.format(i) for i in range(50) ]) + '</div></body></html>',
+]
+
+class TestHtmlParsers(unittest.TestCase):
+
+    def assertSameTree(self, expected, got):
+        self.assertEqual(expected.size, got.size)
+        for expected_node, got_node in zip(iter(expected), iter(got)):
+            self.assertEqual(expected_node, got_node)
+            self.assertEqual(expected_node.id, got_node.id)
+            self.assertEqual(expected_node.parent_id, got_node.parent_id)
+            self.assertEqual(expected_node.signature, got_node.signature)
+
+
+    def test_conformance(self):
+        '''
+        Tests that all the installed backends build equal trees on the corpus.
+        '''
+        for html_parser in html_parsers.HTML_PARSERS:
+            if not html_parsers.IsParserAvailable(html_parser):
+                continue
+            for html in CORPUS:
+                for for_hdp in [ False, True ]:
+                    expected = DOMTree(html, for_hdp, html_parsers.HTML5LIB_PARSER)
+                    got = DOMTree(html, for_hdp, html_parser)
+                    self.assertSameTree(expected, got)
+
+
+    def test_unknown_parser(self):
+        self.assertRaises(ValueError, html_parsers.ParseHtml, '<html></html>', 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
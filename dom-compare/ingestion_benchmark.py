@@ -0,0 +1,49 @@
+from argparse import ArgumentParser
+
+import json
+import resource
+import subprocess
+import sys
+import time
+import utils
+
+# The ingestion paths that are compared.
+PATHS = [ 'json', 'streaming' ]
+
+def Main():
+    if args.path is not None:
+        # Child process: load the dump with a single path.
+        print json.dumps(LoadDOMTree(args.dom_tree, args.path, args.hdp))
+        return
+
+    # Each path runs in its own process so that the peak RSS is not shared.
+    for path in PATHS:
+        command = [ sys.executable, __file__, args.dom_tree, '--path', path ]
+        if args.hdp:
+            command.append('--hdp')
+        result = json.loads(subprocess.check_output(command))
+        print '{0}: {1:.3f}s peak RSS {2} KB ({3} nodes)'.format(path, result['seconds'], result['max_rss_kb'], result['size'])
+
+
+def LoadDOMTree(dom_tree_filename, path, for_hdp):
+    '''
+    Loads the DOM tree with the given ingestion path and returns the time
+    and the peak RSS of the process.
+    '''
+    start = time.time()
+    tree = utils.GetDOMTree(dom_tree_filename, for_hdp, streaming=(path == 'streaming'))
+    return {
+        'path': path,
+        'seconds': time.time() - start,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'size': tree.size,
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('dom_tree')
+    parser.add_argument('--hdp', default=False, action='store_true')
+    parser.add_argument('--path', default=None, choices=PATHS)
+    args = parser.parse_args()
+    Main()
@@ -0,0 +1,93 @@
+import threading
+
+# The intern tables map the equality keys and the signatures of the nodes to
+# small ints, so comparisons in the diff only compare ints. The tables are
+# shared by all the trees of the process: the ids of two trees can only be
+# compared when both trees were built from the same generation of the
+# tables.
+#
+# The tables only grow while trees are built, so the processes that build
+# many trees drop every tree they hold and call ResetInternTables to release
+# them: the batch workers after each pair, the corpus indexer after each
+# batch of pages, and the daemon and the snapshot series once the tables
+# have more than DEFAULT_MAX_INTERNED_KEYS entries. A tree built before a
+# reset must not be compared with a tree built after it.
+
+# The number of entries of all the tables above which the long-running
+# processes drop their trees and reset the tables.
+DEFAULT_MAX_INTERNED_KEYS = 4000000
+
+# Guards the insertion of new ids. The trees may be built on several
+# threads, and an id must never be handed to two keys.
+_lock = threading.Lock()
+
+# The registered tables, as (name, table, reset) where reset empties the
+# table.
+_tables = []
+
+# The number of times the tables were reset.
+_generation = 0
+
+def RegisterTable(name, table, reset=None):
+    '''
+    Registers the intern table with the given name so that it is reported
+    by GetTableSizes and emptied by ResetInternTables. reset empties the
+    table and is table.clear by default. Returns the table.
+    '''
+    _tables.append((name, table, reset if reset is not None else table.clear))
+    return table
+
+
+def InternKey(key, key_ids):
+    '''
+    Returns the small int that represents key in key_ids.
+    '''
+    key_id = key_ids.get(key)
+    if key_id is None:
+        with _lock:
+            key_id = key_ids.get(key)
+            if key_id is None:
+                key_id = len(key_ids)
+                key_ids[key] = key_id
+    return key_id
+
+
+def GetLock():
+    '''
+    Returns the lock that guards the insertion into the tables, for the
+    tables that are not filled by InternKey.
+    '''
+    return _lock
+
+
+def ResetInternTables():
+    '''
+    Empties all the intern tables and starts a new generation. The trees
+    built before the reset must no longer be used.
+    '''
+    global _generation
+    with _lock:
+        for _, _, reset in _tables:
+            reset()
+        _generation += 1
+
+
+def GetGeneration():
+    '''
+    Returns the generation of the tables, which changes on each reset.
+    '''
+    return _generation
+
+
+def GetTableSizes():
+    '''
+    Returns the map of the name of each table to its number of entries.
+    '''
+    return { name: len(table) for name, table, _ in _tables }
+
+
+def GetInternedKeyCount():
+    '''
+    Returns the number of entries of all the tables.
+    '''
+    return sum(GetTableSizes().values())
@@ -0,0 +1,59 @@
+from DOMNode import DOMNode
+
+import interning
+import sys
+import threading
+import unittest
+
+class TestInterning(unittest.TestCase):
+
+    def test_concurrent_intern_key(self):
+        '''
+        Tests that keys interned on concurrent threads get distinct ids.
+        '''
+        key_ids = {}
+        def InternKeys(thread_index):
+            for i in xrange(20000):
+                interning.InternKey((thread_index, i), key_ids)
+
+        check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [ threading.Thread(target=InternKeys, args=(i,)) for i in xrange(8) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(check_interval)
+        self.assertEqual(8 * 20000, len(key_ids))
+        self.assertEqual(range(len(key_ids)), sorted(key_ids.values()))
+
+
+    def test_reset(self):
+        '''
+        Tests that a reset empties the registered tables and starts a new
+        generation, after which the equality of the new nodes still holds.
+        '''
+        table = interning.RegisterTable('test_keys', {})
+        interning.InternKey('a', table)
+        DOMNode(1, 'div', 'value', {}, 1, '')
+        self.assertEqual(1, interning.GetTableSizes()['test_keys'])
+        self.assertGreater(interning.GetTableSizes()['node_keys'], 0)
+
+        generation = interning.GetGeneration()
+        interning.ResetInternTables()
+        self.assertEqual(generation + 1, interning.GetGeneration())
+        self.assertEqual(0, interning.GetTableSizes()['test_keys'])
+        self.assertEqual(0, interning.GetTableSizes()['node_keys'])
+        self.assertEqual(0, interning.InternKey('b', table))
+
+        a = DOMNode(1, 'div', 'value', {}, 1, '')
+        b = DOMNode(2, 'div', 'value', {}, 1, '')
+        c = DOMNode(3, 'div', 'other', {}, 1, '')
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+
+if __name__ == '__main__':
+    unittest.main()
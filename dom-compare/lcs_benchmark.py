@@ -0,0 +1,80 @@
+from argparse import ArgumentParser
+from DOMNode import DOMNode
+
+import find_tree_diff
+import random
+import time
+
+def Main():
+    random.seed(args.seed)
+    correct_nodes = GenerateSiblings(args.width, 'c')
+    testing_nodes = MutateSiblings(correct_nodes, args.mutation_rate)
+
+    print 'Width: {0} x {1}'.format(len(correct_nodes), len(testing_nodes))
+    for only_structure in [ False, True ]:
+        legacy_time = TimeIt(LegacySetupLCS, correct_nodes, testing_nodes, only_structure)
+        keys_time = TimeIt(find_tree_diff.SetupLCS, correct_nodes, testing_nodes, False, only_structure)
+        print '{0}: legacy {1:.3f}s keys {2:.3f}s speedup {3:.1f}x'.format( \
+                'only_structure' if only_structure else 'full', legacy_time, keys_time, legacy_time / keys_time)
+
+
+def GenerateSiblings(width, prefix):
+    '''
+    Returns a list of sibling nodes that look like the items of a product grid.
+    '''
+    nodes = []
+    for i in range(width):
+        attrs = {
+            'class': 'grid-item card card--aligned grid-item-{0}'.format(i % 50),
+            'href': '/item/{0}{1}'.format(prefix, i),
+        }
+        nodes.append(DOMNode(i, 'div', 'Item {0}'.format(i % 100), attrs, -1, ''))
+    return nodes
+
+
+def MutateSiblings(nodes, mutation_rate):
+    '''
+    Returns a copy of the nodes where some of the nodes are replaced.
+    '''
+    result = []
+    for i, n in enumerate(nodes):
+        if random.random() < mutation_rate:
+            attrs = dict(n.attributes)
+            attrs['href'] = '/ad/{0}'.format(i)
+            result.append(DOMNode(n.id, n.type, n.value, attrs, n.parent_id, n.signature))
+        else:
+            result.append(DOMNode(n.id, n.type, n.value, dict(n.attributes), n.parent_id, n.signature))
+    return result
+
+
+def LegacySetupLCS(correct_nodes, testing_nodes, only_structure):
+    '''
+    The LCS computation that compares the nodes through CompareAttrs.
+    '''
+    c = [[ 0 for x in range(len(testing_nodes) + 1) ] for y in range(len(correct_nodes) + 1) ]
+    for i, correct_node in enumerate(correct_nodes):
+        for j, testing_node in enumerate(testing_nodes):
+            if only_structure:
+                equal = correct_node.type == testing_node.type and correct_node.CompareAttrs(testing_node, structure_only=True)
+            else:
+                equal = correct_node.type == testing_node.type and correct_node.value == testing_node.value and correct_node.CompareAttrs(testing_node)
+            if equal:
+                c[i][j] = c[i - 1][j - 1] + 1
+            else:
+                c[i][j] = max(c[i][j - 1], c[i - 1][j])
+    return c
+
+
+def TimeIt(func, *func_args):
+    start = time.time()
+    func(*func_args)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--width', default=1000, type=int)
+    parser.add_argument('--mutation-rate', default=0.05, type=float)
+    parser.add_argument('--seed', default=0, type=int)
+    args = parser.parse_args()
+    Main()
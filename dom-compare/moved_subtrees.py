@@ -0,0 +1,95 @@
+from collections import deque
+
+# Subtrees smaller than this are not reported as moved. A single empty
+# element matches too many unrelated nodes to be meaningful.
+DEFAULT_MIN_MOVED_SIZE = 2
+
+def FindMovedSubtrees(correct_dom, testing_dom, missing_nodes, added_nodes, only_structure=False, min_size=DEFAULT_MIN_MOVED_SIZE):
+    '''
+    Pairs up the subtrees that are unmatched in both trees and are identical,
+    which are the subtrees that moved to another place in the tree.
+
+    missing_nodes are the roots of the unmatched subtrees of correct_dom and
+    added_nodes the roots of the unmatched subtrees of testing_dom, as
+    returned by PreparedBaseline.Diff. The unmatched subtrees and all their
+    descendants are indexed by their size and hash, and the largest subtrees
+    are paired first, so a moved subtree is reported once and not as its
+    parts. When a subtree has several identical candidates, the one with the
+    same signature is preferred. The cost is one pass over the unmatched
+    nodes of each tree and a sort of the correct side by size.
+
+    Returns the moved pairs and the missing and the added nodes that were
+    not moved. Each pair is a map with the keys correct_node, testing_node,
+    old_parent_id, new_parent_id and size.
+    '''
+    # Maps the (size, hash) of each unmatched testing subtree to the
+    # candidates, all of them and by the signature.
+    candidates = {}
+    candidates_by_signature = {}
+    for node in IterUnmatchedNodes(testing_dom, added_nodes):
+        size = testing_dom.SubtreeSize(node)
+        if size < min_size:
+            continue
+        key = (size, testing_dom.SubtreeHash(node, only_structure))
+        candidates.setdefault(key, deque()).append(node)
+        candidates_by_signature.setdefault((key, node.signature_id), deque()).append(node)
+
+    correct_nodes = []
+    if len(candidates) > 0:
+        correct_nodes = [ n for n in IterUnmatchedNodes(correct_dom, missing_nodes) if correct_dom.SubtreeSize(n) >= min_size ]
+        # The sort is stable, so the ties stay in the breadth-first order.
+        correct_nodes.sort(key=correct_dom.SubtreeSize, reverse=True)
+
+    # The ids of the nodes in the moved subtrees. A subtree is paired before
+    # its descendants, so they are skipped.
+    moved_correct_ids = set()
+    moved_testing_ids = set()
+    moved = []
+    for node in correct_nodes:
+        if node.id in moved_correct_ids:
+            continue
+        key = (correct_dom.SubtreeSize(node), correct_dom.SubtreeHash(node, only_structure))
+        if key not in candidates:
+            continue
+        testing_node = PopCandidate(candidates_by_signature.get((key, node.signature_id)), moved_testing_ids)
+        if testing_node is None:
+            testing_node = PopCandidate(candidates[key], moved_testing_ids)
+        if testing_node is None:
+            del candidates[key]
+            continue
+        moved_correct_ids.update([ n.id for n in correct_dom.IterSubtree(node) ])
+        moved_testing_ids.update([ n.id for n in testing_dom.IterSubtree(testing_node) ])
+        moved.append({
+            'correct_node': node,
+            'testing_node': testing_node,
+            'old_parent_id': node.parent_id,
+            'new_parent_id': testing_node.parent_id,
+            'size': key[0],
+        })
+
+    remaining_missing_nodes = [ n for n in missing_nodes if n.id not in moved_correct_ids ]
+    remaining_added_nodes = [ n for n in added_nodes if n.id not in moved_testing_ids ]
+    return moved, remaining_missing_nodes, remaining_added_nodes
+
+
+def IterUnmatchedNodes(dom_tree, roots):
+    '''
+    Yields the nodes of the subtrees rooted at roots.
+    '''
+    for root in roots:
+        for node in dom_tree.IterSubtree(root):
+            yield node
+
+
+def PopCandidate(candidates, moved_ids):
+    '''
+    Removes and returns the first candidate that is not in a moved subtree,
+    or returns None.
+    '''
+    if candidates is None:
+        return None
+    while len(candidates) > 0:
+        node = candidates.popleft()
+        if node.id not in moved_ids:
+            return node
+    return None
@@ -0,0 +1,82 @@
+from DOMTree import DOMTree
+
+import dom_generator
+import find_tree_diff
+import moved_subtrees
+import unittest
+
+CORRECT_HTML = '<html><body><div id="a"><ul class="carousel"><li>1</li><li>2</li></ul><p>x</p></div><div id="b"><span>y</span></div></body></html>'
+MOVED_HTML = '<html><body><div id="a"><p>x</p></div><div id="b"><span>y</span><ul class="carousel"><li>1</li><li>2</li></ul></div></body></html>'
+
+class TestMovedSubtrees(unittest.TestCase):
+
+    def test_moved(self):
+        '''
+        Tests that a subtree moved into another container is reported as
+        moved instead of missing.
+        '''
+        correct_dom = DOMTree(CORRECT_HTML)
+        testing_dom = DOMTree(MOVED_HTML)
+        added_nodes = []
+        _, missing_nodes = find_tree_diff.CompareDOMTrees(correct_dom, testing_dom, added_nodes=added_nodes)
+        self.assertEqual([ 'ul' ], [ n.type for n in missing_nodes ])
+        self.assertEqual([ 'ul' ], [ n.type for n in added_nodes ])
+
+        moved, missing_nodes, added_nodes = moved_subtrees.FindMovedSubtrees(correct_dom, testing_dom, missing_nodes, added_nodes)
+        self.assertEqual([], missing_nodes)
+        self.assertEqual([], added_nodes)
+        self.assertEqual(1, len(moved))
+        self.assertEqual('ul', moved[0]['correct_node'].type)
+        self.assertEqual(3, moved[0]['size'])
+        parents = { n.id: n for n in correct_dom.IterSubtree(correct_dom.root_node) }
+        testing_parents = { n.id: n for n in testing_dom.IterSubtree(testing_dom.root_node) }
+        self.assertEqual('a', parents[moved[0]['old_parent_id']].attributes['id'])
+        self.assertEqual('b', testing_parents[moved[0]['new_parent_id']].attributes['id'])
+
+
+    def test_nested_move(self):
+        '''
+        Tests that a subtree moved out of a removed container is paired, and
+        that the container stays missing.
+        '''
+        correct_dom = DOMTree('<html><body><section><div><b>1</b><i>2</i></div><a>x</a></section></body></html>')
+        testing_dom = DOMTree('<html><body><nav><div><b>1</b><i>2</i></div></nav></body></html>')
+        added_nodes = []
+        _, missing_nodes = find_tree_diff.CompareDOMTrees(correct_dom, testing_dom, added_nodes=added_nodes)
+        moved, missing_nodes, added_nodes = moved_subtrees.FindMovedSubtrees(correct_dom, testing_dom, missing_nodes, added_nodes)
+        self.assertEqual([ 'div' ], [ m['correct_node'].type for m in moved ])
+        self.assertEqual([ 'section' ], [ n.type for n in missing_nodes ])
+        self.assertEqual([ 'nav' ], [ n.type for n in added_nodes ])
+
+
+    def test_min_size(self):
+        correct_dom = DOMTree('<html><body><div><p>1</p></div><span></span></body></html>')
+        testing_dom = DOMTree('<html><body><span><p>1</p></span><div></div></body></html>')
+        added_nodes = []
+        _, missing_nodes = find_tree_diff.CompareDOMTrees(correct_dom, testing_dom, added_nodes=added_nodes)
+        moved, _, _ = moved_subtrees.FindMovedSubtrees(correct_dom, testing_dom, missing_nodes, added_nodes)
+        self.assertEqual([], moved)
+        moved, _, _ = moved_subtrees.FindMovedSubtrees(correct_dom, testing_dom, missing_nodes, added_nodes, min_size=1)
+        self.assertEqual([ 'p' ], [ m['correct_node'].type for m in moved ])
+
+
+    def test_generated_moves(self):
+        '''
+        Tests that the elements moved by the generator are paired.
+        '''
+        generator = dom_generator.PageGenerator(seed=1, depth=5, attribute_churn=0.0, mutation_rate=0.0, move_rate=0.1)
+        page_a = generator.GeneratePage()
+        page_b = generator.MutatePage(page_a)
+        correct_dom = DOMTree(dom_generator.ToDevToolsJSON(page_a)['result']['root'])
+        testing_dom = DOMTree(dom_generator.ToDevToolsJSON(page_b)['result']['root'])
+        self.assertEqual(correct_dom.size, testing_dom.size)
+        added_nodes = []
+        common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(correct_dom, testing_dom, added_nodes=added_nodes)
+        moved, remaining_missing_nodes, _ = moved_subtrees.FindMovedSubtrees(correct_dom, testing_dom, missing_nodes, added_nodes, min_size=1)
+        self.assertTrue(len(moved) > 0)
+        self.assertTrue(len(remaining_missing_nodes) < len(missing_nodes))
+        self.assertTrue(common_dom_tree.size + sum([ m['size'] for m in moved ]) <= correct_dom.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,22 +12,33 @@ def Main():
     FindNodeExistence(dom_b, dom_a, 'B')
     print 'Total A: {0}'.format(dom_a.size)
     print 'Total B: {0}'.format(dom_b.size)
+    if args.by_type:
+        PrintOverlapByType(dom_a, dom_b)
 
 
 def FindNodeExistence(dom_a, dom_b, description):
     '''
     Prints the number of nodes from dom_a that exists in dom_b.
+
+    Repeated identical nodes are matched at most as many times as they
+    appear in dom_b.
     '''
-    exist_count = 0
-    for n in iter(dom_a):
-        if not dom_b.Contains(n):
-            continue
-        exist_count += 1
+    exist_count = dom_a.GetNodeIndex().IntersectionCount(dom_b.GetNodeIndex())
 
     # Print stats.
     print 'Matched {0}: {1}'.format(description, exist_count)
 
 
+def PrintOverlapByType(dom_a, dom_b):
+    '''
+    Prints the number of matched nodes and the nodes only in A or only in B
+    for each node type.
+    '''
+    overlap = dom_a.GetNodeIndex().Overlap(dom_b.GetNodeIndex())
+    for node_type, counts in sorted(overlap['by_type'].iteritems()):
+        print '{0}: matched {1} only A {2} only B {3}'.format(node_type, counts['intersection'], counts['only_self'], counts['only_other'])
+
+
 def CompareNodes(node_a, node_b):
     '''
     Returns true if node_a and node_b are equal in some way: structurally or the whole node.
@@ -43,10 +54,18 @@ def PrintUnmatchedNodes(node_a, node_b):
     print 'Nodes not matching:\n{0}{1}'.format(node_a, node_b)
 
 
-if __name__ == '__main__':
+def CreateArgumentParser():
+    '''
+    Returns the parser of the command line arguments of Main.
+    '''
     parser = ArgumentParser()
     parser.add_argument('dom_tree_a')
     parser.add_argument('dom_tree_b')
     parser.add_argument('--hdp', default=False, action='store_true')
-    args = parser.parse_args()
+    parser.add_argument('--by-type', default=False, action='store_true')
+    return parser
+
+
+if __name__ == '__main__':
+    args = CreateArgumentParser().parse_args()
     Main()
@@ -0,0 +1,119 @@
+from diff_stats import DiffStats
+from DOMTree import DOMTree
+
+# Matched subtrees smaller than this are compared in the main process, as
+# sending them to a worker costs more than comparing them.
+DEFAULT_MIN_SUBTREE_SIZE = 2000
+
+# The subtrees are split until there are about this many tasks per worker,
+# so that the workers finish at about the same time.
+TASKS_PER_WORKER = 4
+
+# The trees of the running ParallelDiff. The workers are forked after they
+# are set, so the trees are shared with the workers and never pickled.
+_baseline = None
+_testing_dom = None
+_correct_nodes = None
+_testing_nodes = None
+_correct_ranks = None
+_testing_ranks = None
+
+def ParallelDiff(baseline, testing_dom, workers, min_subtree_size=DEFAULT_MIN_SUBTREE_SIZE, stats=None, added_nodes=None):
+    '''
+    Same as PreparedBaseline.Diff, with the matched subtrees that are large
+    enough compared in a pool of worker processes.
+
+    The top levels are aligned in the main process. Each matched pair whose
+    correct subtree has between min_subtree_size nodes and the size of a
+    task is sent to a worker, and the larger pairs are split further. The
+    workers only receive the ids of the pair and only return the ids of the
+    common child lists and of the missing and added nodes. The missing and
+    the added nodes are sorted back into the breadth-first order of their
+    trees, so the result is identical to the one of Diff.
+    '''
+    global _baseline, _testing_dom, _correct_nodes, _testing_nodes, _correct_ranks, _testing_ranks
+    correct_dom = baseline.correct_dom
+    _baseline = baseline
+    _testing_dom = testing_dom
+    # The nodes in the breadth-first order, and the id to the rank of the node.
+    _correct_nodes = list(correct_dom.IterSubtree(correct_dom.root_node))
+    _testing_nodes = list(testing_dom.IterSubtree(testing_dom.root_node))
+    _correct_ranks = correct_ranks = { n.id: i for i, n in enumerate(_correct_nodes) }
+    _testing_ranks = testing_ranks = { n.id: i for i, n in enumerate(_testing_nodes) }
+    task_size = max(min_subtree_size, correct_dom.size // (workers * TASKS_PER_WORKER))
+
+    from multiprocessing import Pool
+    pool = Pool(workers)
+    try:
+        tasks = []
+        def Dispatch(correct_node, testing_node):
+            size = baseline._subtrees[correct_node.id][0]
+            if size < min_subtree_size or size > task_size:
+                return False
+            tasks.append(pool.apply_async(DiffSubtreePair, (correct_ranks[correct_node.id], testing_ranks[testing_node.id], stats is not None, added_nodes is not None)))
+            return True
+
+        common_dom_tree = DOMTree({})
+        common_dom_tree.AddNode(-1, correct_dom.root_node)
+        all_missing_nodes = []
+        baseline.DiffSubtrees(testing_dom, correct_dom.root_node, testing_dom.root_node, common_dom_tree, all_missing_nodes, stats=stats, added_nodes=added_nodes, dispatch=Dispatch)
+
+        for task in tasks:
+            child_lists, missing_ranks, added_ranks, counters = task.get()
+            common_dom_tree.AddChildLists([ (_correct_nodes[parent].id, [ _correct_nodes[i] for i in children ]) for parent, children in child_lists ])
+            all_missing_nodes.extend([ _correct_nodes[i] for i in missing_ranks ])
+            if added_nodes is not None:
+                added_nodes.extend([ _testing_nodes[i] for i in added_ranks ])
+            if stats is not None:
+                MergeCounters(stats, counters)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _baseline = None
+        _testing_dom = None
+        _correct_nodes = None
+        _testing_nodes = None
+        _correct_ranks = None
+        _testing_ranks = None
+
+    all_missing_nodes.sort(key=lambda n: correct_ranks[n.id])
+    if added_nodes is not None:
+        added_nodes.sort(key=lambda n: testing_ranks[n.id])
+    return common_dom_tree, all_missing_nodes
+
+
+def DiffSubtreePair(correct_rank, testing_rank, with_stats, with_added_nodes):
+    '''
+    Compares the pair of subtrees in a worker. The nodes are given and
+    returned as their breadth-first ranks in their trees.
+
+    Returns the common child lists as (parent, children) pairs, the missing
+    nodes, the added nodes and the counters of the diff.
+    '''
+    correct_root = _correct_nodes[correct_rank]
+    testing_root = _testing_nodes[testing_rank]
+    stats = DiffStats() if with_stats else None
+    added_nodes = [] if with_added_nodes else None
+    common_dom_tree = DOMTree({})
+    common_dom_tree.AddNode(-1, correct_root)
+    missing_nodes = []
+    _baseline.DiffSubtrees(_testing_dom, correct_root, testing_root, common_dom_tree, missing_nodes, stats=stats, added_nodes=added_nodes)
+
+    child_lists = [ (_correct_ranks[parent_id], [ _correct_ranks[n.id] for n in children ]) for parent_id, children in common_dom_tree.tree.iteritems() if len(children) > 0 ]
+    missing_ranks = [ _correct_ranks[n.id] for n in missing_nodes ]
+    added_ranks = [ _testing_ranks[n.id] for n in added_nodes ] if added_nodes is not None else []
+    return child_lists, missing_ranks, added_ranks, stats.counters if stats is not None else None
+
+
+def MergeCounters(stats, counters):
+    '''
+    Adds the counters of a worker to stats.
+    '''
+    for name, value in counters.iteritems():
+        if name == 'widest_sibling_list':
+            stats.Max(name, value)
+        else:
+            stats.Count(name, value)
@@ -0,0 +1,49 @@
+from CompactDOMTree import CompactDOMTree
+from diff_stats import DiffStats
+from DOMTree import DOMTree
+
+import dom_generator
+import find_tree_diff
+import json
+import parallel_diff
+import unittest
+
+class TestParallelDiff(unittest.TestCase):
+
+    def GetPagePair(self, seed):
+        generator = dom_generator.PageGenerator(seed=seed, depth=6, mutation_rate=0.05, move_rate=0.02)
+        page_a = generator.GeneratePage()
+        page_b = generator.MutatePage(page_a)
+        dom_a = DOMTree(dom_generator.ToDevToolsJSON(page_a)['result']['root'])
+        dom_b = DOMTree(dom_generator.ToDevToolsJSON(page_b)['result']['root'])
+        return dom_a, dom_b
+
+
+    def test_same_as_serial(self):
+        '''
+        Tests that the parallel diff returns the same common tree, missing
+        nodes, added nodes and counters as the serial diff.
+        '''
+        for seed, compact, engine in [ (1, False, 'lcs'), (2, True, 'anchor') ]:
+            dom_a, dom_b = self.GetPagePair(seed)
+            if compact:
+                dom_a = CompactDOMTree(dom_a)
+                dom_b = CompactDOMTree(dom_b)
+            baseline = find_tree_diff.PreparedBaseline(dom_b, engine=engine)
+            serial_stats = DiffStats()
+            serial_added_nodes = []
+            serial_common_tree, serial_missing_nodes = baseline.Diff(dom_a, stats=serial_stats, added_nodes=serial_added_nodes)
+            parallel_stats = DiffStats()
+            parallel_added_nodes = []
+            parallel_common_tree, parallel_missing_nodes = parallel_diff.ParallelDiff(baseline, dom_a, 2, 20, parallel_stats, parallel_added_nodes)
+
+            self.assertTrue(len(serial_missing_nodes) > 0)
+            self.assertEqual(serial_common_tree.size, parallel_common_tree.size)
+            self.assertEqual(json.dumps(serial_common_tree.Serialize()), json.dumps(parallel_common_tree.Serialize()))
+            self.assertEqual([ n.id for n in serial_missing_nodes ], [ n.id for n in parallel_missing_nodes ])
+            self.assertEqual([ n.id for n in serial_added_nodes ], [ n.id for n in parallel_added_nodes ])
+            self.assertEqual(serial_stats.counters, parallel_stats.counters)
+
+
+if __name__ == '__main__':
+    unittest.main()
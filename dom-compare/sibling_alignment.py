@@ -0,0 +1,306 @@
+from bisect import bisect_left
+
+import sys
+import threading
+
+# The alignment engines that can be used for aligning the siblings.
+LCS_ENGINE = 'lcs'
+ANCHOR_ENGINE = 'anchor'
+ALIGNMENT_ENGINES = [ LCS_ENGINE, ANCHOR_ENGINE ]
+
+# Sibling lists wider than this are aligned with the linear space LCS.
+DEFAULT_LINEAR_SPACE_WIDTH = 2000
+
+# Subproblems of the linear space LCS with fewer cells than this are solved
+# with the dense LCS table.
+DENSE_CUTOFF_CELLS = 4096
+
+# The number of LCS cells computed by each thread. Comparisons read the
+# difference before and after the alignment, so the concurrent comparisons
+# of the other threads are not counted.
+_lcs_cell_counts = threading.local()
+
+def Align(correct_keys, testing_keys, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH):
+    '''
+    Returns the LCS of the two lists of keys as a list of matching
+    (correct index, testing index) pairs in increasing order.
+
+    The dense LCS table is used unless one of the lists is wider than
+    linear_space_width.
+    '''
+    if UseLinearSpace(correct_keys, testing_keys, linear_space_width):
+        return LinearSpaceAlign(correct_keys, testing_keys)
+    return DenseAlign(correct_keys, testing_keys)
+
+
+def UseLinearSpace(correct_keys, testing_keys, linear_space_width):
+    '''
+    Returns whether the linear space LCS should be used for the lists.
+    '''
+    return linear_space_width is not None and \
+            max(len(correct_keys), len(testing_keys)) > linear_space_width
+
+
+def EstimateLCSMemory(correct_len, testing_len, linear_space):
+    '''
+    Returns the estimated peak memory in bytes of the LCS rows used for
+    aligning lists of the given lengths.
+    '''
+    row_size = sys.getsizeof([ 0 ] * (testing_len + 1))
+    if linear_space:
+        # Two rows in each direction plus the dense subproblem at the leaves.
+        return 4 * row_size + DENSE_CUTOFF_CELLS * 8
+    return (correct_len + 1) * row_size
+
+def ComputeLCSTable(correct_keys, testing_keys):
+    '''
+    Computes and returns the LCS 2-D array of the two lists of equality keys.
+
+    c[i][j] is the length of the LCS of correct_keys[:i + 1] and
+    testing_keys[:j + 1]. The extra last row and column are always 0 so
+    that the index -1 can be used for the empty prefix.
+    '''
+    AddLCSCells(len(correct_keys) * len(testing_keys))
+    c = [[ 0 for x in range(len(testing_keys) + 1) ] for y in range(len(correct_keys) + 1) ]
+    for i, correct_key in enumerate(correct_keys):
+        cur_row = c[i]
+        prev_row = c[i - 1]
+        for j, testing_key in enumerate(testing_keys):
+            if correct_key == testing_key:
+                cur_row[j] = prev_row[j - 1] + 1
+            else:
+                left = cur_row[j - 1]
+                up = prev_row[j]
+                cur_row[j] = left if left >= up else up
+    return c
+
+
+def GetLCSCellCount():
+    '''
+    Returns the number of LCS cells computed by the current thread.
+    '''
+    return getattr(_lcs_cell_counts, 'count', 0)
+
+
+def AddLCSCells(count):
+    _lcs_cell_counts.count = GetLCSCellCount() + count
+
+
+def DenseAlign(correct_keys, testing_keys):
+    '''
+    Returns the LCS of the two lists of keys as a list of matching
+    (correct index, testing index) pairs in increasing order.
+
+    The backtrack breaks ties in the same way as
+    find_tree_diff.GetCommonAndMissingNodes.
+    '''
+    c = ComputeLCSTable(correct_keys, testing_keys)
+    matches = []
+    i = len(correct_keys) - 1
+    j = len(testing_keys) - 1
+    while i >= 0 and j >= 0:
+        if correct_keys[i] == testing_keys[j]:
+            matches.append((i, j))
+            i -= 1
+            j -= 1
+        elif c[i][j - 1] >= c[i - 1][j]:
+            j -= 1
+        else:
+            i -= 1
+    matches.reverse()
+    return matches
+
+
+def LinearSpaceAlign(correct_keys, testing_keys):
+    '''
+    Returns the LCS of the two lists of keys as a list of matching
+    (correct index, testing index) pairs in increasing order.
+
+    This uses Hirschberg's algorithm so only a few rows of the LCS table are
+    held in memory at any time.
+    '''
+    matches = []
+    HirschbergAlign(correct_keys, testing_keys, 0, len(correct_keys), 0, len(testing_keys), matches)
+    return matches
+
+
+def HirschbergAlign(correct_keys, testing_keys, correct_start, correct_end, testing_start, testing_end, matches):
+    '''
+    Appends the LCS of correct_keys[correct_start:correct_end] and
+    testing_keys[testing_start:testing_end] to matches.
+
+    The recursion splits the correct range in half, so the depth is
+    logarithmic in the width of the list.
+    '''
+    correct_len = correct_end - correct_start
+    testing_len = testing_end - testing_start
+    if correct_len == 0 or testing_len == 0:
+        return
+    if correct_len * testing_len <= DENSE_CUTOFF_CELLS or correct_len == 1:
+        for i, j in DenseAlign(correct_keys[correct_start:correct_end], testing_keys[testing_start:testing_end]):
+            matches.append((correct_start + i, testing_start + j))
+        return
+
+    correct_mid = correct_start + correct_len // 2
+    forward = LCSLastRow(correct_keys, testing_keys, xrange(correct_start, correct_mid), xrange(testing_start, testing_end))
+    backward = LCSLastRow(correct_keys, testing_keys, xrange(correct_end - 1, correct_mid - 1, -1), xrange(testing_end - 1, testing_start - 1, -1))
+
+    # Split the testing range where the two halves have the longest LCS.
+    best_split = 0
+    best_length = -1
+    for k in xrange(testing_len + 1):
+        length = forward[k] + backward[testing_len - k]
+        if length > best_length:
+            best_length = length
+            best_split = k
+
+    HirschbergAlign(correct_keys, testing_keys, correct_start, correct_mid, testing_start, testing_start + best_split, matches)
+    HirschbergAlign(correct_keys, testing_keys, correct_mid, correct_end, testing_start + best_split, testing_end, matches)
+
+
+def LCSLastRow(correct_keys, testing_keys, correct_indices, testing_indices):
+    '''
+    Returns the last row of the LCS table of the keys at the given indices.
+
+    row[k] is the length of the LCS of the correct keys and the first k
+    testing keys.
+    '''
+    testing_range = [ testing_keys[j] for j in testing_indices ]
+    AddLCSCells(len(correct_indices) * len(testing_range))
+    prev_row = [ 0 ] * (len(testing_range) + 1)
+    cur_row = [ 0 ] * (len(testing_range) + 1)
+    for i in correct_indices:
+        correct_key = correct_keys[i]
+        for k, testing_key in enumerate(testing_range):
+            if correct_key == testing_key:
+                cur_row[k + 1] = prev_row[k] + 1
+            else:
+                left = cur_row[k]
+                up = prev_row[k + 1]
+                cur_row[k + 1] = left if left >= up else up
+        prev_row, cur_row = cur_row, prev_row
+    return prev_row
+
+
+def AnchorAlign(correct_keys, testing_keys, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH):
+    '''
+    Returns a common subsequence of the two lists of keys as a list of
+    matching (correct index, testing index) pairs in increasing order.
+
+    The alignment is done in the style of patience diff:
+      1. The common prefix and suffix are matched.
+      2. The keys that appear exactly once on both sides are used as anchors.
+         The longest increasing sequence of the anchors is matched.
+      3. The gaps between the anchors are aligned in the same way. When a gap
+         has no anchors, the gap is aligned with Align.
+
+    The result is the LCS when the keys are distinct and the lists only
+    differ by inserted or removed nodes. Otherwise it may be shorter than
+    the LCS, e.g. when an anchor pairs two copies of a repeated key that
+    were different nodes.
+    '''
+    matches = []
+    # The work stack holds either a match or a range to be aligned. The
+    # items are pushed in reverse order so that the matches are emitted in
+    # increasing order.
+    work = [ (False, 0, len(correct_keys), 0, len(testing_keys)) ]
+    while len(work) > 0:
+        item = work.pop()
+        if item[0]:
+            matches.append((item[1], item[2]))
+            continue
+        _, correct_start, correct_end, testing_start, testing_end = item
+
+        # Match the common prefix.
+        while correct_start < correct_end and testing_start < testing_end and \
+                correct_keys[correct_start] == testing_keys[testing_start]:
+            matches.append((correct_start, testing_start))
+            correct_start += 1
+            testing_start += 1
+
+        # Match the common suffix.
+        while correct_start < correct_end and testing_start < testing_end and \
+                correct_keys[correct_end - 1] == testing_keys[testing_end - 1]:
+            correct_end -= 1
+            testing_end -= 1
+            work.append((True, correct_end, testing_end))
+
+        if correct_start == correct_end or testing_start == testing_end:
+            continue
+
+        anchors = FindAnchors(correct_keys, testing_keys, correct_start, correct_end, testing_start, testing_end)
+        if len(anchors) == 0:
+            gap_matches = Align(correct_keys[correct_start:correct_end], testing_keys[testing_start:testing_end], linear_space_width)
+            for i, j in reversed(gap_matches):
+                work.append((True, correct_start + i, testing_start + j))
+            continue
+
+        # Align the gaps between the anchors.
+        gap_correct_end = correct_end
+        gap_testing_end = testing_end
+        for i, j in reversed(anchors):
+            work.append((False, i + 1, gap_correct_end, j + 1, gap_testing_end))
+            work.append((True, i, j))
+            gap_correct_end = i
+            gap_testing_end = j
+        work.append((False, correct_start, gap_correct_end, testing_start, gap_testing_end))
+    return matches
+
+
+def FindAnchors(correct_keys, testing_keys, correct_start, correct_end, testing_start, testing_end):
+    '''
+    Returns the longest increasing sequence of (correct index, testing index)
+    pairs of the keys that are unique on both sides of the given ranges.
+    '''
+    correct_positions = UniquePositions(correct_keys, correct_start, correct_end)
+    testing_positions = UniquePositions(testing_keys, testing_start, testing_end)
+    candidates = [ (i, testing_positions[key]) for key, i in correct_positions.iteritems() if key in testing_positions ]
+    candidates.sort()
+    return LongestIncreasingSequence(candidates)
+
+
+def UniquePositions(keys, start, end):
+    '''
+    Returns a map from key to its position for the keys that appear exactly
+    once in keys[start:end].
+    '''
+    positions = {}
+    duplicates = set()
+    for i in xrange(start, end):
+        key = keys[i]
+        if key in positions:
+            duplicates.add(key)
+        else:
+            positions[key] = i
+    for key in duplicates:
+        del positions[key]
+    return positions
+
+
+def LongestIncreasingSequence(pairs):
+    '''
+    Returns the longest subsequence of pairs, which are sorted by the first
+    element, where the second elements are increasing.
+    '''
+    # Patience sorting: pile_tops[k] is the smallest second element that
+    # ends an increasing sequence of length k + 1.
+    pile_tops = []
+    pile_top_indices = []
+    previous = [ -1 ] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect_left(pile_tops, j)
+        if pile == len(pile_tops):
+            pile_tops.append(j)
+            pile_top_indices.append(index)
+        else:
+            pile_tops[pile] = j
+            pile_top_indices[pile] = index
+        previous[index] = pile_top_indices[pile - 1] if pile > 0 else -1
+
+    result = []
+    index = pile_top_indices[-1] if len(pile_top_indices) > 0 else -1
+    while index != -1:
+        result.append(pairs[index])
+        index = previous[index]
+    result.reverse()
+    return result
@@ -0,0 +1,103 @@
+import random
+import sibling_alignment
+import threading
+import unittest
+
+class TestSiblingAlignment(unittest.TestCase):
+
+    def assertValidAlignment(self, correct_keys, testing_keys, matches):
+        '''
+        Asserts that the matches form a common subsequence of the keys.
+        '''
+        for (i, j), (next_i, next_j) in zip(matches, matches[1:]):
+            self.assertTrue(i < next_i and j < next_j)
+        for i, j in matches:
+            self.assertEqual(correct_keys[i], testing_keys[j])
+
+
+    def test_dense_align(self):
+        '''
+        Tests the LCS on a simple case.
+        '''
+        correct_keys = [ 1, 2, 3, 4, 5 ]
+        testing_keys = [ 1, 2, 6, 4, 7 ]
+        matches = sibling_alignment.DenseAlign(correct_keys, testing_keys)
+        self.assertEqual([ (0, 0), (1, 1), (3, 3) ], matches)
+
+
+    def test_anchor_align_insertions(self):
+        '''
+        Tests that inserted nodes between long identical runs are found.
+        '''
+        correct_keys = range(100) + [ 1000 ] * 5 + range(100, 200)
+        testing_keys = range(50) + [ 500, 501 ] + range(50, 100) + [ 1000 ] * 3 + range(100, 200) + [ 502 ]
+        matches = sibling_alignment.AnchorAlign(correct_keys, testing_keys)
+        self.assertValidAlignment(correct_keys, testing_keys, matches)
+        self.assertEqual(len(sibling_alignment.DenseAlign(correct_keys, testing_keys)), len(matches))
+
+
+    def test_anchor_align_random(self):
+        '''
+        Tests that the anchor alignment is a valid alignment that is no
+        longer than the LCS, and that it is the LCS when distinct keys are
+        only inserted and removed.
+        '''
+        rand = random.Random(0)
+        for _ in range(200):
+            base = [ rand.randint(0, 20) for _ in range(rand.randint(0, 40)) ]
+            correct_keys = [ k for k in base if rand.random() > 0.1 ]
+            testing_keys = [ k for k in base if rand.random() > 0.1 ]
+            matches = sibling_alignment.AnchorAlign(correct_keys, testing_keys)
+            self.assertValidAlignment(correct_keys, testing_keys, matches)
+            self.assertTrue(len(matches) <= len(sibling_alignment.DenseAlign(correct_keys, testing_keys)))
+
+            base = rand.sample(range(100), rand.randint(0, 40))
+            correct_keys = [ k for k in base if rand.random() > 0.1 ]
+            testing_keys = [ k for k in base if rand.random() > 0.1 ]
+            matches = sibling_alignment.AnchorAlign(correct_keys, testing_keys)
+            self.assertValidAlignment(correct_keys, testing_keys, matches)
+            self.assertEqual(len(sibling_alignment.DenseAlign(correct_keys, testing_keys)), len(matches))
+
+
+    def test_linear_space_align_random(self):
+        '''
+        Tests that the linear space LCS has the same length as the dense LCS.
+        '''
+        rand = random.Random(1)
+        for _ in range(50):
+            correct_keys = [ rand.randint(0, 5) for _ in range(rand.randint(0, 150)) ]
+            testing_keys = [ rand.randint(0, 5) for _ in range(rand.randint(0, 150)) ]
+            matches = sibling_alignment.LinearSpaceAlign(correct_keys, testing_keys)
+            self.assertValidAlignment(correct_keys, testing_keys, matches)
+            self.assertEqual(len(sibling_alignment.DenseAlign(correct_keys, testing_keys)), len(matches))
+
+
+    def test_align_switches_to_linear_space(self):
+        correct_keys = range(30)
+        testing_keys = range(0, 30, 2)
+        self.assertTrue(sibling_alignment.UseLinearSpace(correct_keys, testing_keys, 20))
+        self.assertFalse(sibling_alignment.UseLinearSpace(correct_keys, testing_keys, None))
+        self.assertEqual(zip(range(0, 30, 2), range(15)), sibling_alignment.Align(correct_keys, testing_keys, 20))
+
+
+    def test_anchor_align_empty(self):
+        self.assertEqual([], sibling_alignment.AnchorAlign([], [ 1, 2 ]))
+        self.assertEqual([], sibling_alignment.AnchorAlign([ 1, 2 ], []))
+
+
+    def test_lcs_cell_count_per_thread(self):
+        '''
+        Tests that the LCS cells computed on another thread are not counted
+        on the current one.
+        '''
+        count = sibling_alignment.GetLCSCellCount()
+        thread = threading.Thread(target=sibling_alignment.DenseAlign, args=([ 1, 2, 3 ], [ 1, 2 ]))
+        thread.start()
+        thread.join()
+        self.assertEqual(count, sibling_alignment.GetLCSCellCount())
+        sibling_alignment.DenseAlign([ 1, 2, 3 ], [ 1, 2 ])
+        self.assertEqual(count + 6, sibling_alignment.GetLCSCellCount())
+
+
+if __name__ == '__main__':
+    unittest.main()
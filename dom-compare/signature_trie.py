@@ -0,0 +1,78 @@
+from interning import GetLock, RegisterTable
+
+SIGNATURE_DELIM = '|$de|'
+
+# The signature of a node is the signature of its parent followed by its own
+# local signature. Each signature is interned as a (parent signature id, piece)
+# entry of a trie, so nodes only hold an int and the full string is built on
+# demand.
+
+# The id of the empty signature, which is the parent of the root node.
+ROOT_SIGNATURE_ID = 0
+
+# Maps (parent signature id, piece) to the signature id.
+_signature_ids = RegisterTable('signatures', {})
+
+# Maps the signature id to (parent signature id, piece). A reset keeps the
+# empty signature.
+_signature_entries = [ (None, '') ]
+
+def ResetSignatureEntries():
+    del _signature_entries[1:]
+
+RegisterTable('signature_entries', _signature_entries, ResetSignatureEntries)
+
+# Interned pieces so that equal pieces under different parents share a string.
+_pieces = RegisterTable('signature_pieces', {})
+
+def InternSignature(parent_signature_id, piece):
+    '''
+    Returns the id of the signature formed by appending piece to the
+    signature with the id parent_signature_id.
+    '''
+    entry = (parent_signature_id, piece)
+    signature_id = _signature_ids.get(entry)
+    if signature_id is None:
+        with GetLock():
+            signature_id = _signature_ids.get(entry)
+            if signature_id is None:
+                piece = _pieces.setdefault(piece, piece)
+                entry = (parent_signature_id, piece)
+                signature_id = len(_signature_entries)
+                _signature_entries.append(entry)
+                _signature_ids[entry] = signature_id
+    return signature_id
+
+
+def InternNodeSignature(parent_signature_id, local_signature):
+    '''
+    Returns the id of the signature of a node given the signature id of its
+    parent and its local signature from DOMNode.ConstructSignature.
+    '''
+    return InternSignature(parent_signature_id, local_signature + SIGNATURE_DELIM)
+
+
+def BuildSignature(signature_id):
+    '''
+    Returns the full string of the signature with the given id.
+    '''
+    pieces = []
+    while signature_id != ROOT_SIGNATURE_ID:
+        signature_id, piece = _signature_entries[signature_id]
+        pieces.append(piece)
+    pieces.reverse()
+    return ''.join(pieces)
+
+
+def GetParentSignatureId(signature_id):
+    '''
+    Returns the id of the parent signature of the given signature.
+    '''
+    return _signature_entries[signature_id][0]
+
+
+def GetSignaturePiece(signature_id):
+    '''
+    Returns the piece that the given signature appends to its parent.
+    '''
+    return _signature_entries[signature_id][1]
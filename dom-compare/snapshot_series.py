@@ -0,0 +1,127 @@
+from argparse import ArgumentParser
+from diff_stats import DIFF_PHASE, Phase
+from html_parsers import DEFAULT_HTML_PARSER, HTML_PARSERS
+from interning import DEFAULT_MAX_INTERNED_KEYS
+from sibling_alignment import ALIGNMENT_ENGINES, DEFAULT_LINEAR_SPACE_WIDTH, LCS_ENGINE
+from tree_cache import DEFAULT_MAX_BYTES, ReinternDOMTree, TreeCache
+
+import find_tree_diff
+import interning
+import json
+import sys
+import utils
+
+def Main():
+    cache = TreeCache(args.cache_dir, args.cache_max_bytes) if args.cache_dir is not None else None
+    dom_trees = LoadSnapshots(args.snapshots, args.hdp, args.raw_html, args.streaming_json, args.html_parser, args.compact_tree, cache)
+    output_file = open(args.output, 'w') if args.output is not None else sys.stdout
+    try:
+        for step in DiffSeries(dom_trees, args.only_structure, args.alignment_engine, args.linear_space_width, args.debug, max_interned_keys=args.max_interned_keys):
+            record = ToStepRecord(step, args.snapshots[step['step'] - 1], args.snapshots[step['step']], args.summary_only)
+            output_file.write(json.dumps(record) + '\n')
+            output_file.flush()
+            # The nodes of the step hold their trees, so the step is dropped
+            # before the next snapshot is built.
+            del step
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+def LoadSnapshots(filenames, for_hdp, raw_html=False, streaming=False, html_parser=None, compact=False, cache=None):
+    '''
+    Yields the DOM tree of each snapshot. The trees are built as they are
+    requested, so only the trees the caller still holds are in memory.
+    '''
+    for filename in filenames:
+        yield utils.GetDOMTree(filename, for_hdp, raw_html, streaming, html_parser, compact, cache)
+
+
+def DiffSeries(dom_trees, only_structure=False, engine=LCS_ENGINE, linear_space_width=DEFAULT_LINEAR_SPACE_WIDTH, debug=False, stats=None, max_interned_keys=DEFAULT_MAX_INTERNED_KEYS):
+    '''
+    Yields the diff of each snapshot against the previous one.
+
+    Each tree is built once. The tree of snapshot k is the testing tree of
+    step k and then the prepared baseline of step k + 1, so its subtree
+    hashes are reused. Only the previous and the current trees are held,
+    as long as the caller drops each step before it asks for the next one.
+    Once the intern tables have more than max_interned_keys entries, the
+    tables are reset between two steps and the current tree is built again
+    with the new ids, so they do not grow with the length of the series.
+    The nodes of the earlier steps must no longer be used after a reset.
+
+    Each step is a map with the keys:
+        step: the index of the current snapshot, starting at 1.
+        common_size: the size of the common tree.
+        previous_size: the size of the previous snapshot.
+        current_size: the size of the current snapshot.
+        added: the nodes of the current snapshot that are not in the previous one.
+        missing: the nodes of the previous snapshot that are not in the current one.
+    Only the topmost node of an added or a missing subtree is reported.
+    '''
+    baseline = None
+    step = 0
+    for dom_tree in dom_trees:
+        if baseline is not None:
+            added_nodes = []
+            with Phase(stats, DIFF_PHASE):
+                common_dom_tree, missing_nodes = baseline.Diff(dom_tree, debug, stats, added_nodes)
+            yield {
+                'step': step,
+                'common_size': common_dom_tree.size,
+                'previous_size': baseline.correct_dom.size,
+                'current_size': dom_tree.size,
+                'added': added_nodes,
+                'missing': list(missing_nodes),
+            }
+            # The common tree and the nodes of the previous tree must not be
+            # held while the next snapshot is built.
+            del common_dom_tree, missing_nodes, added_nodes
+        # Drop the previous baseline before the next one is built.
+        baseline = None
+        if interning.GetInternedKeyCount() > max_interned_keys:
+            dom_tree = ReinternDOMTree(dom_tree)
+        baseline = find_tree_diff.PreparedBaseline(dom_tree, only_structure, engine, linear_space_width)
+        step += 1
+
+
+def ToStepRecord(step, previous_filename, current_filename, summary_only=False):
+    '''
+    Returns the JSON record of a step of DiffSeries. The nodes are written as
+    in find_tree_diff.DumpMissingNodes.
+    '''
+    record = {
+        'step': step['step'],
+        'previous': previous_filename,
+        'current': current_filename,
+        'common_size': step['common_size'],
+        'previous_size': step['previous_size'],
+        'current_size': step['current_size'],
+        'added_count': len(step['added']),
+        'missing_count': len(step['missing']),
+    }
+    if not summary_only:
+        record['added'] = [ { 'str': str(n), 'signature': n.signature } for n in step['added'] ]
+        record['missing'] = [ { 'str': str(n), 'signature': n.signature } for n in step['missing'] ]
+    return record
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('snapshots', nargs='+', help='the DOM tree files of the snapshots in the order they were recorded')
+    parser.add_argument('--output', default=None, help='JSONL file where the record of each step is written, stdout by default')
+    parser.add_argument('--summary-only', default=False, action='store_true', help='write only the counts of the added and the missing nodes')
+    parser.add_argument('--hdp', default=False, action='store_true')
+    parser.add_argument('--only-structure', default=False, action='store_true')
+    parser.add_argument('--alignment-engine', default=LCS_ENGINE, choices=ALIGNMENT_ENGINES)
+    parser.add_argument('--linear-space-width', default=DEFAULT_LINEAR_SPACE_WIDTH, type=int)
+    parser.add_argument('--debug', default=False, action='store_true')
+    parser.add_argument('--raw-html', default=False, action='store_true')
+    parser.add_argument('--html-parser', default=DEFAULT_HTML_PARSER, choices=HTML_PARSERS)
+    parser.add_argument('--streaming-json', default=False, action='store_true')
+    parser.add_argument('--compact-tree', default=False, action='store_true')
+    parser.add_argument('--cache-dir', default=None, help='directory of the on-disk cache of built DOM trees')
+    parser.add_argument('--cache-max-bytes', default=DEFAULT_MAX_BYTES, type=int)
+    parser.add_argument('--max-interned-keys', default=DEFAULT_MAX_INTERNED_KEYS, type=int, help='reset the intern tables between two steps above this many entries')
+    args = parser.parse_args()
+    Main()
@@ -0,0 +1,92 @@
+from CompactDOMTree import CompactDOMTree
+from DOMTree import DOMTree
+
+import find_tree_diff
+import gc
+import interning
+import snapshot_series
+import unittest
+
+SNAPSHOTS = [
+    '<html><body><div id="a">one</div><ul><li>x</li></ul></body></html>',
+    '<html><body><div id="a">one</div><ul><li>x</li><li>y</li></ul><p>new</p></body></html>',
+    '<html><body><ul><li>x</li><li>y</li></ul><p>new</p></body></html>',
+    '<html><body><ul><li>x</li><li>y</li></ul><p>new</p></body></html>',
+]
+
+class TestSnapshotSeries(unittest.TestCase):
+
+    def test_diff_series(self):
+        '''
+        Tests the added and the missing nodes of each step.
+        '''
+        steps = list(snapshot_series.DiffSeries(DOMTree(html) for html in SNAPSHOTS))
+        self.assertEqual([ 1, 2, 3 ], [ s['step'] for s in steps ])
+        self.assertEqual([ 'p', 'li' ], [ n.type for n in steps[0]['added'] ])
+        self.assertEqual([], steps[0]['missing'])
+        self.assertEqual([], steps[1]['added'])
+        self.assertEqual([ 'div' ], [ n.type for n in steps[1]['missing'] ])
+        self.assertEqual([], steps[2]['added'])
+        self.assertEqual([], steps[2]['missing'])
+        self.assertEqual(steps[2]['current_size'], steps[2]['common_size'])
+
+
+    def test_same_as_pairwise(self):
+        '''
+        Tests that each step matches an independent comparison of the pair.
+        '''
+        steps = snapshot_series.DiffSeries(DOMTree(html) for html in SNAPSHOTS)
+        for i, step in enumerate(steps):
+            previous_dom = DOMTree(SNAPSHOTS[i])
+            current_dom = DOMTree(SNAPSHOTS[i + 1])
+            common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(previous_dom, current_dom)
+            _, added_nodes = find_tree_diff.CompareDOMTrees(current_dom, previous_dom)
+            self.assertEqual(common_dom_tree.size, step['common_size'])
+            self.assertEqual([ str(n) for n in missing_nodes ], [ str(n) for n in step['missing'] ])
+            self.assertEqual([ str(n) for n in added_nodes ], [ str(n) for n in step['added'] ])
+
+        record = snapshot_series.ToStepRecord(step, 'c.html', 'd.html', True)
+        self.assertEqual(0, record['added_count'])
+        self.assertFalse('added' in record)
+
+
+    def test_two_trees_held(self):
+        '''
+        Tests that only the previous tree is held when the next snapshot is
+        built, with the common tree and the nodes of the step dropped.
+        '''
+        for compact in [ False, True ]:
+            live_tree_counts = []
+            def BuildTrees():
+                for html in SNAPSHOTS:
+                    gc.collect()
+                    live_tree_counts.append(sum(1 for o in gc.get_objects() if isinstance(o, (DOMTree, CompactDOMTree))))
+                    yield CompactDOMTree(html) if compact else DOMTree(html)
+            for step in snapshot_series.DiffSeries(BuildTrees()):
+                self.assertGreater(step['common_size'], 0)
+                del step
+            self.assertEqual([ 0, 1, 1, 1 ], live_tree_counts)
+
+
+    def test_reset_between_steps(self):
+        '''
+        Tests that the intern tables are reset between the steps once they
+        are full, and that the steps are the same as without the resets.
+        '''
+        def GetSteps(dom_trees, max_interned_keys):
+            steps = []
+            for step in snapshot_series.DiffSeries(dom_trees, max_interned_keys=max_interned_keys):
+                steps.append(snapshot_series.ToStepRecord(step, 'previous', 'current'))
+                del step
+            return steps
+
+        for compact in [ False, True ]:
+            tree_type = CompactDOMTree if compact else DOMTree
+            expected = GetSteps((tree_type(html) for html in SNAPSHOTS), interning.DEFAULT_MAX_INTERNED_KEYS)
+            generation = interning.GetGeneration()
+            self.assertEqual(expected, GetSteps((tree_type(html) for html in SNAPSHOTS), 1))
+            self.assertEqual(generation + len(SNAPSHOTS), interning.GetGeneration())
+
+
+if __name__ == '__main__':
+    unittest.main()
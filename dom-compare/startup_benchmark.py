@@ -0,0 +1,72 @@
+from argparse import ArgumentParser
+
+import dom_generator
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# The modules that the diff of a JSON pair should not load.
+HEAVY_MODULES = [ 'bs4', 'lxml', 'html5lib', 'ijson', 'multiprocessing' ]
+
+# Prints the heavy modules that are loaded after a command of dom_compare
+# runs, with the output of the command dropped.
+LOADED_MODULES_SCRIPT = '''
+import os, sys
+sys.argv[0] = 'dom_compare.py'
+sys.stdout = open(os.devnull, 'w')
+import dom_compare
+dom_compare.Main(sys.argv[1:])
+sys.stdout = sys.__stdout__
+print ' '.join([ m for m in {0!r} if m in sys.modules ])
+'''
+
+def Main():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = dom_generator.WritePagePair(tmp_dir, dom_generator.CreateGenerator(args))
+        diff_args = [ paths['a_json'], paths['b_json'] ]
+        commands = [
+            ('python', [ sys.executable, '-c', 'print 1' ]),
+            ('find_tree_diff', [ sys.executable, os.path.join(directory, 'find_tree_diff.py') ] + diff_args),
+            ('dom_compare diff', [ sys.executable, os.path.join(directory, 'dom_compare.py'), 'diff' ] + diff_args),
+        ]
+        for name, command in commands:
+            first_results, totals = zip(*[ TimeCommand(command) for _ in xrange(args.repeat) ])
+            print '{0}: first result {1:.1f}ms, exit {2:.1f}ms (median of {3})'.format(name, Median(first_results) * 1000, Median(totals) * 1000, args.repeat)
+
+        loaded = subprocess.check_output([ sys.executable, '-c', LOADED_MODULES_SCRIPT.format(HEAVY_MODULES), 'diff' ] + diff_args, cwd=directory).strip()
+        print 'LOADED: {0}'.format(loaded if loaded != '' else 'none of ' + ' '.join(HEAVY_MODULES))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def TimeCommand(command):
+    '''
+    Runs the command and returns the time until it writes its first line,
+    which is the first result of the diff, and the time until it exits.
+    '''
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    process.stdout.readline()
+    first_result = time.time() - start
+    process.stdout.read()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return first_result, time.time() - start
+
+
+def Median(values):
+    return sorted(values)[len(values) // 2]
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--repeat', default=11, type=int)
+    dom_generator.AddGeneratorArguments(parser)
+    parser.set_defaults(depth=5, fan_out=4)
+    args = parser.parse_args()
+    Main()
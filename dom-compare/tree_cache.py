@@ -0,0 +1,397 @@
+from DOMNode import DOMNode
+from DOMTree import DOMTree
+from dom_json_stream import DOMNodeRecord
+from html_parsers import DEFAULT_HTML_PARSER
+from signature_trie import GetSignaturePiece, ROOT_SIGNATURE_ID, SIGNATURE_DELIM
+
+import atexit
+import errno
+import fcntl
+import hashlib
+import interning
+import json
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import weakref
+
+# Bump this when the layout of the cached rows changes. marshal is only
+# compatible within one Python version, so that is part of the key as well.
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+ENTRY_SUFFIX = '.tree'
+FINGERPRINT_SUFFIX = '.fingerprint'
+LOCK_FILENAME = 'lock'
+STATS_FILENAME = 'stats.json'
+
+STAT_KEYS = [ 'hits', 'misses', 'puts', 'evictions' ]
+
+# The hits and misses are counted in memory and written to the stats file
+# on each put and eviction, or once this many are pending.
+STATS_FLUSH_COUNT = 100
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# The caches whose pending counters are written when the process exits.
+_open_caches = weakref.WeakSet()
+
+class TreeCache(object):
+    '''
+    A content-addressed on-disk cache of built DOM trees.
+
+    The entries are keyed by the hash of the input file and the options the
+    tree was built with. Each entry holds the number of the nodes that were
+    skipped when the tree was built and the nodes of the tree in the
+    breadth-first order in the marshal format, so a tree is loaded without
+    parsing the input again. The cache is bounded by max_bytes and the least
+    recently used entries are evicted first. Several processes may share
+    one cache directory: entries are written to a temporary file and renamed,
+    and the eviction and the statistics are guarded by a lock file. The
+    counters of each process are kept in memory and added to the shared
+    ones by FlushStats, which Close and the exit of the process call.
+    '''
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # The counters that are not written to the stats file yet. The cache
+        # may be used by several threads of the daemon.
+        self.pending_stats = { k: 0 for k in STAT_KEYS }
+        self.pending_lock = threading.Lock()
+        _open_caches.add(self)
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+    def ComputeKey(self, dom_tree_filename, for_hdp, raw_html, html_parser):
+        '''
+        Returns the cache key of the tree built from the given file with the
+        given options.
+        '''
+        content_hash = hashlib.sha1()
+        with open(dom_tree_filename, 'rb') as input_file:
+            block = input_file.read(HASH_BLOCK_SIZE)
+            while block:
+                content_hash.update(block)
+                block = input_file.read(HASH_BLOCK_SIZE)
+        options = [ CACHE_FORMAT_VERSION, sys.version_info[:2], bool(for_hdp), bool(raw_html), (html_parser or DEFAULT_HTML_PARSER) if raw_html else None ]
+        key_hash = hashlib.sha1(content_hash.hexdigest())
+        key_hash.update(repr(options))
+        return key_hash.hexdigest()
+
+
+    def Get(self, key):
+        '''
+        Returns the cached DOMTree with the given key, or None if it is not
+        in the cache.
+        '''
+        entry_path = self.GetEntryPath(key)
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                skipped_count, rows = marshal.load(entry_file)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.RecordStat('misses')
+            return None
+        except (EOFError, ValueError, TypeError):
+            # A corrupted entry is dropped and built again.
+            self.RemoveEntry(entry_path)
+            self.RecordStat('misses')
+            return None
+
+        # The modification time is the last use time of the entry.
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        self.RecordStat('hits')
+        dom_tree = DecodeDOMTree(rows)
+        dom_tree.skipped_count = skipped_count
+        return dom_tree
+
+
+    def Put(self, key, dom_tree):
+        '''
+        Stores the DOMTree under the given key and evicts the least recently
+        used entries when the cache is over its size.
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                marshal.dump((dom_tree.skipped_count, EncodeDOMTree(dom_tree)), tmp_file, 2)
+            os.rename(tmp_path, self.GetEntryPath(key))
+        except:
+            self.RemoveEntry(tmp_path)
+            raise
+        self.RecordStat('puts')
+        with self.Lock():
+            self.Evict()
+            self.WritePendingStats()
+
+
+    def GetFingerprint(self, key):
+        '''
+        Returns the fingerprint record stored next to the tree with the given
+        key, or None if there is none.
+        '''
+        fingerprint_path = self.GetFingerprintPath(key)
+        try:
+            with open(fingerprint_path, 'rb') as fingerprint_file:
+                record = marshal.load(fingerprint_file)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        except (EOFError, ValueError, TypeError):
+            self.RemoveEntry(fingerprint_path)
+            return None
+        try:
+            os.utime(fingerprint_path, None)
+        except OSError:
+            pass
+        return record
+
+
+    def PutFingerprint(self, key, record):
+        '''
+        Stores the fingerprint record next to the tree with the given key.
+        The fingerprint is evicted with the tree, and counts toward the size
+        of the cache.
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                marshal.dump(record, tmp_file, 2)
+            os.rename(tmp_path, self.GetFingerprintPath(key))
+        except:
+            self.RemoveEntry(tmp_path)
+            raise
+        with self.Lock():
+            self.Evict()
+            self.WritePendingStats()
+
+
+    def Evict(self):
+        '''
+        Removes the least recently used entries until the cache fits in
+        max_bytes. An entry is the tree and the fingerprint of a key, either
+        of which may be missing, and was last used when either was. The lock
+        must be held.
+        '''
+        # Maps the key to [ last use time, size ].
+        entries = {}
+        total_bytes = 0
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(ENTRY_SUFFIX):
+                key = filename[:-len(ENTRY_SUFFIX)]
+            elif filename.endswith(FINGERPRINT_SUFFIX):
+                key = filename[:-len(FINGERPRINT_SUFFIX)]
+            else:
+                continue
+            try:
+                file_stat = os.stat(os.path.join(self.cache_dir, filename))
+            except OSError:
+                continue
+            entry = entries.setdefault(key, [ file_stat.st_mtime, 0 ])
+            entry[0] = max(entry[0], file_stat.st_mtime)
+            entry[1] += file_stat.st_size
+            total_bytes += file_stat.st_size
+
+        evictions = 0
+        for _, entry_size, key in sorted([ (mtime, size, key) for key, (mtime, size) in entries.iteritems() ]):
+            if total_bytes <= self.max_bytes:
+                break
+            self.RemoveEntry(self.GetEntryPath(key))
+            self.RemoveEntry(self.GetFingerprintPath(key))
+            total_bytes -= entry_size
+            evictions += 1
+        if evictions > 0:
+            self.RecordStat('evictions', evictions, flush=False)
+
+
+    def Stats(self):
+        '''
+        Returns the hit, miss, put and eviction counts of all the processes
+        that used this cache, and the number and total size of the entries.
+        '''
+        with self.Lock():
+            self.WritePendingStats()
+            stats = self.ReadStats()
+        filenames = os.listdir(self.cache_dir)
+        stats['entries'] = len([ f for f in filenames if f.endswith(ENTRY_SUFFIX) ])
+        stats['bytes'] = sum([ os.path.getsize(os.path.join(self.cache_dir, f)) for f in filenames if f.endswith(ENTRY_SUFFIX) or f.endswith(FINGERPRINT_SUFFIX) ])
+        return stats
+
+
+    def RecordStat(self, stat, count=1, flush=True):
+        '''
+        Adds count to the given counter in memory. The pending counters are
+        written once STATS_FLUSH_COUNT of them are pending, unless flush is
+        False.
+        '''
+        with self.pending_lock:
+            self.pending_stats[stat] += count
+            pending_count = sum(self.pending_stats.itervalues())
+        if flush and pending_count >= STATS_FLUSH_COUNT:
+            self.FlushStats()
+
+
+    def FlushStats(self):
+        '''
+        Adds the pending counters to the stats file.
+        '''
+        with self.pending_lock:
+            if sum(self.pending_stats.itervalues()) == 0:
+                return
+        with self.Lock():
+            self.WritePendingStats()
+
+
+    def Close(self):
+        '''
+        Writes the pending counters. The cache may still be used after.
+        '''
+        self.FlushStats()
+
+
+    def ReadStats(self):
+        '''
+        Returns the persisted counters. The lock must be held.
+        '''
+        stats = { k: 0 for k in STAT_KEYS }
+        try:
+            with open(os.path.join(self.cache_dir, STATS_FILENAME), 'r') as stats_file:
+                stats.update(json.load(stats_file))
+        except (IOError, ValueError):
+            pass
+        return stats
+
+
+    def WritePendingStats(self):
+        '''
+        Adds the pending counters to the stats file and resets them. The lock
+        must be held.
+        '''
+        with self.pending_lock:
+            pending_stats = self.pending_stats
+            self.pending_stats = { k: 0 for k in STAT_KEYS }
+        if sum(pending_stats.itervalues()) == 0:
+            return
+        stats = self.ReadStats()
+        for stat, count in pending_stats.iteritems():
+            stats[stat] += count
+        stats_path = os.path.join(self.cache_dir, STATS_FILENAME)
+        with open(stats_path + '.tmp', 'w') as stats_file:
+            json.dump(stats, stats_file)
+        os.rename(stats_path + '.tmp', stats_path)
+
+
+    def Lock(self):
+        '''
+        Returns the lock that guards the eviction and the statistics.
+        '''
+        return FileLock(os.path.join(self.cache_dir, LOCK_FILENAME))
+
+
+    def GetEntryPath(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+
+    def GetFingerprintPath(self, key):
+        return os.path.join(self.cache_dir, key + FINGERPRINT_SUFFIX)
+
+
+    def RemoveEntry(self, entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+
+def FlushOpenCaches():
+    '''
+    Writes the pending counters of the caches that are still open.
+    '''
+    for cache in list(_open_caches):
+        cache.FlushStats()
+
+
+atexit.register(FlushOpenCaches)
+
+
+class FileLock(object):
+    '''
+    An exclusive flock on a file, used as a context manager.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock_file = None
+
+    def __enter__(self):
+        self.lock_file = open(self.path, 'a')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+        self.lock_file = None
+
+
+def EncodeDOMTree(dom_tree):
+    '''
+    Returns the rows of the nodes of the tree in the breadth-first order.
+
+    Each row is (node id, type, value, attributes, parent id, local signature,
+    index of the parent row). The root has the parent row -1.
+    '''
+    rows = []
+    if dom_tree.root_node is None:
+        return rows
+    row_of_id = {}
+    for node in dom_tree.IterSubtree(dom_tree.root_node):
+        parent_row = row_of_id[node.parent_id] if len(rows) > 0 else -1
+        row_of_id[node.id] = len(rows)
+        local_signature = GetSignaturePiece(node.signature_id)[:-len(SIGNATURE_DELIM)]
+        rows.append((node.id, node.type, node.value, node.attributes, node.parent_id, local_signature, parent_row))
+    return rows
+
+
+def ReinternDOMTree(dom_tree):
+    '''
+    Resets the intern tables and returns the tree built again with the ids
+    of the new generation. A CompactDOMTree is built again as one. The tree
+    must be the only one that is still used.
+    '''
+    rows = EncodeDOMTree(dom_tree)
+    interning.ResetInternTables()
+    rebuilt_tree = DecodeDOMTree(rows)
+    if isinstance(dom_tree, DOMTree):
+        rebuilt_tree.skipped_count = dom_tree.skipped_count
+        return rebuilt_tree
+    from CompactDOMTree import CompactDOMTree
+    return CompactDOMTree(rebuilt_tree)
+
+
+def DecodeDOMTree(rows):
+    '''
+    Returns the DOMTree built from the rows from EncodeDOMTree.
+    '''
+    if len(rows) == 0:
+        return DOMTree({})
+    records = []
+    for node_id, node_type, value, attributes, parent_id, local_signature, parent_row in rows:
+        # The signature is interned when the tree is built from the records.
+        node = DOMNode(node_id, node_type, value, attributes, parent_id, ROOT_SIGNATURE_ID)
+        record = DOMNodeRecord(node, local_signature, parent_row != -1, [])
+        if parent_row != -1:
+            records[parent_row].children.append(record)
+        records.append(record)
+    return DOMTree(records[0])
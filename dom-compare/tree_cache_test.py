@@ -0,0 +1,158 @@
+from DOMTree import DOMTree
+from html_parsers import DEFAULT_HTML_PARSER
+from tree_cache import TreeCache
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import tree_cache
+import unittest
+import utils
+
+DOM_JSON = '{"result":{"root":{"nodeId":1,"nodeName":"#document","children":[{"nodeId":2,"parentId":1,"nodeName":"HTML","children":[{"nodeId":3,"parentId":2,"nodeName":"BODY","children":[{"nodeId":4,"parentId":3,"nodeName":"DIV","attributes":["class","a b","style","display: none"],"children":[{"nodeId":5,"parentId":4,"nodeName":"#text","nodeValue":"hello"}]},{"nodeId":6,"parentId":3,"nodeName":"SCRIPT","attributes":["src","a.js"]},{"nodeId":7,"parentId":3,"nodeName":"SPAN","attributes":["id","x"]}]}]}]}}}'
+HTML = '<html><head><title>t</title></head><body><div class="a b">x<b>y</b></div><ul><li>1</li><li>2</li></ul></body></html>'
+
+class TestTreeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.json_filename = os.path.join(self.tmp_dir, 'dom.json')
+        self.html_filename = os.path.join(self.tmp_dir, 'dom.html')
+        with open(self.json_filename, 'w') as f:
+            f.write(DOM_JSON)
+        with open(self.html_filename, 'w') as f:
+            f.write(HTML)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def assertSameTree(self, expected, got):
+        self.assertEqual(expected.size, got.size)
+        self.assertEqual(expected.skipped_count, got.skipped_count)
+        self.assertEqual(json.dumps(expected.Serialize()), json.dumps(got.Serialize()))
+        for expected_node, got_node in zip(iter(expected), iter(got)):
+            self.assertEqual(expected_node, got_node)
+            self.assertEqual(expected_node.parent_id, got_node.parent_id)
+            self.assertEqual(expected_node.signature, got_node.signature)
+            self.assertEqual(expected_node.structure_key, got_node.structure_key)
+
+
+    def test_round_trip(self):
+        '''
+        Tests that a cached tree is the same as the tree built from the file.
+        '''
+        cache = TreeCache(self.cache_dir)
+        for filename, raw_html in [ (self.json_filename, False), (self.html_filename, True) ]:
+            for for_hdp in [ False, True ]:
+                expected = utils.GetDOMTree(filename, for_hdp, raw_html)
+                self.assertSameTree(expected, utils.GetDOMTree(filename, for_hdp, raw_html, cache=cache))
+                self.assertSameTree(expected, utils.GetDOMTree(filename, for_hdp, raw_html, cache=cache))
+        stats = cache.Stats()
+        self.assertEqual(4, stats['misses'])
+        self.assertEqual(4, stats['hits'])
+        self.assertEqual(4, stats['puts'])
+        self.assertEqual(4, stats['entries'])
+        # The nodes skipped for HDP are counted on a hit as well.
+        self.assertEqual(1, utils.GetDOMTree(self.json_filename, True, cache=cache).skipped_count)
+
+
+    def test_key(self):
+        '''
+        Tests that the key depends on the content and the options.
+        '''
+        cache = TreeCache(self.cache_dir)
+        key = cache.ComputeKey(self.json_filename, False, False, 'html5lib')
+        self.assertEqual(key, cache.ComputeKey(self.json_filename, False, False, 'lxml'))
+        self.assertNotEqual(key, cache.ComputeKey(self.json_filename, True, False, 'html5lib'))
+        self.assertNotEqual(cache.ComputeKey(self.html_filename, False, True, 'html5lib'), cache.ComputeKey(self.html_filename, False, True, 'lxml'))
+        with open(self.json_filename, 'w') as f:
+            f.write(DOM_JSON.replace('hello', 'world'))
+        self.assertNotEqual(key, cache.ComputeKey(self.json_filename, False, False, 'html5lib'))
+        self.assertEqual(cache.ComputeKey(self.html_filename, False, True, None), cache.ComputeKey(self.html_filename, False, True, DEFAULT_HTML_PARSER))
+
+
+    def test_pending_stats(self):
+        '''
+        Tests that the hits and misses are written to the stats file on a
+        put or a flush, and not on each lookup.
+        '''
+        tree = DOMTree(json.loads(DOM_JSON)['result']['root'])
+        cache = TreeCache(self.cache_dir)
+        stats_path = os.path.join(self.cache_dir, tree_cache.STATS_FILENAME)
+        self.assertIsNone(cache.Get('a'))
+        self.assertFalse(os.path.exists(stats_path))
+        cache.Put('a', tree)
+        with open(stats_path) as f:
+            self.assertEqual({ 'hits': 0, 'misses': 1, 'puts': 1, 'evictions': 0 }, json.load(f))
+
+        mtime = os.path.getmtime(stats_path)
+        for _ in xrange(tree_cache.STATS_FLUSH_COUNT - 1):
+            cache.Get('a')
+        self.assertEqual(mtime, os.path.getmtime(stats_path))
+        cache.Close()
+        with open(stats_path) as f:
+            self.assertEqual(tree_cache.STATS_FLUSH_COUNT - 1, json.load(f)['hits'])
+
+        # Another process sees the counters of this one once they are flushed.
+        for _ in xrange(tree_cache.STATS_FLUSH_COUNT):
+            cache.Get('a')
+        self.assertEqual(2 * tree_cache.STATS_FLUSH_COUNT - 1, TreeCache(self.cache_dir).Stats()['hits'])
+
+
+    def test_eviction(self):
+        '''
+        Tests that the least recently used entries are evicted first.
+        '''
+        tree = DOMTree(json.loads(DOM_JSON)['result']['root'])
+        cache = TreeCache(self.cache_dir)
+        cache.Put('a', tree)
+        entry_size = os.path.getsize(cache.GetEntryPath('a'))
+
+        cache = TreeCache(self.cache_dir, 2 * entry_size)
+        now = time.time()
+        os.utime(cache.GetEntryPath('a'), (now - 20, now - 20))
+        cache.Put('b', tree)
+        os.utime(cache.GetEntryPath('b'), (now - 10, now - 10))
+        # Using a makes b the least recently used entry.
+        self.assertNotEqual(None, cache.Get('a'))
+        cache.Put('c', tree)
+        self.assertNotEqual(None, cache.Get('a'))
+        self.assertEqual(None, cache.Get('b'))
+        self.assertNotEqual(None, cache.Get('c'))
+        self.assertEqual(1, cache.Stats()['evictions'])
+
+
+    def test_fingerprint_eviction(self):
+        '''
+        Tests that the fingerprints count toward the size of the cache and
+        are evicted without a tree.
+        '''
+        cache = TreeCache(self.cache_dir)
+        cache.PutFingerprint('a', (1, 'x' * 1000))
+        fingerprint_size = os.path.getsize(cache.GetFingerprintPath('a'))
+        self.assertEqual(fingerprint_size, cache.Stats()['bytes'])
+
+        cache = TreeCache(self.cache_dir, fingerprint_size)
+        now = time.time()
+        os.utime(cache.GetFingerprintPath('a'), (now - 10, now - 10))
+        cache.PutFingerprint('b', (1, 'x' * 1000))
+        self.assertEqual(None, cache.GetFingerprint('a'))
+        self.assertNotEqual(None, cache.GetFingerprint('b'))
+        self.assertEqual(1, cache.Stats()['evictions'])
+
+
+    def test_corrupted_entry(self):
+        cache = TreeCache(self.cache_dir)
+        with open(cache.GetEntryPath('a'), 'wb') as f:
+            f.write('\x00garbage')
+        self.assertEqual(None, cache.Get('a'))
+        self.assertFalse(os.path.exists(cache.GetEntryPath('a')))
+
+
+if __name__ == '__main__':
+    unittest.main()
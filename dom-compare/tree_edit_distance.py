@@ -0,0 +1,314 @@
+from argparse import ArgumentParser
+from html_parsers import DEFAULT_HTML_PARSER, HTML_PARSERS
+from itertools import izip
+
+import find_tree_diff
+import json
+import sys
+import time
+import utils
+
+# The engines that can produce the result.
+ZHANG_SHASHA_ENGINE = 'zhang_shasha'
+LEVEL_WISE_ENGINE = 'level_wise'
+
+# The default budgets. The cells are the cells of the forest distance tables
+# that the Zhang-Shasha algorithm computes, which is known before it starts.
+DEFAULT_MAX_CELLS = 10000000
+DEFAULT_TIME_BUDGET = 15.0
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class _OrderedTree(object):
+    '''
+    A DOM tree in the post-order used by the Zhang-Shasha algorithm.
+
+    The nodes are numbered from 1. Identical subtrees that are shared with
+    the other tree are collapsed into a single leaf, whose label is the hash
+    of the subtree and whose cost is the size of the subtree.
+    '''
+    def __init__(self, dom_tree, only_structure, shared_subtrees):
+        self.dom_tree = dom_tree
+        # The DOM node, the label, the insert or delete cost and the leftmost
+        # leaf descendant of each node. The collapsed flag tells the leaves
+        # that stand for a whole subtree.
+        self.nodes = [ None ]
+        self.labels = [ None ]
+        self.costs = [ 0 ]
+        self.collapsed = [ False ]
+        self.leftmost = [ 0 ]
+        if dom_tree.root_node is not None:
+            self.AddPostOrder(dom_tree.root_node, only_structure, shared_subtrees)
+        self.size = len(self.nodes) - 1
+
+        # A node is a keyroot when it has no left sibling, that is when it
+        # is the highest node with its leftmost leaf.
+        highest = {}
+        for i in xrange(1, self.size + 1):
+            highest[self.leftmost[i]] = i
+        self.keyroots = sorted(highest.values())
+
+
+    def AddPostOrder(self, root_node, only_structure, shared_subtrees):
+        stack = [ (root_node, False) ]
+        first_index = {}
+        while len(stack) > 0:
+            node, finished = stack.pop()
+            if not finished:
+                subtree = (self.dom_tree.SubtreeSize(node), self.dom_tree.SubtreeHash(node, only_structure))
+                if subtree[0] > 1 and subtree in shared_subtrees:
+                    self.AppendNode(node, subtree, subtree[0], True, len(self.nodes))
+                    continue
+                first_index[node.id] = len(self.nodes)
+                stack.append((node, True))
+                stack.extend([ (child, False) for child in reversed(self.dom_tree.GetChildren(node.id)) ])
+                continue
+            label = node.structure_key if only_structure else node.key
+            # The first node appended in the subtree is its leftmost leaf.
+            self.AppendNode(node, label, 1, False, first_index.pop(node.id))
+
+
+    def AppendNode(self, node, label, cost, collapsed, leftmost):
+        self.nodes.append(node)
+        self.labels.append(label)
+        self.costs.append(cost)
+        self.collapsed.append(collapsed)
+        self.leftmost.append(leftmost)
+
+
+    def CountCells(self):
+        '''
+        Returns the sum of the sizes of the keyroot subtrees.
+        '''
+        return sum([ i - self.leftmost[i] + 1 for i in self.keyroots ])
+
+
+def TreeEditDistance(correct_dom, testing_dom, only_structure=False, max_cells=DEFAULT_MAX_CELLS, time_budget=DEFAULT_TIME_BUDGET, prune=True):
+    '''
+    Computes the tree edit distance between the two DOM trees with the
+    Zhang-Shasha algorithm. Inserting, deleting or renaming a node costs 1,
+    and renaming a node into an equal node costs 0.
+
+    When prune is set, the identical subtrees found in both trees are
+    collapsed first, so the distance is an upper bound of the exact one.
+    When the algorithm would compute more than max_cells cells, or runs for
+    more than time_budget seconds, the level-wise diff of find_tree_diff
+    is returned instead.
+
+    Returns a map with the keys:
+        engine: ZHANG_SHASHA_ENGINE or LEVEL_WISE_ENGINE.
+        distance: the edit distance. For the level-wise diff it is the number
+            of nodes that are not in the common tree.
+        mapping: the matched (correct node, testing node) pairs.
+        cells: the number of cells the algorithm computes.
+        seconds: the wall time.
+        memory_bytes: the estimated peak memory of the tables.
+        fallback_reason: why the level-wise diff was used, or None.
+    '''
+    start = time.time()
+    shared_subtrees = GetSharedSubtrees(correct_dom, testing_dom, only_structure) if prune else set()
+    correct_tree = _OrderedTree(correct_dom, only_structure, shared_subtrees)
+    testing_tree = _OrderedTree(testing_dom, only_structure, shared_subtrees)
+    cells = correct_tree.CountCells() * testing_tree.CountCells()
+    memory_bytes = EstimateMemory(correct_tree, testing_tree)
+    result = { 'cells': cells, 'memory_bytes': memory_bytes, 'fallback_reason': None }
+
+    if cells > max_cells:
+        result['fallback_reason'] = 'the cells exceed the budget of {0}'.format(max_cells)
+    else:
+        try:
+            distance, mapping = ZhangShasha(correct_tree, testing_tree, start + time_budget)
+            result['engine'] = ZHANG_SHASHA_ENGINE
+            result['distance'] = distance
+            result['mapping'] = mapping
+        except BudgetExceeded:
+            result['fallback_reason'] = 'the time exceeds the budget of {0}s'.format(time_budget)
+
+    if result['fallback_reason'] is not None:
+        mapping = []
+        find_tree_diff.PreparedBaseline(correct_dom, only_structure).Diff(testing_dom, mapping=mapping)
+        result['engine'] = LEVEL_WISE_ENGINE
+        result['distance'] = correct_dom.size + testing_dom.size - 2 * len(mapping)
+        result['mapping'] = mapping
+    result['seconds'] = time.time() - start
+    return result
+
+
+def GetSharedSubtrees(correct_dom, testing_dom, only_structure=False):
+    '''
+    Returns the (size, hash) of the subtrees that are in both trees.
+    '''
+    correct_subtrees = set([ (correct_dom.SubtreeSize(n), correct_dom.SubtreeHash(n, only_structure)) for n in correct_dom.IterSubtree(correct_dom.root_node) ]) if correct_dom.root_node is not None else set()
+    if testing_dom.root_node is None:
+        return set()
+    return set([ s for s in [ (testing_dom.SubtreeSize(n), testing_dom.SubtreeHash(n, only_structure)) for n in testing_dom.IterSubtree(testing_dom.root_node) ] if s in correct_subtrees ])
+
+
+def EstimateMemory(correct_tree, testing_tree):
+    '''
+    Returns the estimated peak memory in bytes of the tree distance table
+    and the largest forest distance table.
+    '''
+    row_size = sys.getsizeof([ 0 ] * (testing_tree.size + 1))
+    forest_row_size = sys.getsizeof([ 0 ] * (testing_tree.size + 2))
+    return (correct_tree.size + 1) * row_size + (correct_tree.size + 2) * forest_row_size
+
+
+def ZhangShasha(correct_tree, testing_tree, deadline):
+    '''
+    Returns the edit distance and the mapping of the two ordered trees.
+
+    The distance of every pair of subtrees is memoized in the tree distance
+    table, so each forest distance table reuses the subtrees below it. The
+    backtrack computes the forest distance tables of the matched subtrees
+    again. Raises BudgetExceeded when the deadline passes, in either pass.
+    '''
+    if correct_tree.size == 0 or testing_tree.size == 0:
+        return sum(correct_tree.costs) + sum(testing_tree.costs), []
+    tree_distance = [ [ 0 ] * (testing_tree.size + 1) for i in xrange(correct_tree.size + 1) ]
+    for i in correct_tree.keyroots:
+        for j in testing_tree.keyroots:
+            if time.time() > deadline:
+                raise BudgetExceeded()
+            ForestDistance(correct_tree, testing_tree, i, j, tree_distance)
+
+    mapping = []
+    stack = [ (correct_tree.size, testing_tree.size) ]
+    while len(stack) > 0:
+        if time.time() > deadline:
+            raise BudgetExceeded()
+        i, j = stack.pop()
+        BacktrackForest(correct_tree, testing_tree, i, j, tree_distance, mapping, stack)
+    return tree_distance[correct_tree.size][testing_tree.size], mapping
+
+
+def RenameCost(correct_tree, testing_tree, i, j):
+    '''
+    Returns the cost of renaming node i of the correct tree into node j of
+    the testing tree. Collapsed subtrees only match the same subtree.
+    '''
+    if correct_tree.labels[i] == testing_tree.labels[j]:
+        return 0
+    if correct_tree.collapsed[i] or testing_tree.collapsed[j]:
+        return correct_tree.costs[i] + testing_tree.costs[j]
+    return 1
+
+
+def ForestDistance(correct_tree, testing_tree, i, j, tree_distance):
+    '''
+    Computes the forest distance table of the subtrees rooted at i and j and
+    stores the distances of the subtrees on their leftmost paths in
+    tree_distance. Returns the table.
+    '''
+    correct_leftmost = correct_tree.leftmost
+    testing_leftmost = testing_tree.leftmost
+    correct_costs = correct_tree.costs
+    testing_costs = testing_tree.costs
+    li = correct_leftmost[i]
+    lj = testing_leftmost[j]
+    rows = i - li + 2
+    columns = j - lj + 2
+
+    forest = [ [ 0 ] * columns for x in xrange(rows) ]
+    for x in xrange(1, rows):
+        forest[x][0] = forest[x - 1][0] + correct_costs[li + x - 1]
+    first_row = forest[0]
+    for y in xrange(1, columns):
+        first_row[y] = first_row[y - 1] + testing_costs[lj + y - 1]
+
+    for x in xrange(1, rows):
+        i1 = li + x - 1
+        row = forest[x]
+        previous_row = forest[x - 1]
+        delete_cost = correct_costs[i1]
+        i1_leftmost = correct_leftmost[i1]
+        i1_distances = tree_distance[i1]
+        for y in xrange(1, columns):
+            j1 = lj + y - 1
+            deleted = previous_row[y] + delete_cost
+            inserted = row[y - 1] + testing_costs[j1]
+            if i1_leftmost == li and testing_leftmost[j1] == lj:
+                renamed = previous_row[y - 1] + RenameCost(correct_tree, testing_tree, i1, j1)
+                best = min(deleted, inserted, renamed)
+                i1_distances[j1] = best
+            else:
+                best = min(deleted, inserted, forest[i1_leftmost - li][testing_leftmost[j1] - lj] + i1_distances[j1])
+            row[y] = best
+    return forest
+
+
+def BacktrackForest(correct_tree, testing_tree, i, j, tree_distance, mapping, stack):
+    '''
+    Appends to mapping the matched pairs on the leftmost paths of the
+    subtrees rooted at i and j, and pushes the pairs of
+    subtrees that are matched as a whole to the stack.
+    '''
+    forest = ForestDistance(correct_tree, testing_tree, i, j, tree_distance)
+    li = correct_tree.leftmost[i]
+    lj = testing_tree.leftmost[j]
+    x = i - li + 1
+    y = j - lj + 1
+    while x > 0 or y > 0:
+        i1 = li + x - 1
+        j1 = lj + y - 1
+        if y == 0 or (x > 0 and forest[x][y] == forest[x - 1][y] + correct_tree.costs[i1]):
+            x -= 1
+        elif x == 0 or forest[x][y] == forest[x][y - 1] + testing_tree.costs[j1]:
+            y -= 1
+        elif correct_tree.leftmost[i1] == li and testing_tree.leftmost[j1] == lj:
+            AppendPair(correct_tree, testing_tree, i1, j1, mapping)
+            x -= 1
+            y -= 1
+        else:
+            stack.append((i1, j1))
+            x = correct_tree.leftmost[i1] - li
+            y = testing_tree.leftmost[j1] - lj
+
+
+def AppendPair(correct_tree, testing_tree, i, j, mapping):
+    '''
+    Appends the pair of nodes to mapping. A pair of collapsed subtrees is
+    expanded into the pairs of their nodes.
+    '''
+    if not correct_tree.collapsed[i]:
+        mapping.append((correct_tree.nodes[i], testing_tree.nodes[j]))
+        return
+    mapping.extend(izip(correct_tree.dom_tree.IterSubtree(correct_tree.nodes[i]), testing_tree.dom_tree.IterSubtree(testing_tree.nodes[j])))
+
+
+def Main():
+    dom_a = utils.GetDOMTree(args.dom_tree_a, args.hdp, args.raw_html, html_parser=args.html_parser)
+    dom_b = utils.GetDOMTree(args.dom_tree_b, args.hdp, args.raw_html, html_parser=args.html_parser)
+
+    # Assume that DOM B is the correct DOM Tree.
+    result = TreeEditDistance(dom_b, dom_a, args.only_structure, args.max_cells, args.time_budget, not args.no_prune)
+    print 'engine: {0}'.format(result['engine'])
+    if result['fallback_reason'] is not None:
+        print 'fallback: {0}'.format(result['fallback_reason'])
+    print 'distance: {0}'.format(result['distance'])
+    print 'mapped: {0} of {1} {2}'.format(len(result['mapping']), dom_b.size, dom_a.size)
+    print 'cells: {0}'.format(result['cells'])
+    print 'seconds: {0:.4f}'.format(result['seconds'])
+    print 'memory: {0} bytes'.format(result['memory_bytes'])
+    if args.dump_mapping is not None:
+        with open(args.dump_mapping, 'w') as output_file:
+            for correct_node, testing_node in result['mapping']:
+                output_file.write(json.dumps({ 'correct': str(correct_node), 'testing': str(testing_node), 'renamed': correct_node != testing_node }) + '\n')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('dom_tree_a')
+    parser.add_argument('dom_tree_b')
+    parser.add_argument('--hdp', default=False, action='store_true')
+    parser.add_argument('--only-structure', default=False, action='store_true')
+    parser.add_argument('--raw-html', default=False, action='store_true')
+    parser.add_argument('--html-parser', default=DEFAULT_HTML_PARSER, choices=HTML_PARSERS)
+    parser.add_argument('--max-cells', default=DEFAULT_MAX_CELLS, type=int, help='the number of table cells after which the level-wise diff is used')
+    parser.add_argument('--time-budget', default=DEFAULT_TIME_BUDGET, type=float, help='the seconds after which the level-wise diff is used')
+    parser.add_argument('--no-prune', default=False, action='store_true', help='do not collapse the identical subtrees first')
+    parser.add_argument('--dump-mapping', default=None, help='JSONL file where the matched pairs of nodes are written')
+    args = parser.parse_args()
+    Main()
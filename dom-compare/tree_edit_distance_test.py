@@ -0,0 +1,85 @@
+from DOMTree import DOMTree
+
+import find_tree_diff
+import tree_edit_distance
+import unittest
+
+CORRECT_HTML = '<html><body><div class="a"><p>one</p><p>two</p><ul><li>x</li><li>y</li></ul></div><span>z</span></body></html>'
+WRAPPED_HTML = '<html><body><section><div class="a"><p>one</p><p>two</p><ul><li>x</li><li>y</li></ul></div></section><span>z</span></body></html>'
+
+class TestTreeEditDistance(unittest.TestCase):
+
+    def test_identical(self):
+        dom = DOMTree(CORRECT_HTML)
+        result = tree_edit_distance.TreeEditDistance(dom, DOMTree(CORRECT_HTML))
+        self.assertEqual(tree_edit_distance.ZHANG_SHASHA_ENGINE, result['engine'])
+        self.assertEqual(0, result['distance'])
+        self.assertEqual(dom.size, len(result['mapping']))
+
+
+    def test_wrapper(self):
+        '''
+        Tests that a wrapper element costs a single insertion, while the
+        level-wise diff loses the whole wrapped subtree.
+        '''
+        correct_dom = DOMTree(CORRECT_HTML)
+        testing_dom = DOMTree(WRAPPED_HTML)
+        for prune in [ True, False ]:
+            result = tree_edit_distance.TreeEditDistance(correct_dom, testing_dom, prune=prune)
+            self.assertEqual(1, result['distance'])
+            self.assertEqual(correct_dom.size, len(result['mapping']))
+            self.assertTrue(all([ c == t for c, t in result['mapping'] ]))
+            self.assertEqual(None, result['fallback_reason'])
+
+        common_dom_tree, missing_nodes = find_tree_diff.CompareDOMTrees(correct_dom, testing_dom)
+        self.assertEqual([ 'div' ], [ n.type for n in missing_nodes ])
+
+
+    def test_rename(self):
+        correct_dom = DOMTree('<html><body><div><p>one</p><b>two</b></div></body></html>')
+        testing_dom = DOMTree('<html><body><div><p>one</p><i>two</i></div></body></html>')
+        result = tree_edit_distance.TreeEditDistance(correct_dom, testing_dom)
+        # The b is renamed into the i. The text nodes are skipped.
+        self.assertEqual(1, result['distance'])
+        self.assertEqual([ ('b', 'i') ], [ (c.type, t.type) for c, t in result['mapping'] if c != t ])
+
+
+    def test_fallback(self):
+        '''
+        Tests that the level-wise diff is used when the budget runs out.
+        '''
+        correct_dom = DOMTree(CORRECT_HTML)
+        testing_dom = DOMTree(WRAPPED_HTML)
+        common_dom_tree, _ = find_tree_diff.CompareDOMTrees(correct_dom, testing_dom)
+        for max_cells, time_budget in [ (0, 10.0), (10 ** 6, -1.0) ]:
+            result = tree_edit_distance.TreeEditDistance(correct_dom, testing_dom, max_cells=max_cells, time_budget=time_budget, prune=False)
+            self.assertEqual(tree_edit_distance.LEVEL_WISE_ENGINE, result['engine'])
+            self.assertNotEqual(None, result['fallback_reason'])
+            self.assertEqual(common_dom_tree.size, len(result['mapping']))
+            self.assertEqual(correct_dom.size + testing_dom.size - 2 * common_dom_tree.size, result['distance'])
+
+
+    def test_backtrack_deadline(self):
+        '''
+        Tests that the deadline is also checked while the mapping is
+        backtracked.
+        '''
+        correct_tree = tree_edit_distance._OrderedTree(DOMTree(CORRECT_HTML), False, set())
+        testing_tree = tree_edit_distance._OrderedTree(DOMTree(WRAPPED_HTML), False, set())
+        # The clock passes the deadline right after the forward pass.
+        forward_checks = len(correct_tree.keyroots) * len(testing_tree.keyroots)
+        clock = { 'calls': 0 }
+        def Time():
+            clock['calls'] += 1
+            return 0.0 if clock['calls'] <= forward_checks else 2.0
+        real_time = tree_edit_distance.time.time
+        tree_edit_distance.time.time = Time
+        try:
+            self.assertRaises(tree_edit_distance.BudgetExceeded, tree_edit_distance.ZhangShasha, correct_tree, testing_tree, 1.0)
+        finally:
+            tree_edit_distance.time.time = real_time
+        self.assertEqual(forward_checks + 1, clock['calls'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+from DOMNode import NODE_CHILDREN
+
+import json
+
+# The pieces of the output are joined and written once this many of them
+# are buffered.
+FLUSH_EVERY = 4096
+
+def WriteTreeJSON(dom_tree, output_file):
+    '''
+    Writes the tree to the output file as json.dumps(dom_tree.Serialize())
+    would, without building the nested map of the whole tree.
+
+    The nodes are written in the depth-first order from an explicit stack,
+    so deep trees do not hit the recursion limit, and only the maps of the
+    nodes on the stack are held at any time.
+    '''
+    if dom_tree.root_node is None:
+        output_file.write('{}')
+        return
+    buffered = []
+    # Each item is either a node to write or a piece of text that closes one.
+    stack = [ dom_tree.root_node ]
+    while len(stack) > 0:
+        item = stack.pop()
+        if isinstance(item, basestring):
+            buffered.append(item)
+        else:
+            prefix, suffix = SplitNodeJSON(item)
+            buffered.append(prefix)
+            stack.append(suffix)
+            children = dom_tree.GetChildren(item.id)
+            for i in xrange(len(children) - 1, -1, -1):
+                stack.append(children[i])
+                if i > 0:
+                    stack.append(', ')
+        if len(buffered) >= FLUSH_EVERY:
+            output_file.write(''.join(buffered))
+            buffered = []
+    output_file.write(''.join(buffered))
+
+
+def SplitNodeJSON(node):
+    '''
+    Returns the JSON of the node without its children, split where the
+    children go.
+    '''
+    parts = []
+    prefix = None
+    for k, v in node.Serialize().iteritems():
+        if k == NODE_CHILDREN:
+            parts.append(json.dumps(k) + ': [')
+            prefix = ', '.join(parts)
+            parts = []
+        else:
+            parts.append(json.dumps(k) + ': ' + json.dumps(v))
+    if len(parts) == 0:
+        return '{' + prefix, ']}'
+    return '{' + prefix, '], ' + ', '.join(parts) + '}'
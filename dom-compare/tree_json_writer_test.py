@@ -0,0 +1,44 @@
+from CompactDOMTree import CompactDOMTree
+from DOMNode import DOMNode
+from DOMTree import DOMTree
+from StringIO import StringIO
+
+import json
+import sys
+import tree_json_writer
+import unittest
+
+class TestTreeJSONWriter(unittest.TestCase):
+
+    def WriteTree(self, dom_tree):
+        output_file = StringIO()
+        tree_json_writer.WriteTreeJSON(dom_tree, output_file)
+        return output_file.getvalue()
+
+
+    def test_same_as_serialize(self):
+        html = u'<html><head><title>t</title></head><body><div id="a" class="b c"><p>1</p><p>\u00e9</p></div><ul><li>x</li></ul></body></html>'
+        dom_tree = DOMTree(html)
+        for tree in [ dom_tree, CompactDOMTree(dom_tree), DOMTree({}) ]:
+            self.assertEqual(json.dumps(tree.Serialize()), self.WriteTree(tree))
+
+
+    def test_deep_tree(self):
+        # Deeper than the recursion limit.
+        dom_tree = DOMTree({})
+        dom_tree.AddNode(-1, DOMNode(0, 'div', '', {}, -1, ''))
+        for i in xrange(1, 5000):
+            dom_tree.AddNode(i - 1, DOMNode(i, 'div', '', { 'class': str(i) }, i - 1, ''))
+        got = self.WriteTree(dom_tree)
+        self.assertEqual(5000, got.count('"nodeName"'))
+        # json.dumps recurses once per level, so it needs a higher limit.
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(30000)
+        try:
+            self.assertEqual(json.dumps(dom_tree.Serialize()), got)
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,82 @@
-def GetDOMTree(dom_tree_filename, for_hdp, raw_html=False):
+def GetDOMTree(dom_tree_filename, for_hdp, raw_html=False, streaming=False, html_parser=None, compact=False, cache=None, stats=None):
     '''
     Parses the dom tree file and returns the DOM tree representation.
+
+    The file is either a DOM.getDocument dump, a DOMSnapshot.captureSnapshot
+    dump or raw HTML. Gzip and zstd compressed files are read transparently. When streaming is
+    set and ijson is installed, the JSON dump is parsed incrementally instead
+    of being loaded into a dictionary first. This lowers the peak memory at
+    the cost of a slower parse. html_parser selects the backend from
+    html_parsers for raw HTML. When compact is set, the tree is returned as
+    a CompactDOMTree. When cache is a tree_cache.TreeCache, the built tree is
+    looked up there first and stored there on a miss. When stats is a
+    diff_stats.DiffStats, the time of each phase is recorded there.
     '''
+    from diff_stats import BUILD_PHASE, LOAD_PHASE, Phase
+    if cache is not None:
+        with Phase(stats, LOAD_PHASE):
+            key = cache.ComputeKey(dom_tree_filename, for_hdp, raw_html, html_parser)
+            dom_tree = cache.Get(key)
+        if dom_tree is None:
+            dom_tree = ReadDOMTree(dom_tree_filename, for_hdp, raw_html, streaming, html_parser, stats)
+            cache.Put(key, dom_tree)
+        elif stats is not None:
+            stats.Count('cache_hits')
+    else:
+        dom_tree = ReadDOMTree(dom_tree_filename, for_hdp, raw_html, streaming, html_parser, stats)
+    if stats is not None:
+        stats.Count('skipped_nodes', dom_tree.skipped_count)
+    if compact:
+        from CompactDOMTree import CompactDOMTree
+        with Phase(stats, BUILD_PHASE):
+            return CompactDOMTree(dom_tree)
+    return dom_tree
+
+
+def ReadDOMTree(dom_tree_filename, for_hdp, raw_html, streaming, html_parser, stats=None):
+    '''
+    Reads the dom tree file into a DOMTree.
+    '''
+    import dom_json_stream
     import json
-    from DOMTree import DOMTree
-    with open(dom_tree_filename, 'r') as input_file:
-        if not raw_html:
-            dom_json = json.loads(input_file.read())
+    from diff_stats import BUILD_PHASE, LOAD_PHASE, PARSE_PHASE, Phase
+    from dom_snapshot import GetSnapshotResult
+    from DOMTree import DOMTree, ShouldSkipNode
+    from html_parsers import DEFAULT_HTML_PARSER, ParseHtml
+    with dom_json_stream.OpenDOMFile(dom_tree_filename) as input_file:
+        if streaming and not raw_html and dom_json_stream.IsStreamingAvailable():
+            # The nodes are built while the JSON is parsed, and the skipped
+            # nodes are counted here as they never reach the DOMTree.
+            skipped_nodes = []
+            def ShouldSkipAndCount(node, for_hdp):
+                if ShouldSkipNode(node, for_hdp):
+                    skipped_nodes.append(node.id)
+                    return True
+                return False
+            try:
+                with Phase(stats, PARSE_PHASE):
+                    root_record = dom_json_stream.ParseDOMJSON(input_file, for_hdp, ShouldSkipAndCount)
+            except dom_json_stream.MissingRootError:
+                # The snapshots have no result.root. They are read as a whole.
+                return ReadDOMTree(dom_tree_filename, for_hdp, raw_html, False, html_parser, stats)
+            with Phase(stats, BUILD_PHASE):
+                dom_tree = DOMTree(root_record if root_record is not None else {}, for_hdp)
+            dom_tree.skipped_count = len(skipped_nodes)
+            return dom_tree
+
+        with Phase(stats, LOAD_PHASE):
+            content = input_file.read()
+        if raw_html:
+            with Phase(stats, PARSE_PHASE):
+                soup = ParseHtml(content, html_parser or DEFAULT_HTML_PARSER)
+            with Phase(stats, BUILD_PHASE):
+                return DOMTree(soup, for_hdp)
+        with Phase(stats, PARSE_PHASE):
+            dom_json = json.loads(content)
+        with Phase(stats, BUILD_PHASE):
+            snapshot = GetSnapshotResult(dom_json)
+            if snapshot is not None:
+                return DOMTree(snapshot, for_hdp)
+            if 'root' not in dom_json.get('result', {}):
+                raise dom_json_stream.MissingRootError('The DOM dump does not have result.root')
             return DOMTree(dom_json['result']['root'], for_hdp)
-        return DOMTree(input_file.read(), for_hdp)
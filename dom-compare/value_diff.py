@@ -0,0 +1,160 @@
+from NodeIndex import ATTRIBUTES_MODE, NodeIndex
+
+import heapq
+
+# The number of characters in each n-gram of a value.
+DEFAULT_NGRAM_SIZE = 3
+
+# The buckets up to this size are compared pairwise. The larger ones find
+# their candidates through the n-gram index.
+PAIRWISE_BUCKET_SIZE = 16
+
+# The number of candidates with the best estimates that are scored.
+MAX_CANDIDATES = 8
+
+# The n-grams that are in more values than this are too common to tell the
+# candidates apart and are not looked up.
+MAX_POSTINGS = 256
+
+# The number of bins of the drift histogram.
+DRIFT_BINS = 10
+
+class ValueIndex(object):
+    '''
+    The nodes of a tree bucketed by their type and attributes, as in the
+    attributes mode of NodeIndex, with an inverted index from the character
+    n-grams of the values to the nodes in each large bucket.
+    '''
+    def __init__(self, nodes, ngram_size=DEFAULT_NGRAM_SIZE):
+        self.ngram_size = ngram_size
+        self.key_index = NodeIndex([], ATTRIBUTES_MODE)
+
+        # Maps the key to the (node, n-grams) pairs of the bucket.
+        self.buckets = {}
+        for node in nodes:
+            self.buckets.setdefault(self.key_index.GetKey(node), []).append((node, GetNGrams(node.value, ngram_size)))
+
+        # Maps the key of each large bucket to the n-gram to the positions of
+        # the nodes in the bucket. They are built when first used.
+        self.postings = {}
+
+
+    def FindBestMatch(self, node):
+        '''
+        Returns the node with the same type and attributes whose value is the
+        most similar to the value of the node, and the Jaccard similarity of
+        their n-grams. Returns (None, None) when there is no such node.
+        '''
+        key = self.key_index.GetKey(node)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return None, None
+        ngrams = GetNGrams(node.value, self.ngram_size)
+        if len(bucket) <= PAIRWISE_BUCKET_SIZE:
+            candidates = bucket
+        else:
+            candidates = [ bucket[i] for i in self.FindCandidates(key, bucket, ngrams) ]
+
+        best_match = None
+        best_similarity = -1.0
+        for other, other_ngrams in candidates:
+            similarity = Jaccard(ngrams, other_ngrams)
+            if similarity > best_similarity:
+                best_match = other
+                best_similarity = similarity
+        return best_match, best_similarity
+
+
+    def FindCandidates(self, key, bucket, ngrams):
+        '''
+        Returns the positions of the nodes of the bucket whose n-grams are
+        the most similar to the given ones. The first nodes of the bucket
+        are the candidates when no node shares an n-gram.
+        '''
+        postings = self.postings.get(key)
+        if postings is None:
+            postings = {}
+            for i, (_, other_ngrams) in enumerate(bucket):
+                for ngram in other_ngrams:
+                    postings.setdefault(ngram, []).append(i)
+            self.postings[key] = postings
+
+        shared_counts = {}
+        for ngram in ngrams:
+            positions = postings.get(ngram)
+            if positions is None or len(positions) > MAX_POSTINGS:
+                continue
+            for i in positions:
+                shared_counts[i] = shared_counts.get(i, 0) + 1
+        if len(shared_counts) == 0:
+            return range(min(MAX_CANDIDATES, len(bucket)))
+        # The shared n-grams give the Jaccard similarity of each node, short
+        # of the common n-grams that were not looked up.
+        def EstimateSimilarity(i):
+            shared = shared_counts[i]
+            return shared / float(len(ngrams) + len(bucket[i][1]) - shared)
+        return heapq.nlargest(MAX_CANDIDATES, shared_counts, key=EstimateSimilarity)
+
+
+def GetNGrams(value, ngram_size=DEFAULT_NGRAM_SIZE):
+    '''
+    Returns the set of the character n-grams of the value, ignoring the case
+    and the runs of whitespace. A value shorter than ngram_size is its own
+    n-gram.
+    '''
+    text = ' '.join(value.lower().split())
+    if len(text) <= ngram_size:
+        return frozenset([ text ]) if text != '' else frozenset()
+    return frozenset([ text[i:i + ngram_size] for i in xrange(len(text) - ngram_size + 1) ])
+
+
+def Jaccard(set_a, set_b):
+    if len(set_a) == 0 and len(set_b) == 0:
+        return 1.0
+    intersection = len(set_a & set_b)
+    return intersection / float(len(set_a) + len(set_b) - intersection)
+
+
+def FindValueDiffs(dom_a, dom_b, ngram_size=DEFAULT_NGRAM_SIZE):
+    '''
+    Finds the nodes of dom_a that are not in dom_b but have a node with the
+    same type and attributes there, that is the nodes whose value changed.
+
+    Returns a list of maps with the keys node, match and similarity: the
+    node of dom_a, its most similar counterpart in dom_b and the similarity
+    of their values.
+    '''
+    if dom_a.root_node is None or dom_b.root_node is None:
+        return []
+    index = ValueIndex(dom_b.IterSubtree(dom_b.root_node), ngram_size)
+    dom_b_nodes = dom_b.GetNodeIndex()
+    value_diffs = []
+    for node in dom_a.IterSubtree(dom_a.root_node):
+        if dom_b_nodes.Contains(node):
+            continue
+        match, similarity = index.FindBestMatch(node)
+        if match is not None:
+            value_diffs.append({ 'node': node, 'match': match, 'similarity': similarity })
+    return value_diffs
+
+
+def GetDriftDistribution(value_diffs, bins=DRIFT_BINS):
+    '''
+    Returns the distribution of the text drift of the value diffs, where the
+    drift of a node is 1 minus the similarity to its match. The map has the
+    count, the mean, the median and the 90th percentile of the drifts and
+    the histogram of the drifts in bins of equal width over [0, 1].
+    '''
+    drifts = sorted([ 1.0 - d['similarity'] for d in value_diffs ])
+    histogram = [ 0 ] * bins
+    for drift in drifts:
+        histogram[min(int(drift * bins), bins - 1)] += 1
+    if len(drifts) == 0:
+        return { 'count': 0, 'mean': None, 'median': None, 'p90': None, 'histogram': histogram }
+    return {
+        'count': len(drifts),
+        'mean': sum(drifts) / len(drifts),
+        'median': drifts[len(drifts) // 2],
+        'p90': drifts[min(int(len(drifts) * 0.9), len(drifts) - 1)],
+        'histogram': histogram,
+    }
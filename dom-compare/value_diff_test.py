@@ -0,0 +1,53 @@
+from DOMNode import DOMNode
+from DOMTree import DOMTree
+
+import value_diff
+import unittest
+
+class TestValueDiff(unittest.TestCase):
+
+    def test_ngrams(self):
+        self.assertEqual(frozenset([ 'abc', 'bcd' ]), value_diff.GetNGrams('ABcd'))
+        self.assertEqual(value_diff.GetNGrams('a  b c'), value_diff.GetNGrams('a b\nc'))
+        self.assertEqual(frozenset([ 'ab' ]), value_diff.GetNGrams('ab'))
+        self.assertEqual(frozenset(), value_diff.GetNGrams(''))
+        self.assertEqual(1.0, value_diff.Jaccard(frozenset(), frozenset()))
+        self.assertEqual(0.5, value_diff.Jaccard(frozenset([ 'a', 'b' ]), frozenset([ 'b', 'c', 'a', 'd' ])))
+
+
+    def test_large_bucket(self):
+        '''
+        Tests that the n-gram index finds the same best match as comparing
+        the node with every node of a large bucket.
+        '''
+        words = [ 'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'theta', 'kappa' ]
+        nodes = [ DOMNode(i, 'p', ' '.join(words[i % 8:] + words[:i % 5]) + str(i), { 'class': 'x' }, -1, '') for i in range(50) ]
+        index = value_diff.ValueIndex(nodes)
+        for i, value in enumerate([ 'gamma delta epsilon zeta theta kappa alpha beta 2', 'kappa 7', 'nothing in common' ]):
+            node = DOMNode(100 + i, 'p', value, { 'class': 'x' }, -1, '')
+            match, similarity = index.FindBestMatch(node)
+            ngrams = value_diff.GetNGrams(value)
+            best_similarity = max([ value_diff.Jaccard(ngrams, value_diff.GetNGrams(n.value)) for n in nodes ])
+            self.assertEqual(best_similarity, similarity)
+            self.assertEqual(similarity, value_diff.Jaccard(ngrams, value_diff.GetNGrams(match.value)))
+        self.assertEqual((None, None), index.FindBestMatch(DOMNode(200, 'p', 'kappa', { 'class': 'y' }, -1, '')))
+
+
+    def test_find_value_diffs(self):
+        dom_a = DOMTree('<html><body><p class="a">the quick brown fox</p><p class="b">jumps</p><span>over</span><div id="x">dog</div></body></html>')
+        dom_b = DOMTree('<html><body><p class="a">the quick brown cat</p><p class="b">jumps</p><p class="a">lazy</p><span>under</span><div id="y">dog</div></body></html>')
+        value_diffs = value_diff.FindValueDiffs(dom_a, dom_b)
+        self.assertEqual([ ('p', 'the quick brown cat'), ('span', 'under') ], [ (d['node'].type, d['match'].value) for d in value_diffs ])
+        self.assertTrue(0.5 < value_diffs[0]['similarity'] < 1.0)
+        self.assertEqual(0.0, value_diffs[1]['similarity'])
+
+        distribution = value_diff.GetDriftDistribution(value_diffs)
+        self.assertEqual(2, distribution['count'])
+        self.assertEqual(1, distribution['histogram'][-1])
+        self.assertEqual(2, sum(distribution['histogram']))
+        self.assertEqual(1.0, distribution['p90'])
+        self.assertEqual(0, value_diff.GetDriftDistribution([])['count'])
+
+
+if __name__ == '__main__':
+    unittest.main()